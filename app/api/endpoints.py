@@ -1,107 +1,194 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlmodel import Session
-from typing import List
-from services.recomendador import rankeia_por_score
+from typing import List, Literal, Optional
 from connection import get_session
-from services.recomendador import recall_por_restricao
-from services.recomendador import rankeia_restaurante
-from services.recomendador import rankeia_restaurante_composto
+from services.recomendador import recall_por_restricao_lote, rankeia_por_score_lote_com_totais
 from services.ml.knn_service import get_restaurant_recommendations, get_meal_recommendations
+from services.ml.knn_service import get_restaurant_recommendations_batch, get_meal_recommendations_batch
+from services.ml.mf_service import (
+    get_restaurant_recommendations_mf,
+    get_meal_recommendations_mf,
+    get_restaurant_recommendations_mf_batch,
+    get_meal_recommendations_mf_batch
+)
+from services.indice_restricoes import indice_restricoes
+from services.cache_resultados import cache_resultados
+from services.agendador import agendador
+from api.respostas import (
+    RECALL, RANKEIA_SCORE, RANKEIA_RESTAURANTE, RANKEIA_COMPOSTO,
+    ERRO_RECALL, ERRO_RANKEIA_SCORE, ERRO_RANKEIA_RESTAURANTE, ERRO_RANKEIA_COMPOSTO,
+    ERRO_KNN_RESTAURANTES, ERRO_KNN_REFEICOES, ERRO_RECALL_LOTE, ERRO_RANKEIA_SCORE_LOTE,
+    ERRO_KNN_RESTAURANTES_LOTE, ERRO_KNN_REFEICOES_LOTE, ERRO_MF_RESTAURANTES, ERRO_MF_REFEICOES,
+    ERRO_MF_RESTAURANTES_LOTE, ERRO_MF_REFEICOES_LOTE,
+    erro_interno,
+    resposta_recall,
+    resposta_rankeia_score,
+    resposta_rankeia_restaurante,
+    resposta_rankeia_composto,
+    resposta_recomendacoes,
+    resposta_recall_lote,
+    resposta_rankeia_score_lote,
+    resposta_recomendacoes_lote
+)
 from schemas import (
     UserRequestDTO,
     RecallResponseDTO,
     RankeiaScoreResponseDTO,
     RankeiaRestauranteResponseDTO,
     RankeiaCompostoResponseDTO,
-    KNNRecommendationResponseDTO
+    KNNRecommendationResponseDTO,
+    BatchUserRequestDTO,
+    RecallBatchResponseDTO,
+    RankeiaScoreBatchResponseDTO,
+    KNNRecommendationBatchResponseDTO
 )
 
 # Definindo o Router
 router = APIRouter()
 
+# Token das rotas administrativas (invalidar índice/cache, disparar o agendador), enviado no
+# cabeçalho X-Admin-Token; vazio desliga essas rotas (403)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def exige_token_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Dependência das rotas administrativas: descartam snapshots e forçam reconstruções,
+    então não podem ficar abertas para qualquer cliente.
+    """
+    if not ADMIN_TOKEN or x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token administrativo ausente ou inválido (ADMIN_TOKEN).")
+
+# Modo de execução do recall/ranking:
+# - "memoria": índice de restrições em memória + consultas auxiliares
+# - "sql": uma única instrução SQL com CTEs e NOT EXISTS
+ModoExecucao = Literal["memoria", "sql"]
+MODO_QUERY = Query("memoria", description="Modo de execução: 'memoria' (índice em memória) ou 'sql' (uma única consulta no banco).")
+
+# Paginação dos rankings (aplicada dentro dos serviços, com seleção parcial em vez de ordenar tudo)
+LIMIT_QUERY = Query(None, ge=1, description="Quantidade máxima de itens retornados (padrão: todos).")
+OFFSET_QUERY = Query(0, ge=0, description="Quantidade de itens do topo do ranking a pular.")
+MAX_REFEICOES_QUERY = Query(None, ge=0, description="Máximo de refeições compatíveis listadas por restaurante (padrão: todas).")
+
+# Abordagem do KNN: "usuario" (vizinhos do usuário) ou "item" (itens similares aos que o usuário avaliou)
+AbordagemKNN = Literal["usuario", "item"]
+ABORDAGEM_QUERY = Query("usuario", description="Filtragem colaborativa baseada em 'usuario' (vizinhos do usuário) ou em 'item' (similaridade item x item pré-calculada; custo proporcional às avaliações do usuário).")
+
+# Filtros das recomendações KNN e por fatoração de matrizes
+MIN_SCORE_KNN_RESTAURANTE_QUERY = Query(3.0, description="Nota mínima média exigida dos vizinhos para classificar um restaurante como recomendado.")
+MIN_SCORE_KNN_REFEICAO_QUERY = Query(3.0, description="Nota mínima média exigida dos vizinhos para classificar uma refeição como recomendada.")
+PONDERADO_QUERY = Query(False, description="Se verdadeiro, a média das notas dos vizinhos é ponderada pela similaridade de cada um.")
+MIN_SCORE_MF_RESTAURANTE_QUERY = Query(3.0, description="Nota prevista mínima para classificar um restaurante como recomendado.")
+MIN_SCORE_MF_REFEICAO_QUERY = Query(3.0, description="Nota prevista mínima para classificar uma refeição como recomendada.")
+
 # --- Endpoints ---
 
 @router.post("/recall/filtra_restricoes", response_model=RecallResponseDTO)
 def filtra_restricoes(
     request: UserRequestDTO, 
+    modo: ModoExecucao = MODO_QUERY,
     session: Session = Depends(get_session)
 ):
     """
     Endpoint que realiza o Passo 1 (Recall):
     Recebe um usuário e retorna apenas IDs de refeições seguras para suas restrições.
     """
-    try:
-        # Chama a lógica que criamos no services/recommendation.py
-        candidatos = recall_por_restricao(session, request.id_usuario)
-        return {"id_refeicoes_candidatas": candidatos}
-    except Exception as e:
-        # Em produção, logar o erro real 'e'
-        print(f"Erro no recall: {e}")
-        raise HTTPException(status_code=500, detail="Erro interno ao processar filtragem.")
-    
+    with erro_interno(*ERRO_RECALL):
+        return resposta_recall(RECALL[modo](session, request.id_usuario))
+
+@router.post("/recall/invalidar_indice")
+def invalidar_indice_restricoes(_: None = Depends(exige_token_admin)):
+    """
+    Descarta o índice de restrições em memória; o próximo recall o reconstrói.
+    Deve ser chamado após alterações em ingredientes, restrições ou cardápio.
+    """
+    indice_restricoes.invalidar()
+    return {"status": "ok"}
+
+@router.post("/cache/invalidar")
+def invalidar_cache_resultados(
+    recarregar_dados: bool = Query(False, description="Se verdadeiro, também descarta os snapshots em memória (índice, catálogo e estatísticas)."),
+    _: None = Depends(exige_token_admin)
+):
+    """
+    Descarta os resultados em cache de rankeia_* e KNN.
+    Deve ser chamado após escritas de avaliações ou alterações feitas pela administração.
+    """
+    cache_resultados.invalidar(recarregar_dados=recarregar_dados)
+    return {"status": "ok"}
+
+@router.post("/agendador/disparar")
+def disparar_agendador(
+    forcar: bool = Query(False, description="Se verdadeiro, reconstrói todos os modelos e snapshots mesmo sem mudança de versão."),
+    _: None = Depends(exige_token_admin)
+):
+    """
+    Antecipa o próximo ciclo do agendador de reconstrução (ex.: após uma carga de avaliações).
+    Retorna imediatamente; a reconstrução roda em segundo plano.
+    """
+    agendador.disparar(forcar=forcar)
+    return {"status": "ok"}
+
 @router.post("/precision/rankeia_score", response_model=RankeiaScoreResponseDTO)
 def rankeia_por_score_endpoint(
     request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
     session: Session = Depends(get_session)
 ):
     """
     Recebe id_usuario, executa recall e ordena por score (média do restaurante + volume).
     """
-    try:
-        resultados = rankeia_por_score(session, request.id_usuario)
-        return {
-            "id_usuario": request.id_usuario,
-            "total_resultados": len(resultados),
-            "refeicoes_rankeadas": resultados
-        }
-    except Exception as e:
-        print("Erro no endpoint rankeia_por_score:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao calcular ranking.")
+    with erro_interno(*ERRO_RANKEIA_SCORE):
+        resultados, total = RANKEIA_SCORE[modo](session, request.id_usuario, limit=limit, offset=offset)
+        return resposta_rankeia_score(request.id_usuario, resultados, total)
 
 @router.post("/precision/rankeia_por_compatibilidade_restaurante", response_model=RankeiaRestauranteResponseDTO)
 def endpoint_rankeia_restaurante(
     request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
     session: Session = Depends(get_session)
 ):
     """
     Endpoint mínimo: chama rankeia_restaurante(session, id_usuario)
     e devolve o ranking de restaurantes compatíveis.
     """
-    try:
-        resultado = rankeia_restaurante(session, request.id_usuario)
-        return {
-            "id_usuario": request.id_usuario,
-            "rank_restaurantes": resultado
-        }
-    except Exception as e:
-        print("Erro no endpoint rankeia_por_compatibilidade_restaurante:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao calcular compatibilidade por restaurante.")  
+    with erro_interno(*ERRO_RANKEIA_RESTAURANTE):
+        resultado = RANKEIA_RESTAURANTE[modo](session, request.id_usuario, limit=limit, offset=offset)
+        return resposta_rankeia_restaurante(request.id_usuario, resultado)
     
 @router.post("/precision/rankeia_restaurante_composto", response_model=RankeiaCompostoResponseDTO)
 def endpoint_rankeia_restaurante_composto(
     request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    max_refeicoes: Optional[int] = MAX_REFEICOES_QUERY,
     session: Session = Depends(get_session)
 ):
-    try:
-        resultado = rankeia_restaurante_composto(
+    with erro_interno(*ERRO_RANKEIA_COMPOSTO):
+        resultado, total = RANKEIA_COMPOSTO[modo](
             session=session,
-            id_usuario=request.id_usuario
+            id_usuario=request.id_usuario,
+            limit=limit,
+            offset=offset,
+            max_refeicoes=max_refeicoes
         )
-        return {
-            "id_usuario": request.id_usuario,
-            "total_restaurantes": len(resultado),
-            "restaurantes_ranked": resultado
-        }
-    except Exception as e:
-        print("Erro no rankeia_restaurante_composto:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao calcular ranking composto.")
+        return resposta_rankeia_composto(request.id_usuario, resultado, total)
 
 # ------------------------------------ KNN abaixo ------------------------------------
 
 @router.get("/usuarios/recomendacoes-knn/restaurantes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
 def recomendar_restaurantes_knn(
     id_usuario: int,
-    min_score: float = Query(3.0, description="Nota mínima média exigida dos vizinhos para classificar um restaurante como recomendado."),
+    min_score: float = MIN_SCORE_KNN_RESTAURANTE_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
     session: Session = Depends(get_session)
 ):
     """
@@ -110,27 +197,18 @@ def recomendar_restaurantes_knn(
     Parâmetros:
     - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
     - **min_score** (Query Parameter): Filtro tolerante de nota (padrão 3.0). Média >= min_score será recomendada.
+    - **ponderado** (Query Parameter): Usa a média ponderada pela similaridade dos vizinhos (padrão False).
     """
-    try:
-        resultado = get_restaurant_recommendations(session, user_id=id_usuario, min_score=min_score)
-        
-        # Cold start fallback (o serviço retorna um dict com a mensagem)
-        if isinstance(resultado, dict) and "message" in resultado:
-            return {"id_usuario": id_usuario, "message": resultado["message"], "recomendacoes": []}
-            
-        return {
-            "id_usuario": id_usuario, 
-            "recomendacoes": resultado,
-            "message": "Recomendações geradas com sucesso."
-        }
-    except Exception as e:
-        print("Erro no recomendar_restaurantes_knn:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao treinar e recomendar via KNN.")
+    with erro_interno(*ERRO_KNN_RESTAURANTES):
+        resultado = get_restaurant_recommendations(session, user_id=id_usuario, min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes(id_usuario, resultado)
 
 @router.get("/usuarios/recomendacoes-knn/refeicoes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
 def recomendar_refeicoes_knn(
     id_usuario: int,
-    min_score: float = Query(3.0, description="Nota mínima média exigida dos vizinhos para classificar uma refeição como recomendada."),
+    min_score: float = MIN_SCORE_KNN_REFEICAO_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
     session: Session = Depends(get_session)
 ):
     """
@@ -140,22 +218,11 @@ def recomendar_refeicoes_knn(
     Parâmetros:
     - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
     - **min_score** (Query Parameter): Filtro tolerante de nota (padrão 3.0). Média >= min_score será recomendada.
+    - **ponderado** (Query Parameter): Usa a média ponderada pela similaridade dos vizinhos (padrão False).
     """
-    try:
-        resultado = get_meal_recommendations(session, user_id=id_usuario, min_score=min_score)
-        
-        # Cold start fallback (o serviço retorna um dict com a mensagem)
-        if isinstance(resultado, dict) and "message" in resultado:
-            return {"id_usuario": id_usuario, "message": resultado["message"], "recomendacoes": []}
-            
-        return {
-            "id_usuario": id_usuario, 
-            "recomendacoes": resultado,
-            "message": "Recomendações geradas com sucesso."
-        }
-    except Exception as e:
-        print("Erro no recomendar_refeicoes_knn:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao treinar e recomendar via KNN.")
+    with erro_interno(*ERRO_KNN_REFEICOES):
+        resultado = get_meal_recommendations(session, user_id=id_usuario, min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes(id_usuario, resultado)
 
 
 @router.get("/usuarios/recomendacoes-knn/restaurantes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
@@ -169,21 +236,9 @@ def recomendar_restaurantes_knn(
     A documentação:
     - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
     """
-    try:
+    with erro_interno(*ERRO_KNN_RESTAURANTES):
         resultado = get_restaurant_recommendations(session, user_id=id_usuario)
-        
-        # Cold start fallback (o serviço retorna um dict com a mensagem)
-        if isinstance(resultado, dict) and "message" in resultado:
-            return {"id_usuario": id_usuario, "message": resultado["message"], "recomendacoes": []}
-            
-        return {
-            "id_usuario": id_usuario, 
-            "recomendacoes": resultado,
-            "message": "Recomendações geradas com sucesso."
-        }
-    except Exception as e:
-        print("Erro no recomendar_restaurantes_knn:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao treinar e recomendar via KNN.")
+        return resposta_recomendacoes(id_usuario, resultado)
 
 @router.get("/usuarios/recomendacoes-knn/refeicoes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
 def recomendar_refeicoes_knn(
@@ -197,18 +252,134 @@ def recomendar_refeicoes_knn(
     A documentação:
     - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
     """
-    try:
+    with erro_interno(*ERRO_KNN_REFEICOES):
         resultado = get_meal_recommendations(session, user_id=id_usuario)
-        
-        # Cold start fallback (o serviço retorna um dict com a mensagem)
-        if isinstance(resultado, dict) and "message" in resultado:
-            return {"id_usuario": id_usuario, "message": resultado["message"], "recomendacoes": []}
-            
-        return {
-            "id_usuario": id_usuario, 
-            "recomendacoes": resultado,
-            "message": "Recomendações geradas com sucesso."
-        }
-    except Exception as e:
-        print("Erro no recomendar_refeicoes_knn:", e)
-        raise HTTPException(status_code=500, detail="Erro interno ao treinar e recomendar via KNN.")
+        return resposta_recomendacoes(id_usuario, resultado)
+
+# ------------------------------------ Lote (:batch) abaixo ------------------------------------
+
+@router.post("/recall/filtra_restricoes:batch", response_model=RecallBatchResponseDTO)
+def filtra_restricoes_batch(
+    request: BatchUserRequestDTO,
+    session: Session = Depends(get_session)
+):
+    """
+    Recall para vários usuários em uma única chamada (índice de restrições carregado uma vez).
+    """
+    with erro_interno(*ERRO_RECALL_LOTE):
+        return resposta_recall_lote(recall_por_restricao_lote(session, request.ids_usuarios))
+
+@router.post("/precision/rankeia_score:batch", response_model=RankeiaScoreBatchResponseDTO)
+def rankeia_por_score_batch(
+    request: BatchUserRequestDTO,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    rankeia_score para vários usuários: o ranking global é calculado uma vez e filtrado por usuário.
+    """
+    with erro_interno(*ERRO_RANKEIA_SCORE_LOTE):
+        resultados, totais = rankeia_por_score_lote_com_totais(session, request.ids_usuarios, limit=limit, offset=offset)
+        return resposta_rankeia_score_lote(resultados, totais)
+
+@router.post("/usuarios/recomendacoes-knn/restaurantes:batch", response_model=KNNRecommendationBatchResponseDTO)
+def recomendar_restaurantes_knn_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_KNN_RESTAURANTE_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Recomendações KNN de restaurantes para vários usuários em um único cálculo vetorizado.
+    """
+    with erro_interno(*ERRO_KNN_RESTAURANTES_LOTE):
+        resultados = get_restaurant_recommendations_batch(session, request.ids_usuarios, min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes_lote(resultados)
+
+@router.post("/usuarios/recomendacoes-knn/refeicoes:batch", response_model=KNNRecommendationBatchResponseDTO)
+def recomendar_refeicoes_knn_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_KNN_REFEICAO_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Recomendações KNN de refeições para vários usuários em um único cálculo vetorizado,
+    já sem as refeições proibidas pelas restrições de cada um.
+    """
+    with erro_interno(*ERRO_KNN_REFEICOES_LOTE):
+        resultados = get_meal_recommendations_batch(session, request.ids_usuarios, min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes_lote(resultados)
+
+# ------------------------------------ Fatoração de matrizes abaixo ------------------------------------
+
+@router.get("/usuarios/recomendacoes-mf/restaurantes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+def recomendar_restaurantes_mf(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_MF_RESTAURANTE_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Restaurantes recomendados por fatoração de matrizes (ALS): nota prevista pelos embeddings
+    pré-calculados, só entre os restaurantes com refeições compatíveis com as restrições do usuário.
+    
+    Parâmetros:
+    - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
+    - **min_score** (Query Parameter): Nota prevista mínima (padrão 3.0).
+    - **limit** (Query Parameter): Quantidade máxima de restaurantes (top-k).
+    """
+    with erro_interno(*ERRO_MF_RESTAURANTES):
+        resultado = get_restaurant_recommendations_mf(session, user_id=id_usuario, min_score=min_score, limit=limit)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+@router.get("/usuarios/recomendacoes-mf/refeicoes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+def recomendar_refeicoes_mf(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_MF_REFEICAO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Refeições recomendadas por fatoração de matrizes (ALS), pontuando apenas as candidatas do
+    recall (disponíveis e sem ingredientes proibidos para o usuário).
+    
+    Parâmetros:
+    - **id_usuario** (Path Parameter): ID numérico do usuário alvo da recomendação.
+    - **min_score** (Query Parameter): Nota prevista mínima (padrão 3.0).
+    - **limit** (Query Parameter): Quantidade máxima de refeições (top-k).
+    """
+    with erro_interno(*ERRO_MF_REFEICOES):
+        resultado = get_meal_recommendations_mf(session, user_id=id_usuario, min_score=min_score, limit=limit)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+@router.post("/usuarios/recomendacoes-mf/restaurantes:batch", response_model=KNNRecommendationBatchResponseDTO)
+def recomendar_restaurantes_mf_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_MF_RESTAURANTE_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Recomendações por fatoração de matrizes de restaurantes para vários usuários.
+    """
+    with erro_interno(*ERRO_MF_RESTAURANTES_LOTE):
+        resultados = get_restaurant_recommendations_mf_batch(session, request.ids_usuarios, min_score=min_score, limit=limit)
+        return resposta_recomendacoes_lote(resultados)
+
+@router.post("/usuarios/recomendacoes-mf/refeicoes:batch", response_model=KNNRecommendationBatchResponseDTO)
+def recomendar_refeicoes_mf_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_MF_REFEICAO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: Session = Depends(get_session)
+):
+    """
+    Recomendações por fatoração de matrizes de refeições para vários usuários.
+    """
+    with erro_interno(*ERRO_MF_REFEICOES_LOTE):
+        resultados = get_meal_recommendations_mf_batch(session, request.ids_usuarios, min_score=min_score, limit=limit)
+        return resposta_recomendacoes_lote(resultados)
@@ -0,0 +1,252 @@
+from fastapi import APIRouter, Depends
+from typing import Optional
+from sqlmodel.ext.asyncio.session import AsyncSession
+from connection import get_async_session
+import api.endpoints as sincrono
+from api.endpoints import (
+    ModoExecucao, MODO_QUERY, AbordagemKNN, ABORDAGEM_QUERY, LIMIT_QUERY, OFFSET_QUERY, MAX_REFEICOES_QUERY,
+    MIN_SCORE_KNN_RESTAURANTE_QUERY, MIN_SCORE_KNN_REFEICAO_QUERY, PONDERADO_QUERY,
+    MIN_SCORE_MF_RESTAURANTE_QUERY, MIN_SCORE_MF_REFEICAO_QUERY,
+    invalidar_indice_restricoes, invalidar_cache_resultados, disparar_agendador
+)
+from api.respostas import (
+    RECALL, RANKEIA_SCORE, RANKEIA_RESTAURANTE, RANKEIA_COMPOSTO,
+    ERRO_RECALL, ERRO_RANKEIA_SCORE, ERRO_RANKEIA_RESTAURANTE, ERRO_RANKEIA_COMPOSTO,
+    ERRO_KNN_RESTAURANTES, ERRO_KNN_REFEICOES, ERRO_RECALL_LOTE, ERRO_RANKEIA_SCORE_LOTE,
+    ERRO_KNN_RESTAURANTES_LOTE, ERRO_KNN_REFEICOES_LOTE, ERRO_MF_RESTAURANTES, ERRO_MF_REFEICOES,
+    ERRO_MF_RESTAURANTES_LOTE, ERRO_MF_REFEICOES_LOTE,
+    erro_interno,
+    doc_de,
+    resposta_recall,
+    resposta_rankeia_score,
+    resposta_rankeia_restaurante,
+    resposta_rankeia_composto,
+    resposta_recomendacoes,
+    resposta_recall_lote,
+    resposta_rankeia_score_lote,
+    resposta_recomendacoes_lote
+)
+from services.recomendador_async import executa
+from services.recomendador import recall_por_restricao_lote, rankeia_por_score_lote_com_totais
+from services.ml.knn_service import get_restaurant_recommendations, get_meal_recommendations
+from services.ml.knn_service import get_restaurant_recommendations_batch, get_meal_recommendations_batch
+from services.ml.mf_service import (
+    get_restaurant_recommendations_mf,
+    get_meal_recommendations_mf,
+    get_restaurant_recommendations_mf_batch,
+    get_meal_recommendations_mf_batch
+)
+from schemas import (
+    UserRequestDTO,
+    RecallResponseDTO,
+    RankeiaScoreResponseDTO,
+    RankeiaRestauranteResponseDTO,
+    RankeiaCompostoResponseDTO,
+    KNNRecommendationResponseDTO,
+    BatchUserRequestDTO,
+    RecallBatchResponseDTO,
+    RankeiaScoreBatchResponseDTO,
+    KNNRecommendationBatchResponseDTO
+)
+
+# Mesmas rotas de api/endpoints.py, em 'async def' sobre a sessão assíncrona. Aqui fica só o await:
+# os serviços rodam via executa() e as respostas, os erros e as docstrings vêm de api/respostas.py
+# e do router síncrono. Incluído no lugar do router síncrono quando DB_ASYNC=true (ver main.py).
+router = APIRouter()
+
+router.add_api_route("/recall/invalidar_indice", invalidar_indice_restricoes, methods=["POST"])
+router.add_api_route("/cache/invalidar", invalidar_cache_resultados, methods=["POST"])
+router.add_api_route("/agendador/disparar", disparar_agendador, methods=["POST"])
+
+# --- Endpoints ---
+
+@router.post("/recall/filtra_restricoes", response_model=RecallResponseDTO)
+@doc_de(sincrono.filtra_restricoes)
+async def filtra_restricoes(
+    request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RECALL):
+        return resposta_recall(await executa(session, RECALL[modo], request.id_usuario, modo=modo))
+
+@router.post("/precision/rankeia_score", response_model=RankeiaScoreResponseDTO)
+@doc_de(sincrono.rankeia_por_score_endpoint)
+async def rankeia_por_score_endpoint(
+    request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RANKEIA_SCORE):
+        resultados, total = await executa(session, RANKEIA_SCORE[modo], request.id_usuario, modo=modo,
+                                          limit=limit, offset=offset)
+        return resposta_rankeia_score(request.id_usuario, resultados, total)
+
+@router.post("/precision/rankeia_por_compatibilidade_restaurante", response_model=RankeiaRestauranteResponseDTO)
+@doc_de(sincrono.endpoint_rankeia_restaurante)
+async def endpoint_rankeia_restaurante(
+    request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RANKEIA_RESTAURANTE):
+        resultado = await executa(session, RANKEIA_RESTAURANTE[modo], request.id_usuario, modo=modo,
+                                  limit=limit, offset=offset)
+        return resposta_rankeia_restaurante(request.id_usuario, resultado)
+
+@router.post("/precision/rankeia_restaurante_composto", response_model=RankeiaCompostoResponseDTO)
+async def endpoint_rankeia_restaurante_composto(
+    request: UserRequestDTO,
+    modo: ModoExecucao = MODO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    max_refeicoes: Optional[int] = MAX_REFEICOES_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RANKEIA_COMPOSTO):
+        resultado, total = await executa(session, RANKEIA_COMPOSTO[modo], request.id_usuario, modo=modo,
+                                         limit=limit, offset=offset, max_refeicoes=max_refeicoes)
+        return resposta_rankeia_composto(request.id_usuario, resultado, total)
+
+# ------------------------------------ KNN abaixo ------------------------------------
+
+@router.get("/usuarios/recomendacoes-knn/restaurantes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+async def recomendar_restaurantes_knn(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_KNN_RESTAURANTE_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Endpoint que retorna uma lista de IDs de restaurantes recomendados baseados no perfil do usuário (KNN).
+    """
+    with erro_interno(*ERRO_KNN_RESTAURANTES):
+        resultado = await executa(session, get_restaurant_recommendations, id_usuario,
+                                  min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+@router.get("/usuarios/recomendacoes-knn/refeicoes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+async def recomendar_refeicoes_knn(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_KNN_REFEICAO_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Endpoint que retorna uma lista de IDs de refeições recomendadas baseadas no perfil do usuário (KNN).
+    Filtra automaticamente as intolerâncias do usuário ativo.
+    """
+    with erro_interno(*ERRO_KNN_REFEICOES):
+        resultado = await executa(session, get_meal_recommendations, id_usuario,
+                                  min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+# ------------------------------------ Lote (:batch) abaixo ------------------------------------
+
+@router.post("/recall/filtra_restricoes:batch", response_model=RecallBatchResponseDTO)
+@doc_de(sincrono.filtra_restricoes_batch)
+async def filtra_restricoes_batch(
+    request: BatchUserRequestDTO,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RECALL_LOTE):
+        return resposta_recall_lote(await executa(session, recall_por_restricao_lote, request.ids_usuarios))
+
+@router.post("/precision/rankeia_score:batch", response_model=RankeiaScoreBatchResponseDTO)
+@doc_de(sincrono.rankeia_por_score_batch)
+async def rankeia_por_score_batch(
+    request: BatchUserRequestDTO,
+    limit: Optional[int] = LIMIT_QUERY,
+    offset: int = OFFSET_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_RANKEIA_SCORE_LOTE):
+        resultados, totais = await executa(session, rankeia_por_score_lote_com_totais, request.ids_usuarios,
+                                           limit=limit, offset=offset)
+        return resposta_rankeia_score_lote(resultados, totais)
+
+@router.post("/usuarios/recomendacoes-knn/restaurantes:batch", response_model=KNNRecommendationBatchResponseDTO)
+@doc_de(sincrono.recomendar_restaurantes_knn_batch)
+async def recomendar_restaurantes_knn_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_KNN_RESTAURANTE_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_KNN_RESTAURANTES_LOTE):
+        resultados = await executa(session, get_restaurant_recommendations_batch, request.ids_usuarios,
+                                   min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes_lote(resultados)
+
+@router.post("/usuarios/recomendacoes-knn/refeicoes:batch", response_model=KNNRecommendationBatchResponseDTO)
+@doc_de(sincrono.recomendar_refeicoes_knn_batch)
+async def recomendar_refeicoes_knn_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_KNN_REFEICAO_QUERY,
+    ponderado: bool = PONDERADO_QUERY,
+    abordagem: AbordagemKNN = ABORDAGEM_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_KNN_REFEICOES_LOTE):
+        resultados = await executa(session, get_meal_recommendations_batch, request.ids_usuarios,
+                                   min_score=min_score, weighted=ponderado, abordagem=abordagem)
+        return resposta_recomendacoes_lote(resultados)
+
+# ------------------------------------ Fatoração de matrizes abaixo ------------------------------------
+
+@router.get("/usuarios/recomendacoes-mf/restaurantes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+@doc_de(sincrono.recomendar_restaurantes_mf)
+async def recomendar_restaurantes_mf(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_MF_RESTAURANTE_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_MF_RESTAURANTES):
+        resultado = await executa(session, get_restaurant_recommendations_mf, id_usuario, min_score=min_score, limit=limit)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+@router.get("/usuarios/recomendacoes-mf/refeicoes/{id_usuario}", response_model=KNNRecommendationResponseDTO)
+@doc_de(sincrono.recomendar_refeicoes_mf)
+async def recomendar_refeicoes_mf(
+    id_usuario: int,
+    min_score: float = MIN_SCORE_MF_REFEICAO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_MF_REFEICOES):
+        resultado = await executa(session, get_meal_recommendations_mf, id_usuario, min_score=min_score, limit=limit)
+        return resposta_recomendacoes(id_usuario, resultado)
+
+@router.post("/usuarios/recomendacoes-mf/restaurantes:batch", response_model=KNNRecommendationBatchResponseDTO)
+@doc_de(sincrono.recomendar_restaurantes_mf_batch)
+async def recomendar_restaurantes_mf_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_MF_RESTAURANTE_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_MF_RESTAURANTES_LOTE):
+        resultados = await executa(session, get_restaurant_recommendations_mf_batch, request.ids_usuarios,
+                                   min_score=min_score, limit=limit)
+        return resposta_recomendacoes_lote(resultados)
+
+@router.post("/usuarios/recomendacoes-mf/refeicoes:batch", response_model=KNNRecommendationBatchResponseDTO)
+@doc_de(sincrono.recomendar_refeicoes_mf_batch)
+async def recomendar_refeicoes_mf_batch(
+    request: BatchUserRequestDTO,
+    min_score: float = MIN_SCORE_MF_REFEICAO_QUERY,
+    limit: Optional[int] = LIMIT_QUERY,
+    session: AsyncSession = Depends(get_async_session)
+):
+    with erro_interno(*ERRO_MF_REFEICOES_LOTE):
+        resultados = await executa(session, get_meal_recommendations_mf_batch, request.ids_usuarios,
+                                   min_score=min_score, limit=limit)
+        return resposta_recomendacoes_lote(resultados)
@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+from fastapi import HTTPException
+from services.recomendador import (
+    recall_por_restricao,
+    rankeia_por_score_com_total,
+    rankeia_restaurante,
+    rankeia_restaurante_composto_com_total
+)
+from services.recomendador_sql import (
+    recall_por_restricao_sql,
+    rankeia_por_score_sql_com_total,
+    rankeia_restaurante_sql,
+    rankeia_restaurante_composto_sql_com_total
+)
+
+# Lógica de requisição -> resposta compartilhada por api/endpoints.py e api/endpoints_async.py:
+# os dois routers só diferem na sessão (síncrona ou assíncrona) e no await.
+
+# Serviço de cada etapa por modo de execução ("memoria" ou "sql", ver ModoExecucao)
+RECALL = {"memoria": recall_por_restricao, "sql": recall_por_restricao_sql}
+RANKEIA_SCORE = {"memoria": rankeia_por_score_com_total, "sql": rankeia_por_score_sql_com_total}
+RANKEIA_RESTAURANTE = {"memoria": rankeia_restaurante, "sql": rankeia_restaurante_sql}
+RANKEIA_COMPOSTO = {"memoria": rankeia_restaurante_composto_com_total, "sql": rankeia_restaurante_composto_sql_com_total}
+
+# (mensagem do log, detalhe do erro 500) de cada endpoint
+ERRO_RECALL = ("Erro no recall:", "Erro interno ao processar filtragem.")
+ERRO_RANKEIA_SCORE = ("Erro no endpoint rankeia_por_score:", "Erro interno ao calcular ranking.")
+ERRO_RANKEIA_RESTAURANTE = ("Erro no endpoint rankeia_por_compatibilidade_restaurante:",
+                            "Erro interno ao calcular compatibilidade por restaurante.")
+ERRO_RANKEIA_COMPOSTO = ("Erro no rankeia_restaurante_composto:", "Erro interno ao calcular ranking composto.")
+ERRO_KNN_RESTAURANTES = ("Erro no recomendar_restaurantes_knn:", "Erro interno ao treinar e recomendar via KNN.")
+ERRO_KNN_REFEICOES = ("Erro no recomendar_refeicoes_knn:", "Erro interno ao treinar e recomendar via KNN.")
+ERRO_RECALL_LOTE = ("Erro no recall em lote:", "Erro interno ao processar filtragem em lote.")
+ERRO_RANKEIA_SCORE_LOTE = ("Erro no endpoint rankeia_por_score em lote:", "Erro interno ao calcular ranking em lote.")
+ERRO_KNN_RESTAURANTES_LOTE = ("Erro no recomendar_restaurantes_knn em lote:", "Erro interno ao recomendar via KNN em lote.")
+ERRO_KNN_REFEICOES_LOTE = ("Erro no recomendar_refeicoes_knn em lote:", "Erro interno ao recomendar via KNN em lote.")
+ERRO_MF_RESTAURANTES = ("Erro no recomendar_restaurantes_mf:", "Erro interno ao recomendar via fatoração de matrizes.")
+ERRO_MF_REFEICOES = ("Erro no recomendar_refeicoes_mf:", "Erro interno ao recomendar via fatoração de matrizes.")
+ERRO_MF_RESTAURANTES_LOTE = ("Erro no recomendar_restaurantes_mf em lote:",
+                             "Erro interno ao recomendar via fatoração de matrizes em lote.")
+ERRO_MF_REFEICOES_LOTE = ("Erro no recomendar_refeicoes_mf em lote:",
+                          "Erro interno ao recomendar via fatoração de matrizes em lote.")
+
+
+@contextmanager
+def erro_interno(log: str, detalhe: str):
+    """
+    Qualquer erro do serviço vira um 500 com `detalhe`; o erro real vai para o log.
+    """
+    try:
+        yield
+    except Exception as e:
+        # Em produção, logar o erro real 'e'
+        print(log, e)
+        raise HTTPException(status_code=500, detail=detalhe)
+
+
+def doc_de(original):
+    """
+    Reaproveita a docstring (descrição no OpenAPI) do endpoint equivalente do outro router.
+    """
+    def decorator(fn):
+        fn.__doc__ = original.__doc__
+        return fn
+    return decorator
+
+
+def resposta_recall(candidatos: list[int]) -> dict:
+    return {"id_refeicoes_candidatas": candidatos}
+
+
+def resposta_rankeia_score(id_usuario: int, resultados: list, total: int) -> dict:
+    # total_resultados é o tamanho do ranking completo, não da página
+    return {
+        "id_usuario": id_usuario,
+        "total_resultados": total,
+        "refeicoes_rankeadas": resultados
+    }
+
+
+def resposta_rankeia_restaurante(id_usuario: int, resultado: list) -> dict:
+    return {
+        "id_usuario": id_usuario,
+        "rank_restaurantes": resultado
+    }
+
+
+def resposta_rankeia_composto(id_usuario: int, resultado: list, total: int) -> dict:
+    return {
+        "id_usuario": id_usuario,
+        "total_restaurantes": total,
+        "restaurantes_ranked": resultado
+    }
+
+
+def resposta_recomendacoes(id_usuario: int, resultado) -> dict:
+    """
+    Resposta de KNNRecommendationResponseDTO para a lista do serviço (KNN ou fatoração).
+    """
+    # Cold start fallback (o serviço retorna um dict com a mensagem)
+    if isinstance(resultado, dict) and "message" in resultado:
+        return {"id_usuario": id_usuario, "message": resultado["message"], "recomendacoes": []}
+
+    return {
+        "id_usuario": id_usuario,
+        "recomendacoes": resultado,
+        "message": "Recomendações geradas com sucesso."
+    }
+
+
+def resposta_recall_lote(resultados: dict) -> dict:
+    return {"resultados": [
+        {"id_usuario": id_usuario, "id_refeicoes_candidatas": candidatos}
+        for id_usuario, candidatos in resultados.items()
+    ]}
+
+
+def resposta_rankeia_score_lote(resultados: dict, totais: dict) -> dict:
+    return {"resultados": [
+        {"id_usuario": id_usuario, "total_resultados": totais[id_usuario], "refeicoes_rankeadas": ranking}
+        for id_usuario, ranking in resultados.items()
+    ]}
+
+
+def resposta_recomendacoes_lote(resultados: dict) -> dict:
+    """
+    Converte id_usuario -> (lista | dict de Cold Start) no formato de KNNRecommendationBatchResponseDTO.
+    """
+    return {"resultados": [resposta_recomendacoes(id_usuario, resultado) for id_usuario, resultado in resultados.items()]}
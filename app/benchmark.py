@@ -0,0 +1,423 @@
+"""
+Benchmark das rotas de recomendação com dados sintéticos em várias escalas.
+
+Gera (uma vez, reaproveitando nas execuções seguintes) um banco SQLite com o esquema de
+models/db_models.py e dados parecidos com os reais: atividade dos usuários e popularidade dos
+itens em lei de potência, notas concentradas em 4-5, restrições que proíbem uma fração dos
+ingredientes e refeições com 3 a 12 ingredientes. Depois mede, para cada escala:
+- recall_por_restricao, rankeia_por_score, rankeia_restaurante e rankeia_restaurante_composto
+- create_user_restaurant_matrix / create_user_meal_matrix (pivot denso) e as versões esparsas
+- load_columns (carga das avaliações em blocos, usada no treino)
+- KNNRecommender.fit, precompute_neighbors e get_neighbors
+- os dois fluxos KNN (get_restaurant_recommendations / get_meal_recommendations)
+reportando p50/p95 de latência, pico de RSS e consultas SQL por chamada. O cache de resultados
+e os artefatos em disco ficam desligados, para medir o cálculo e não o cache.
+
+Para rodar (de dentro de app/):
+    python benchmark.py --escalas 10000 100000 1000000
+    python benchmark.py --escalas 100000 --compara benchmark_resultados/anterior.json
+
+Cada escala roda num processo novo (os índices e modelos são singletons de módulo e o pico de
+RSS é do processo). O resultado vai para um JSON em --saida, para comparar execuções ao longo
+do tempo (--compara imprime a razão dos p50/p95 contra uma execução anterior).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from models.db_models import (
+    AdministradorRestaurante, Usuario, Restricao, Restaurante, Ingrediente, Refeicao,
+    IngredienteRestricao, RefeicaoIngrediente, RestauranteFavorito, UsuarioRestricao,
+    UsuarioAvalia, RefeicaoAvalia, RefeicaoFavorito
+)
+
+BENCH_ESCALAS = (10_000, 100_000, 1_000_000)
+# Usuários sorteados por escala para as funções chamadas por usuário
+BENCH_USUARIOS = int(os.getenv("BENCH_USUARIOS", "200"))
+# Repetições das funções de treino (matrizes e fit)
+BENCH_REPETICOES = int(os.getenv("BENCH_REPETICOES", "3"))
+# Acima desta quantidade de células, o pivot denso (create_user_*_matrix) é pulado
+BENCH_MAX_CELULAS_DENSAS = int(os.getenv("BENCH_MAX_CELULAS_DENSAS", "50000000"))
+
+# Fração das avaliações que é de restaurantes (o resto é de refeições)
+FRACAO_AVALIACOES_RESTAURANTE = 0.3
+# Favoritos gerados, como fração das avaliações de cada domínio
+FRACAO_FAVORITOS = 0.05
+N_RESTRICOES = 12
+N_INGREDIENTES = 400
+# Distribuição das notas 1..5
+PROB_NOTAS = (0.05, 0.08, 0.17, 0.35, 0.35)
+LOTE_INSERCAO = 50_000
+
+
+def _pesos_potencia(n: int, expoente: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Pesos de Zipf (1/rank^expoente) embaralhados entre os ids: poucos muito populares, cauda longa.
+    """
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    rng.shuffle(pesos)
+    return pesos / pesos.sum()
+
+
+def _pares_unicos(n: int, n_usuarios: int, n_itens: int, rng: np.random.Generator,
+                  pesos_usuarios: np.ndarray, pesos_itens: np.ndarray) -> np.ndarray:
+    """
+    n pares (usuário, item) distintos sorteados pelos pesos (ids começando em 1).
+    """
+    n = min(n, n_usuarios * n_itens)
+    pares = np.empty((0, 2), dtype=np.int64)
+    while len(pares) < n:
+        falta = n - len(pares)
+        novos = np.column_stack([
+            rng.choice(n_usuarios, size=int(falta * 1.3) + 10, p=pesos_usuarios),
+            rng.choice(n_itens, size=int(falta * 1.3) + 10, p=pesos_itens),
+        ]) + 1
+        pares = np.concatenate([pares, novos])
+        _, primeira = np.unique(pares[:, 0] * (2 ** 32) + pares[:, 1], return_index=True)
+        pares = pares[np.sort(primeira)]
+    return pares[:n]
+
+
+def _insere(conn, tabela, linhas: list[dict]):
+    for inicio in range(0, len(linhas), LOTE_INSERCAO):
+        conn.execute(tabela.__table__.insert(), linhas[inicio:inicio + LOTE_INSERCAO])
+
+
+def gera_dados(engine, n_avaliacoes: int, seed: int = 0) -> dict:
+    """
+    Cria as tabelas e gera os dados sintéticos de uma escala. Retorna as dimensões geradas.
+    """
+    rng = np.random.default_rng(seed)
+    n_usuarios = max(n_avaliacoes // 20, 100)
+    n_restaurantes = max(n_avaliacoes // 500, 20)
+    n_refeicoes = n_restaurantes * 25
+    n_rest_aval = int(n_avaliacoes * FRACAO_AVALIACOES_RESTAURANTE)
+    n_ref_aval = n_avaliacoes - n_rest_aval
+    hoje = date.today()
+    datas = [hoje - timedelta(days=d) for d in range(365)]
+
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    pesos_usuarios = _pesos_potencia(n_usuarios, 0.8, rng)
+    with engine.begin() as conn:
+        _insere(conn, AdministradorRestaurante, [{"id_admin": 1, "email": "admin@bench", "nome": "Admin"}])
+        _insere(conn, Usuario, [
+            {"id_usuario": u, "email": f"{u}@bench", "nome": f"Usuário {u}"} for u in range(1, n_usuarios + 1)
+        ])
+        _insere(conn, Restricao, [{"id_restricao": r, "tipo": f"Restrição {r}"} for r in range(1, N_RESTRICOES + 1)])
+        _insere(conn, Restaurante, [
+            {"id_restaurante": r, "ativo": True, "bairro": "Centro", "cep": "01000000", "cidade": "São Paulo",
+             "descricao": "Restaurante sintético", "logradouro": "Rua A", "nome": f"Restaurante {r}",
+             "numero": r, "tipo_comida": "Variada", "uf": "SP", "id_admin": 1}
+            for r in range(1, n_restaurantes + 1)
+        ])
+        _insere(conn, Ingrediente, [
+            {"id_ingrediente": i, "nome": f"Ingrediente {i}", "id_admin": 1} for i in range(1, N_INGREDIENTES + 1)
+        ])
+
+        # Cardápios de tamanhos desiguais; ~85% das refeições disponíveis
+        restaurante_da_refeicao = rng.choice(n_restaurantes, size=n_refeicoes,
+                                             p=_pesos_potencia(n_restaurantes, 0.6, rng)) + 1
+        disponivel = rng.random(n_refeicoes) < 0.85
+        precos = np.round(rng.lognormal(3.3, 0.4, n_refeicoes), 2)
+        _insere(conn, Refeicao, [
+            {"id_refeicao": m + 1, "descricao": "Refeição sintética", "disponivel": bool(disponivel[m]),
+             "nome": f"Refeição {m + 1}", "preco": Decimal(f"{precos[m]:.2f}"),
+             "id_restaurante": int(restaurante_da_refeicao[m])}
+            for m in range(n_refeicoes)
+        ])
+
+        # Cada restrição proíbe de 3% a 15% dos ingredientes
+        ing_restr = []
+        for r in range(1, N_RESTRICOES + 1):
+            qtd = int(N_INGREDIENTES * rng.uniform(0.03, 0.15))
+            ing_restr += [{"id_ingrediente": int(i) + 1, "id_restricao": r}
+                          for i in rng.choice(N_INGREDIENTES, size=qtd, replace=False)]
+        _insere(conn, IngredienteRestricao, ing_restr)
+
+        # 3 a 12 ingredientes por refeição, com ingredientes comuns (sal, cebola...) mais frequentes
+        pesos_ingredientes = _pesos_potencia(N_INGREDIENTES, 0.9, rng)
+        ref_ing = []
+        for m in range(1, n_refeicoes + 1):
+            qtd = int(rng.integers(3, 13))
+            ref_ing += [{"id_ingrediente": int(i) + 1, "id_refeicao": m}
+                        for i in rng.choice(N_INGREDIENTES, size=qtd, replace=False, p=pesos_ingredientes)]
+        _insere(conn, RefeicaoIngrediente, ref_ing)
+
+        # ~60% dos usuários sem restrição, o resto com 1 a 3
+        usr_restr = []
+        for u in np.flatnonzero(rng.random(n_usuarios) >= 0.6) + 1:
+            for r in rng.choice(N_RESTRICOES, size=int(rng.integers(1, 4)), replace=False):
+                usr_restr.append({"id_restricao": int(r) + 1, "id_usuario": int(u)})
+        _insere(conn, UsuarioRestricao, usr_restr)
+
+        for tabela, favoritos, item_col, n, n_itens, expoente in (
+            (UsuarioAvalia, RestauranteFavorito, "id_restaurante", n_rest_aval, n_restaurantes, 1.0),
+            (RefeicaoAvalia, RefeicaoFavorito, "id_refeicao", n_ref_aval, n_refeicoes, 1.1),
+        ):
+            pesos_itens = _pesos_potencia(n_itens, expoente, rng)
+            pares = _pares_unicos(n, n_usuarios, n_itens, rng, pesos_usuarios, pesos_itens)
+            notas = rng.choice(5, size=len(pares), p=PROB_NOTAS) + 1
+            dias = rng.integers(0, 365, size=len(pares))
+            _insere(conn, tabela, [
+                {item_col: int(i), "id_usuario": int(u), "nota": int(nota), "comentario": "",
+                 "data_avaliacao": datas[d]}
+                for (u, i), nota, d in zip(pares.tolist(), notas.tolist(), dias.tolist())
+            ])
+            fav = _pares_unicos(int(n * FRACAO_FAVORITOS), n_usuarios, n_itens, rng, pesos_usuarios, pesos_itens)
+            _insere(conn, favoritos, [{item_col: int(i), "id_usuario": int(u)} for u, i in fav.tolist()])
+
+    return {"avaliacoes": n_avaliacoes, "usuarios": n_usuarios, "restaurantes": n_restaurantes,
+            "refeicoes": n_refeicoes, "ingredientes": N_INGREDIENTES, "restricoes": N_RESTRICOES, "seed": seed}
+
+
+class Medidor:
+    """
+    Mede cada função: latência por chamada, consultas SQL (evento before_cursor_execute do engine)
+    e o pico de RSS do processo ao final.
+    """
+    def __init__(self, engine):
+        self.resultados: dict[str, dict] = {}
+        self.consultas = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _conta(*args):
+            self.consultas += 1
+
+    @staticmethod
+    def rss_pico_mb() -> float:
+        # ru_maxrss: KB no Linux, bytes no macOS
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    def mede(self, nome: str, fn, chamadas: list[tuple], aquecimento: bool = True):
+        """
+        Chama fn(*args) para cada args em `chamadas`. Com aquecimento, a primeira chamada (que pode
+        montar índices/snapshots) é medida à parte e fica fora dos percentis.
+        """
+        primeira_ms = None
+        if aquecimento and chamadas:
+            inicio = time.perf_counter()
+            fn(*chamadas[0])
+            primeira_ms = round(1000 * (time.perf_counter() - inicio), 3)
+
+        tempos = []
+        consultas_antes = self.consultas
+        for args in chamadas:
+            inicio = time.perf_counter()
+            fn(*args)
+            tempos.append(1000 * (time.perf_counter() - inicio))
+        tempos = np.array(tempos)
+
+        self.resultados[nome] = {
+            "chamadas": len(tempos),
+            "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+            "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+            "media_ms": round(float(tempos.mean()), 3),
+            "max_ms": round(float(tempos.max()), 3),
+            "primeira_ms": primeira_ms,
+            "consultas_por_chamada": round((self.consultas - consultas_antes) / len(tempos), 2),
+            "rss_pico_mb": self.rss_pico_mb(),
+        }
+        print(f"  {nome}: p50={self.resultados[nome]['p50_ms']}ms p95={self.resultados[nome]['p95_ms']}ms "
+              f"consultas={self.resultados[nome]['consultas_por_chamada']}")
+
+    def pula(self, nome: str, motivo: str):
+        self.resultados[nome] = {"pulado": motivo}
+        print(f"  {nome}: pulado ({motivo})")
+
+
+def _roda_escala(n_avaliacoes: int, db_url: str, gera: bool, seed: int, n_usuarios_amostra: int,
+                 repeticoes: int) -> dict:
+    """
+    Executada num processo novo por escala: gera os dados se preciso e mede todas as funções.
+    """
+    # Mede o cálculo, não o cache de resultados nem a carga de artefatos em disco
+    os.environ["RESULT_CACHE_BACKEND"] = "desligado"
+    os.environ["MODEL_ARTIFACTS_DIR"] = ""
+    from services.recomendador import (
+        recall_por_restricao, rankeia_por_score, rankeia_restaurante, rankeia_restaurante_composto
+    )
+    from services.ml.knn_service import get_restaurant_recommendations, get_meal_recommendations
+    from services.ml.model_registry import model_registry, KNN_K_NEIGHBORS
+    from services.ml.recomendador_knn import KNNRecommender
+    from services.ml.pre_pocessing.processor import (
+        create_user_restaurant_matrix, create_user_meal_matrix,
+        create_sparse_user_restaurant_matrix, create_sparse_user_meal_matrix, load_columns, RATING_DTYPES
+    )
+    from services.indice_restricoes import indice_restricoes
+    from services.catalogo import catalogo
+    from services.estatisticas_restaurantes import estatisticas_restaurantes
+
+    print(f"Escala {n_avaliacoes} avaliações ({db_url})")
+    engine = create_engine(db_url)
+    manifesto_dados = Path(engine.url.database + ".json") if engine.url.get_backend_name() == "sqlite" else None
+    inicio = time.perf_counter()
+    if gera:
+        dimensoes = gera_dados(engine, n_avaliacoes, seed)
+        if manifesto_dados is not None:
+            manifesto_dados.write_text(json.dumps(dimensoes))
+        print(f"  dados gerados em {time.perf_counter() - inicio:.1f}s: {dimensoes}")
+    else:
+        dimensoes = json.loads(manifesto_dados.read_text()) if manifesto_dados and manifesto_dados.exists() else {}
+    geracao_s = round(time.perf_counter() - inicio, 3)
+
+    medidor = Medidor(engine)
+    rng = np.random.default_rng(seed)
+    with Session(engine) as session:
+        ids_usuarios = session.exec(select(Usuario.id_usuario)).all()
+        amostra = [(session, int(u)) for u in rng.choice(ids_usuarios, size=min(n_usuarios_amostra, len(ids_usuarios)),
+                                                           replace=False)]
+
+        # Snapshots em memória (montados uma vez por processo)
+        medidor.mede("indice_restricoes.build", indice_restricoes.build, [(session,)], aquecimento=False)
+        medidor.mede("catalogo.build", catalogo.build, [(session,)], aquecimento=False)
+        medidor.mede("estatisticas_restaurantes.build", estatisticas_restaurantes.build, [(session,)], aquecimento=False)
+
+        medidor.mede("recall_por_restricao", recall_por_restricao, amostra)
+        medidor.mede("rankeia_por_score", rankeia_por_score, amostra)
+        medidor.mede("rankeia_restaurante", rankeia_restaurante, amostra)
+        medidor.mede("rankeia_restaurante_composto", rankeia_restaurante_composto, amostra)
+
+        # Pivot denso e matriz esparsa a partir das linhas lidas do banco (como no fluxo original)
+        matrizes = {}
+        for dominio, tabela, item_col, denso, esparso in (
+            ("restaurantes", UsuarioAvalia, "id_restaurante", create_user_restaurant_matrix,
+             create_sparse_user_restaurant_matrix),
+            ("refeicoes", RefeicaoAvalia, "id_refeicao", create_user_meal_matrix, create_sparse_user_meal_matrix),
+        ):
+            linhas = [
+                {"id_usuario": u, item_col: i, "nota": n}
+                for u, i, n in session.exec(select(tabela.id_usuario, getattr(tabela, item_col), tabela.nota)).all()
+            ]
+            celulas = len({r["id_usuario"] for r in linhas}) * len({r[item_col] for r in linhas})
+            if celulas > BENCH_MAX_CELULAS_DENSAS:
+                medidor.pula(f"{denso.__name__}", f"{celulas} células > BENCH_MAX_CELULAS_DENSAS")
+            else:
+                medidor.mede(f"{denso.__name__}", denso, [(linhas,)] * repeticoes, aquecimento=False)
+            medidor.mede(f"{esparso.__name__}", esparso, [(linhas,)] * repeticoes, aquecimento=False)
+            matrizes[dominio] = esparso(linhas)
+            del linhas
+            # Carga do treino: só as três colunas, em blocos, direto para arrays NumPy
+            medidor.mede(f"load_columns[{dominio}]", load_columns,
+                         [(session, select(tabela.id_usuario, getattr(tabela, item_col), tabela.nota),
+                           RATING_DTYPES)] * repeticoes, aquecimento=False)
+
+        # KNN sobre a matriz de refeições (a maior): fit, tabela top-K e consulta de vizinhos
+        matriz = matrizes["refeicoes"]
+        recommender = KNNRecommender(k_neighbors=KNN_K_NEIGHBORS)
+        medidor.mede("KNNRecommender.fit", recommender.fit, [(matriz,)] * repeticoes, aquecimento=False)
+        usuarios_knn = [(int(u),) for u in rng.choice(matriz.user_ids, size=min(n_usuarios_amostra, len(matriz.user_ids)),
+                                                      replace=False)]
+        medidor.mede("KNNRecommender.get_neighbors", recommender.get_neighbors, usuarios_knn)
+        medidor.mede("KNNRecommender.precompute_neighbors", recommender.precompute_neighbors, [()], aquecimento=False)
+        medidor.mede("KNNRecommender.get_neighbors_tabela", recommender.get_neighbors, usuarios_knn)
+        del recommender, matrizes, matriz
+
+        # Fluxos KNN completos, com o modelo do registro (treino medido à parte)
+        for dominio in ("restaurantes", "refeicoes"):
+            medidor.mede(f"model_registry.build[{dominio}]", model_registry.build, [(session, dominio)],
+                         aquecimento=False)
+        medidor.mede("get_restaurant_recommendations", get_restaurant_recommendations, amostra)
+        medidor.mede("get_meal_recommendations", get_meal_recommendations, amostra)
+
+    return {
+        "dimensoes": dimensoes,
+        "geracao_s": geracao_s,
+        "rss_pico_mb": Medidor.rss_pico_mb(),
+        "config_treino": model_registry.config_treino(),
+        "funcoes": medidor.resultados,
+    }
+
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compara(atual: dict, anterior: dict):
+    """
+    Imprime a razão atual/anterior dos p50 e p95 de cada função presente nas duas execuções.
+    """
+    print(f"Comparação com a execução de {anterior.get('executado_em')} (commit {anterior.get('commit')}):")
+    for escala, resultado in atual["escalas"].items():
+        funcoes_antes = anterior.get("escalas", {}).get(escala, {}).get("funcoes", {})
+        for nome, medida in resultado["funcoes"].items():
+            antes = funcoes_antes.get(nome)
+            if not antes or "p50_ms" not in antes or "p50_ms" not in medida:
+                continue
+            razoes = [medida[p] / antes[p] if antes[p] else float("nan") for p in ("p50_ms", "p95_ms")]
+            print(f"  [{escala}] {nome}: p50 x{razoes[0]:.2f}  p95 x{razoes[1]:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das funções de recomendação com dados sintéticos.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=list(BENCH_ESCALAS),
+                        help="Quantidades de avaliações geradas (uma execução por escala).")
+    parser.add_argument("--dados", type=Path, default=Path("benchmark_dados"),
+                        help="Pasta dos bancos SQLite gerados (reaproveitados entre execuções).")
+    parser.add_argument("--db-url", default=None,
+                        help="URL de um banco já populado (ex.: MySQL de testes), no lugar do SQLite gerado. "
+                             "Aceita '{escala}' no texto; com --regera, as tabelas são recriadas e populadas.")
+    parser.add_argument("--regera", action="store_true", help="Gera os dados de novo mesmo se já existirem.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--usuarios", type=int, default=BENCH_USUARIOS, help="Usuários sorteados por escala.")
+    parser.add_argument("--repeticoes", type=int, default=BENCH_REPETICOES,
+                        help="Repetições das funções de treino (matrizes e fit).")
+    parser.add_argument("--saida", type=Path, default=None,
+                        help="Arquivo JSON do resultado; padrão: benchmark_resultados/<data-hora>.json.")
+    parser.add_argument("--compara", type=Path, default=None, help="JSON de uma execução anterior para comparar.")
+    args = parser.parse_args(argv)
+
+    resultado = {
+        "executado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"usuarios": args.usuarios, "repeticoes": args.repeticoes, "seed": args.seed},
+        "escalas": {},
+    }
+    args.dados.mkdir(parents=True, exist_ok=True)
+    for escala in args.escalas:
+        if args.db_url:
+            db_url = args.db_url.format(escala=escala)
+            gera = args.regera
+        else:
+            caminho = (args.dados / f"bench-{escala}-{args.seed}.sqlite").resolve()
+            db_url = f"sqlite:///{caminho}"
+            # O manifesto (.json ao lado do banco) só é gravado depois da geração completa
+            gera = args.regera or not Path(f"{caminho}.json").exists()
+        # Processo novo por escala: singletons de módulo e pico de RSS zerados
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            resultado["escalas"][str(escala)] = executor.submit(
+                _roda_escala, escala, db_url, gera, args.seed, args.usuarios, args.repeticoes
+            ).result()
+
+    saida = args.saida or Path("benchmark_resultados") / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, default=str))
+    print(f"Resultado salvo em {saida}")
+
+    if args.compara is not None:
+        compara(resultado, json.loads(args.compara.read_text()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,10 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from sqlmodel import create_engine, Session
-from typing import Generator
+from sqlalchemy import event
+from typing import AsyncGenerator, Generator
+from pool_metrics import PoolMetrics, instrumented_pool_class
+from instrumentacao import instrumenta_engine
 
 # Define o caminho para o arquivo .env usando Pathlib
 env_path = Path(__file__).resolve().parent.parent / ".env"
@@ -21,6 +24,17 @@ else:
 # 4. DB_HOST= host
 # 5. DB_PORT= port
 # 6. DB_NAME= db-name
+# Opcional (acesso assíncrono):
+# 7. DB_ASYNC= true
+# 8. DB_ASYNC_DRIVER= mysql+aiomysql
+# Opcional (pool de conexões; ajustar DB_POOL_SIZE ao número de workers/threads):
+# 9.  DB_POOL_SIZE= 5
+# 10. DB_MAX_OVERFLOW= 10
+# 11. DB_POOL_TIMEOUT= 30          (segundos esperando uma conexão livre)
+# 12. DB_POOL_RECYCLE= 1800        (segundos até reciclar uma conexão)
+# 13. DB_POOL_PRE_PING= true       (testa a conexão antes de usar; evita conexões mortas)
+# 14. DB_ECHO= false               (loga todo SQL no stdout; só para debug)
+# 15. DB_STATEMENT_TIMEOUT_MS= 0   (MAX_EXECUTION_TIME do MySQL para SELECTs; 0 = sem limite)
 
 # Reconstrói a URL a partir de variáveis individuais
 DB_DRIVER = os.getenv("DB_DRIVER", "mysql+pymysql")
@@ -29,14 +43,56 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "mysql+aiomysql")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
 
 DATABASE_URL = f"{DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"{DB_ASYNC_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME]):
     raise ValueError("Faltam variáveis de ambiente para a conexão com o banco de dados.")
 
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    echo=DB_ECHO,
+)
+
+# Métricas de espera/uso do pool (expostas em /metrics/pool)
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+def _configura_timeout(sync_engine):
+    """
+    Aplica DB_STATEMENT_TIMEOUT_MS em cada nova conexão MySQL.
+    """
+    if DB_STATEMENT_TIMEOUT_MS <= 0 or sync_engine.dialect.name != "mysql":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_max_execution_time(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {DB_STATEMENT_TIMEOUT_MS}")
+        cursor.close()
+
+
 # Cria o motor de conexão.
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, poolclass=instrumented_pool_class(pool_metrics), **POOL_OPTIONS)
+_configura_timeout(engine)
+# Consultas/linhas por requisição e tempo no banco (Server-Timing e /metrics, ver instrumentacao.py)
+instrumenta_engine(engine)
 
 def get_session() -> Generator[Session, None, None]:
     """
@@ -44,4 +100,38 @@ def get_session() -> Generator[Session, None, None]:
     para cada requisição.
     """
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def pool_status() -> dict:
+    """
+    Estado dos pools de conexão (síncrono e, se habilitado, assíncrono).
+    """
+    status = {"sync": pool_metrics.snapshot(engine.pool)}
+    if async_engine is not None:
+        status["async"] = async_pool_metrics.snapshot(async_engine.sync_engine.pool)
+    return status
+
+
+# Motor assíncrono (driver asyncio, ex.: aiomysql), criado só quando DB_ASYNC=true.
+# O motor síncrono continua sendo usado no startup e nas atualizações em background.
+async_engine = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=instrumented_pool_class(async_pool_metrics, assincrono=True),
+        **POOL_OPTIONS
+    )
+    _configura_timeout(async_engine.sync_engine)
+    instrumenta_engine(async_engine.sync_engine)
+
+
+async def get_async_session() -> AsyncGenerator:
+    """
+    Dependência do FastAPI para os endpoints assíncronos (api/endpoints_async.py).
+    """
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,245 @@
+"""
+Exportação offline das recomendações de todos os usuários (job noturno).
+
+Percorre os usuários em lotes, distribui os lotes entre processos e grava um arquivo
+Parquet (ou Arrow IPC) por lote. Reaproveita os serviços da API: recall + rankeia_score
+(services.recomendador) e os dois fluxos KNN (services.ml.knn_service).
+
+Para rodar (de dentro de app/):
+    python export_recomendacoes.py --saida exports/2025-01-01 --workers 4
+
+Retomada: cada lote vira um arquivo 'parte-NNNNN.<ext>' gravado de forma atômica
+(arquivo temporário + rename). Rodando de novo com a mesma --saida, os lotes já gravados
+são pulados. O arquivo '_manifesto.json' guarda os parâmetros da exportação e a faixa
+[início, fim) de id_usuario de cada lote: usuários criados ou removidos entre as execuções
+não deslocam os lotes (os criados depois do último lote entram em lotes novos). Rodar com
+parâmetros diferentes na mesma pasta é recusado (use --refazer para recomeçar).
+"""
+import argparse
+import bisect
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from sqlmodel import Session, create_engine, select
+
+from models.db_models import Usuario
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+EXPORT_TOP_N = int(os.getenv("EXPORT_TOP_N", "50"))
+
+FONTES = ("score_refeicoes", "knn_refeicoes", "knn_restaurantes")
+
+# Uma linha por (usuário, fonte, posição)
+SCHEMA = pa.schema([
+    ("id_usuario", pa.int32()),
+    ("fonte", pa.dictionary(pa.int8(), pa.string())),
+    ("posicao", pa.int32()),
+    ("id_item", pa.int32()),
+    ("score", pa.float32()),
+])
+
+# Estado de cada processo do pool (preenchido em _inicia_worker)
+_engine = None
+_params = None
+
+
+def _inicia_worker(db_url: str | None, params: dict):
+    """
+    Cada processo abre o próprio engine; conexões herdadas via fork não podem ser reutilizadas.
+    Os modelos/índices são singletons de módulo: montados no processo pai antes do fork são
+    compartilhados (copy-on-write); caso contrário, cada worker monta os seus sob demanda.
+    """
+    global _engine, _params
+    if db_url:
+        _engine = create_engine(db_url)
+    else:
+        from connection import engine
+        engine.dispose(close=False)
+        _engine = engine
+    _params = params
+
+
+def _linhas_fonte(colunas: dict, fonte: str, id_usuario: int, ids: list[int], scores: list | None):
+    n = min(len(ids), _params["top_n"])
+    colunas["id_usuario"].extend([id_usuario] * n)
+    colunas["fonte"].extend([fonte] * n)
+    colunas["posicao"].extend(range(n))
+    colunas["id_item"].extend(ids[:n])
+    colunas["score"].extend(scores[:n] if scores is not None else [None] * n)
+
+
+def recomendacoes_lote(session: Session, ids_usuarios: list[int]) -> pa.Table:
+    """
+    Recall + ranking por score + KNN (refeições e restaurantes) para um lote de usuários,
+    em formato longo. Usuários em Cold Start simplesmente não têm linhas KNN.
+    """
+    from services.recomendador import rankeia_por_score_lote
+    from services.ml.knn_service import get_meal_recommendations_batch, get_restaurant_recommendations_batch
+
+    k = _params["k"]
+    min_score = _params["min_score"]
+    ranking = rankeia_por_score_lote(session, ids_usuarios, limit=_params["top_n"])
+    knn_refeicoes = get_meal_recommendations_batch(session, ids_usuarios, k=k, min_score=min_score)
+    knn_restaurantes = get_restaurant_recommendations_batch(session, ids_usuarios, k=k, min_score=min_score)
+
+    colunas = {nome: [] for nome in SCHEMA.names}
+    for id_usuario in ids_usuarios:
+        itens = ranking.get(id_usuario, [])
+        _linhas_fonte(colunas, "score_refeicoes", id_usuario,
+                      [r["id_refeicao"] for r in itens], [r["score"] for r in itens])
+        for fonte, resultado in (("knn_refeicoes", knn_refeicoes), ("knn_restaurantes", knn_restaurantes)):
+            ids = resultado.get(id_usuario, [])
+            if isinstance(ids, list):
+                _linhas_fonte(colunas, fonte, id_usuario, ids, None)
+
+    colunas["fonte"] = pa.DictionaryArray.from_arrays(
+        pa.array([FONTES.index(f) for f in colunas["fonte"]], type=pa.int8()),
+        pa.array(FONTES, type=pa.string())
+    )
+    return pa.table(colunas, schema=SCHEMA)
+
+
+def _grava(tabela: pa.Table, destino: Path, formato: str):
+    """
+    Grava em um temporário e renomeia: um arquivo 'parte-*' existente está sempre completo.
+    """
+    tmp = destino.with_name(destino.name + ".tmp")
+    if formato == "parquet":
+        pq.write_table(tabela, tmp, compression="zstd")
+    else:
+        with ipc.new_file(tmp, tabela.schema) as writer:
+            writer.write_table(tabela)
+    os.replace(tmp, destino)
+
+
+def _processa_lote(tarefa: tuple[int, list[int], str]) -> tuple[int, int, int, float]:
+    indice, ids_usuarios, destino = tarefa
+    inicio = time.perf_counter()
+    with Session(_engine) as session:
+        tabela = recomendacoes_lote(session, ids_usuarios)
+    _grava(tabela, Path(destino), _params["formato"])
+    return indice, len(ids_usuarios), tabela.num_rows, time.perf_counter() - inicio
+
+
+def _prepara_saida(saida: Path, params: dict, refazer: bool) -> list[list[int]]:
+    """
+    Confere o manifesto de uma execução anterior e devolve as faixas de id dos lotes dela
+    (vazio numa exportação nova ou com --refazer).
+    """
+    saida.mkdir(parents=True, exist_ok=True)
+    manifesto = saida / "_manifesto.json"
+    if refazer:
+        for arq in saida.glob("parte-*"):
+            arq.unlink()
+    elif manifesto.exists():
+        anterior = json.loads(manifesto.read_text())
+        lotes = anterior.pop("lotes", None)
+        if anterior != params or (lotes is None and any(saida.glob("parte-*"))):
+            raise SystemExit(
+                f"{saida} contém uma exportação com parâmetros diferentes ({anterior}); use --refazer."
+            )
+        return lotes or []
+    return []
+
+
+def _faixas_lotes(ids: list[int], chunk_size: int, anteriores: list[list[int]]) -> list[list[int]]:
+    """
+    Faixas [início, fim) de id_usuario dos lotes: as da execução anterior, sem mudança, seguidas
+    de lotes novos de até chunk_size usuários para os ids a partir do fim da última faixa.
+    """
+    lotes = [list(faixa) for faixa in anteriores]
+    novos = ids[bisect.bisect_left(ids, lotes[-1][1]):] if lotes else ids
+    for inicio in range(0, len(novos), chunk_size):
+        fim = novos[inicio + chunk_size] if inicio + chunk_size < len(novos) else novos[-1] + 1
+        lotes.append([novos[inicio], fim])
+    return lotes
+
+
+def exporta(saida: Path, formato: str = "parquet", chunk_size: int = EXPORT_CHUNK_SIZE, workers: int = 1,
+            k: int = 16, min_score: float = 3.0, top_n: int = EXPORT_TOP_N, refazer: bool = False,
+            db_url: str | None = None) -> dict:
+    params = {"formato": formato, "chunk_size": chunk_size, "k": k, "min_score": min_score, "top_n": top_n}
+    anteriores = _prepara_saida(saida, params, refazer)
+    ext = "parquet" if formato == "parquet" else "arrow"
+
+    _inicia_worker(db_url, params)
+    with Session(_engine) as session:
+        ids = session.exec(select(Usuario.id_usuario).order_by(Usuario.id_usuario)).all()
+
+        # Monta índices e modelos antes do fork: os workers herdam as estruturas prontas
+        from services.indice_restricoes import indice_restricoes
+        from services.estatisticas_restaurantes import estatisticas_restaurantes
+        from services.catalogo import catalogo
+        from services.ml.model_registry import model_registry
+        indice_restricoes.get(session)
+        estatisticas_restaurantes.get(session)
+        catalogo.get(session)
+        model_registry.build_all(session)
+
+    lotes = _faixas_lotes(list(ids), chunk_size, anteriores)
+    (saida / "_manifesto.json").write_text(json.dumps({**params, "lotes": lotes}, indent=2))
+
+    tarefas = []
+    for indice, (lo, hi) in enumerate(lotes):
+        destino = saida / f"parte-{indice:05d}.{ext}"
+        if not destino.exists():
+            ids_lote = ids[bisect.bisect_left(ids, lo):bisect.bisect_left(ids, hi)]
+            tarefas.append((indice, ids_lote, str(destino)))
+    total_lotes = len(lotes)
+    print(f"{len(ids)} usuários em {total_lotes} lotes; {total_lotes - len(tarefas)} já exportados, "
+          f"{len(tarefas)} pendentes.")
+
+    feitos, usuarios, linhas = 0, 0, 0
+    inicio = time.perf_counter()
+
+    def _progresso(resultado):
+        nonlocal feitos, usuarios, linhas
+        indice, n_usuarios, n_linhas, duracao = resultado
+        feitos += 1
+        usuarios += n_usuarios
+        linhas += n_linhas
+        print(f"[{feitos}/{len(tarefas)}] lote {indice:05d}: {n_usuarios} usuários, {n_linhas} linhas "
+              f"em {duracao:.2f}s ({usuarios / max(time.perf_counter() - inicio, 1e-9):.0f} usuários/s)")
+
+    if workers <= 1:
+        for tarefa in tarefas:
+            _progresso(_processa_lote(tarefa))
+    else:
+        # imap_unordered: cada lote é gravado pelo próprio worker, o pai só recebe contadores.
+        # maxtasksperchild limita o crescimento de memória de cada processo.
+        with mp.Pool(workers, initializer=_inicia_worker, initargs=(db_url, params), maxtasksperchild=50) as pool:
+            for resultado in pool.imap_unordered(_processa_lote, tarefas):
+                _progresso(resultado)
+
+    resumo = {"lotes": total_lotes, "lotes_exportados": feitos, "usuarios": usuarios, "linhas": linhas,
+              "duracao_s": round(time.perf_counter() - inicio, 3)}
+    print(f"Exportação concluída: {resumo}")
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta as recomendações de todos os usuários em Parquet/Arrow.")
+    parser.add_argument("--saida", required=True, type=Path, help="Pasta de destino (um arquivo por lote).")
+    parser.add_argument("--formato", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Usuários por lote.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos em paralelo.")
+    parser.add_argument("--k", type=int, default=16, help="Vizinhos do KNN.")
+    parser.add_argument("--min-score", type=float, default=3.0, help="Nota mínima média dos vizinhos (KNN).")
+    parser.add_argument("--top-n", type=int, default=EXPORT_TOP_N, help="Máximo de itens por usuário e fonte.")
+    parser.add_argument("--refazer", action="store_true", help="Apaga os lotes existentes em vez de retomar.")
+    parser.add_argument("--db-url", default=None, help="URL do banco; padrão: variáveis DB_* (ver connection.py).")
+    args = parser.parse_args(argv)
+
+    exporta(args.saida, formato=args.formato, chunk_size=args.chunk_size, workers=args.workers, k=args.k,
+            min_score=args.min_score, top_n=args.top_n, refazer=args.refazer, db_url=args.db_url)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from perfilador import registra_thread, desregistra_thread
+
+# Mede as etapas (etapa()) e as consultas SQL de cada requisição
+INSTRUMENTACAO_ENABLED = os.getenv("INSTRUMENTACAO_ENABLED", "true").lower() == "true"
+# Devolve as medições da requisição no cabeçalho Server-Timing
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+# Limites (segundos) dos buckets dos histogramas de duração
+BUCKETS_DURACAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_LINHAS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Histograma:
+    """
+    Histograma cumulativo no formato do Prometheus, com um rótulo (ex.: etapa, rota).
+    """
+    def __init__(self, nome: str, descricao: str, rotulo: str, buckets: tuple = BUCKETS_DURACAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulo = rotulo
+        self.buckets = buckets
+        self._series: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observa(self, valor_rotulo: str, valor: float):
+        with self._lock:
+            serie = self._series.get(valor_rotulo)
+            if serie is None:
+                # [contagem por bucket (+Inf no fim), soma, total]
+                serie = self._series[valor_rotulo] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][bisect_left(self.buckets, valor)] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exporta(self) -> list[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = {rotulo: (list(contagens), soma, total) for rotulo, (contagens, soma, total) in self._series.items()}
+        for valor_rotulo, (contagens, soma, total) in sorted(series.items()):
+            rotulo = f'{self.rotulo}="{valor_rotulo}"'
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{{{rotulo},le="{limite}"}} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{{{rotulo},le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{rotulo}}} {soma}")
+            linhas.append(f"{self.nome}_count{{{rotulo}}} {total}")
+        return linhas
+
+
+duracao_etapas = Histograma(
+    "meal4you_etapa_duracao_segundos", "Duração de cada etapa das recomendações (db = consultas SQL).", "etapa"
+)
+duracao_requisicoes = Histograma(
+    "meal4you_requisicao_duracao_segundos", "Duração das requisições HTTP por rota.", "rota"
+)
+consultas_requisicoes = Histograma(
+    "meal4you_requisicao_consultas_sql", "Consultas SQL executadas por requisição.", "rota", BUCKETS_CONSULTAS
+)
+linhas_requisicoes = Histograma(
+    "meal4you_requisicao_linhas_sql", "Linhas retornadas pelo banco por requisição.", "rota", BUCKETS_LINHAS
+)
+
+
+class Requisicao:
+    """
+    Medições de uma requisição: tempo e chamadas por etapa, consultas e linhas lidas do banco.
+    """
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: dict[str, list] = {}
+        self.consultas = 0
+        self.linhas = 0
+
+    def registra(self, nome: str, duracao: float):
+        medicao = self.etapas.get(nome)
+        if medicao is None:
+            self.etapas[nome] = [duracao, 1]
+        else:
+            medicao[0] += duracao
+            medicao[1] += 1
+
+    def server_timing(self) -> str:
+        """
+        Cabeçalho Server-Timing: uma entrada por etapa (as aninhadas se sobrepõem) e o total.
+        """
+        partes = []
+        for nome, (duracao, chamadas) in self.etapas.items():
+            desc = f"{self.consultas} consultas, {self.linhas} linhas" if nome == "db" else f"{chamadas}x"
+            partes.append(f'{nome};dur={1000 * duracao:.2f};desc="{desc}"')
+        partes.append(f"total;dur={1000 * (time.perf_counter() - self.inicio):.2f}")
+        return ", ".join(partes)
+
+
+_requisicao_atual: ContextVar[Requisicao | None] = ContextVar("requisicao_atual", default=None)
+
+
+@contextmanager
+def etapa(nome: str):
+    """
+    Mede um trecho (with etapa("knn.vizinhos"): ...) ou uma função (@etapa("matriz.esparsa")):
+    alimenta o histograma da etapa e, dentro de uma requisição, o Server-Timing dela.
+    """
+    perfil = registra_thread()
+    if not INSTRUMENTACAO_ENABLED:
+        try:
+            yield
+        finally:
+            desregistra_thread(perfil)
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        desregistra_thread(perfil)
+        duracao = time.perf_counter() - inicio
+        duracao_etapas.observa(nome, duracao)
+        requisicao = _requisicao_atual.get()
+        if requisicao is not None:
+            requisicao.registra(nome, duracao)
+
+
+def instrumenta_engine(engine):
+    """
+    Conta as consultas SQL (e as linhas, quando o driver informa cursor.rowcount, como o PyMySQL)
+    e mede o tempo de cada uma como a etapa "db". Para o motor assíncrono, passar async_engine.sync_engine.
+    """
+    if not INSTRUMENTACAO_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("instrumentacao_inicio", []).append((time.perf_counter(), registra_thread()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicio, perfil = conn.info["instrumentacao_inicio"].pop()
+        desregistra_thread(perfil)
+        duracao = time.perf_counter() - inicio
+        duracao_etapas.observa("db", duracao)
+        requisicao = _requisicao_atual.get()
+        if requisicao is not None:
+            requisicao.registra("db", duracao)
+            requisicao.consultas += 1
+            if cursor.rowcount > 0:
+                requisicao.linhas += cursor.rowcount
+
+    @event.listens_for(engine, "handle_error")
+    def _erro(contexto):
+        # Consulta que falhou: after_cursor_execute não é chamado, a thread sai do perfil aqui
+        conn = contexto.connection
+        if conn is not None and conn.info.get("instrumentacao_inicio"):
+            _, perfil = conn.info["instrumentacao_inicio"].pop()
+            desregistra_thread(perfil)
+
+
+class InstrumentacaoMiddleware:
+    """
+    Middleware ASGI: abre as medições da requisição (herdadas pelas threads dos endpoints
+    síncronos via contextvars), escreve o Server-Timing e alimenta os histogramas por rota
+    (o template da rota, ex.: /usuarios/recomendacoes-knn/refeicoes/{id_usuario}).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not INSTRUMENTACAO_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        requisicao = Requisicao()
+        token = _requisicao_atual.set(requisicao)
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING_ENABLED:
+                MutableHeaders(scope=message).append("Server-Timing", requisicao.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _requisicao_atual.reset(token)
+            rota = scope["route"].path if "route" in scope else "desconhecida"
+            duracao_requisicoes.observa(rota, time.perf_counter() - requisicao.inicio)
+            consultas_requisicoes.observa(rota, requisicao.consultas)
+            linhas_requisicoes.observa(rota, requisicao.linhas)
+
+
+def exporta_prometheus() -> str:
+    """
+    Todos os histogramas no formato texto do Prometheus (endpoint /metrics).
+    """
+    linhas = []
+    for histograma in (duracao_etapas, duracao_requisicoes, consultas_requisicoes, linhas_requisicoes):
+        linhas += histograma.exporta()
+    return "\n".join(linhas) + "\n"
@@ -1,16 +1,43 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from scalar_fastapi import get_scalar_api_reference
-from connection import engine
+from sqlmodel import Session
+from connection import engine, DB_ASYNC, pool_status
+from instrumentacao import InstrumentacaoMiddleware, exporta_prometheus
+from perfilador import PerfilMiddleware, registro_perfis, token_valido
 from models.db_models import SQLModel
+from services.ml.model_registry import model_registry
+from services.indice_restricoes import indice_restricoes
+from services.estatisticas_restaurantes import estatisticas_restaurantes
+from services.catalogo import catalogo
+from services.cache_resultados import cache_resultados
+from services.agendador import agendador
 from api.endpoints import router as api_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Inicializando modelos e conexão com o banco...")
     SQLModel.metadata.create_all(engine)
+
+    # Treina os modelos KNN (ou carrega os artefatos em disco da versão atual, ver model_store)
+    # e monta o índice de restrições uma única vez; as requisições compartilham as mesmas estruturas
+    try:
+        with Session(engine) as session:
+            indice_restricoes.build(session)
+            estatisticas_restaurantes.build(session)
+            catalogo.build(session)
+            model_registry.build_all(session)
+        agendador.marca_construido()
+    except Exception as e:
+        # Sem modelo em memória, o primeiro request de cada domínio treina sob demanda
+        print(f"Erro ao montar modelos no startup: {e}")
+    # Reconstruções seguintes (modelos e snapshots) em segundo plano, com troca atômica
+    agendador.start(engine)
+
     yield
     print("Encerrando conexão...")
+    agendador.stop()
 
 app = FastAPI(
     title="Meal4You Recommender ML",
@@ -18,8 +45,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Tempo por etapa e consultas SQL de cada requisição: cabeçalho Server-Timing e /metrics
+app.add_middleware(InstrumentacaoMiddleware)
+# Perfil por amostragem de requisições marcadas com X-Profile / ?profile= (PROFILING_TOKEN)
+app.add_middleware(PerfilMiddleware)
+
 # --- INCLUINDO AS ROTAS AQUI ---
-app.include_router(api_router)
+if DB_ASYNC:
+    # Mesmas rotas em 'async def' sobre o motor assíncrono (ver connection.py)
+    from api.endpoints_async import router as api_async_router
+    app.include_router(api_async_router)
+else:
+    app.include_router(api_router)
 
 
 # -_-_-_- SCALAR DOCS & API Testing -_-_-_-
@@ -36,4 +73,67 @@ async def scalar_html():
 def health_check():
     return {"status": "ok", "message": "O Serviço de ML está rodando e conectado ao MySQL."}
 
-# Para rodar: uvicorn main:app --reload
\ No newline at end of file
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_prometheus():
+    """
+    Histogramas no formato do Prometheus: duração por etapa (recall, ranking, knn, db...),
+    duração, consultas SQL e linhas lidas por rota.
+    """
+    return PlainTextResponse(exporta_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def _confere_token_perfil(x_profile: str | None, token: str | None):
+    if not token_valido(x_profile or token):
+        raise HTTPException(status_code=403, detail="Token de perfil ausente ou inválido (PROFILING_TOKEN).")
+
+
+@app.get("/profiles")
+def lista_perfis(x_profile: str | None = Header(default=None), token: str | None = None):
+    """
+    Últimos perfis capturados (mais recente primeiro): rota, id_usuario, duração e amostras.
+    """
+    _confere_token_perfil(x_profile, token)
+    return registro_perfis.lista()
+
+
+@app.get("/profiles/{id_perfil}")
+def baixa_perfil(id_perfil: str, formato: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+                 x_profile: str | None = Header(default=None), token: str | None = None):
+    """
+    Perfil no formato do speedscope (JSON) ou em pilhas colapsadas (flamegraph.pl / inferno).
+    """
+    _confere_token_perfil(x_profile, token)
+    perfil = registro_perfis.get(id_perfil)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado (o buffer guarda só os últimos).")
+    if formato == "collapsed":
+        return PlainTextResponse(perfil.collapsed())
+    return perfil.speedscope()
+
+
+@app.get("/metrics/pool")
+def metrics_pool():
+    """
+    Uso do pool de conexões: conexões em uso/ociosas, utilização e tempo de espera por checkout.
+    """
+    return pool_status()
+
+
+@app.get("/metrics/cache")
+def metrics_cache():
+    """
+    Cache de resultados: hits/misses (total e por endpoint) e ocupação.
+    """
+    return cache_resultados.status()
+
+
+@app.get("/metrics/agendador")
+def metrics_agendador():
+    """
+    Agendador de reconstrução: duração e idade do último build de cada modelo/snapshot.
+    """
+    return agendador.status()
+
+
+# Para rodar: uvicorn main:app --reload
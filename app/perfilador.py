@@ -0,0 +1,268 @@
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from starlette.datastructures import MutableHeaders
+
+# Token que libera o perfil de uma requisição (cabeçalho X-Profile ou ?profile=); vazio desliga
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# Intervalo (milissegundos) entre duas amostras das pilhas; intervalos muito curtos fazem a thread do
+# amostrador disputar o GIL com a própria requisição e inflam a duração medida
+PROFILING_INTERVALO_MS = float(os.getenv("PROFILING_INTERVALO_MS", "5"))
+# Quantidade de perfis guardados (os mais recentes) para download em /profiles
+PROFILING_BUFFER = int(os.getenv("PROFILING_BUFFER", "20"))
+
+
+class Perfil:
+    """
+    Perfil por amostragem de uma requisição: pilhas (raiz -> folha) contadas a cada amostra,
+    das threads que estão executando código da requisição (ver registra_thread).
+    threads conta, por thread, os trechos da requisição ainda abertos nela.
+    """
+    def __init__(self, metodo: str, caminho: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.metodo = metodo
+        self.caminho = caminho
+        self.rota: str | None = None
+        self.id_usuario = None
+        self.status: int | None = None
+        self.criado_em = time.time()
+        self.duracao_ms: float | None = None
+        self.intervalo_ms = PROFILING_INTERVALO_MS
+        self.threads: Counter = Counter()
+        self.pilhas: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def entra(self, ident: int):
+        with self._lock:
+            self.threads[ident] += 1
+
+    def sai(self, ident: int):
+        with self._lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+
+    def threads_ativas(self) -> list[int]:
+        with self._lock:
+            return list(self.threads)
+
+    @property
+    def amostras(self) -> int:
+        return sum(self.pilhas.values())
+
+    def resumo(self) -> dict:
+        return {
+            "id": self.id,
+            "metodo": self.metodo,
+            "rota": self.rota or self.caminho,
+            "caminho": self.caminho,
+            "id_usuario": self.id_usuario,
+            "status": self.status,
+            "criado_em": self.criado_em,
+            "duracao_ms": self.duracao_ms,
+            "amostras": self.amostras,
+            "intervalo_ms": self.intervalo_ms,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Formato "collapsed stacks" (flamegraph.pl, speedscope, inferno): "raiz;...;folha contagem".
+        """
+        return "".join(f"{';'.join(pilha)} {qtd}\n" for pilha, qtd in self.pilhas.most_common())
+
+    def speedscope(self) -> dict:
+        """
+        Arquivo do speedscope (https://www.speedscope.app) do tipo "sampled", com peso em milissegundos.
+        """
+        frames, posicao = [], {}
+        amostras, pesos = [], []
+        for pilha, qtd in self.pilhas.most_common():
+            indices = []
+            for frame in pilha:
+                if frame not in posicao:
+                    posicao[frame] = len(frames)
+                    frames.append({"name": frame})
+                indices.append(posicao[frame])
+            amostras.append(indices)
+            pesos.append(qtd * self.intervalo_ms)
+        nome = f"{self.metodo} {self.rota or self.caminho} id_usuario={self.id_usuario}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nome,
+            "exporter": "meal4you-perfilador",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": nome,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(pesos),
+                "samples": amostras,
+                "weights": pesos,
+            }],
+        }
+
+
+def _pilha(frame) -> tuple[str, ...]:
+    nomes = []
+    while frame is not None:
+        codigo = frame.f_code
+        nomes.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+        frame = frame.f_back
+    return tuple(reversed(nomes))
+
+
+class Amostrador:
+    """
+    Thread que, a cada `intervalo_ms`, lê as pilhas das threads do perfil (sys._current_frames).
+    Só existe enquanto a requisição perfilada está em andamento.
+    """
+    def __init__(self, perfil: Perfil):
+        self.perfil = perfil
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"perfilador-{perfil.id}", daemon=True)
+
+    def _loop(self):
+        intervalo = self.perfil.intervalo_ms / 1000
+        while not self._parar.wait(intervalo):
+            frames = sys._current_frames()
+            for ident in self.perfil.threads_ativas():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.perfil.pilhas[_pilha(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+        self._thread.join()
+
+
+_perfil_atual: ContextVar[Perfil | None] = ContextVar("perfil_atual", default=None)
+
+
+def registra_thread() -> Perfil | None:
+    """
+    Marca a thread atual como executando código da requisição perfilada (se houver) até o
+    desregistra_thread() correspondente. Chamado por etapa() e pelos hooks de SQL (ver
+    instrumentacao.py): é assim que o amostrador encontra a thread do threadpool onde rodam os
+    endpoints síncronos, e só enquanto ela roda a requisição (depois a thread volta ao pool e
+    passa a executar outras). Retorna o perfil, a ser passado para desregistra_thread().
+    """
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.entra(threading.get_ident())
+    return perfil
+
+
+def desregistra_thread(perfil: Perfil | None):
+    if perfil is not None:
+        perfil.sai(threading.get_ident())
+
+
+def token_valido(token: str | None) -> bool:
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+class RegistroPerfis:
+    """
+    Buffer circular com os últimos `tamanho` perfis.
+    """
+    def __init__(self, tamanho: int = PROFILING_BUFFER):
+        self._perfis: deque[Perfil] = deque(maxlen=tamanho)
+        self._lock = threading.Lock()
+
+    def adiciona(self, perfil: Perfil):
+        with self._lock:
+            self._perfis.append(perfil)
+
+    def lista(self) -> list[dict]:
+        with self._lock:
+            return [perfil.resumo() for perfil in reversed(self._perfis)]
+
+    def get(self, id_perfil: str) -> Perfil | None:
+        with self._lock:
+            return next((perfil for perfil in self._perfis if perfil.id == id_perfil), None)
+
+
+# Instância única compartilhada pela aplicação
+registro_perfis = RegistroPerfis()
+
+
+def _id_usuario(scope, corpo: bytes):
+    """
+    id_usuario do caminho (/.../{id_usuario}) ou do corpo JSON (id_usuario ou ids_usuarios).
+    """
+    if "id_usuario" in scope.get("path_params", {}):
+        return scope["path_params"]["id_usuario"]
+    try:
+        dados = json.loads(corpo) if corpo else {}
+    except ValueError:
+        return None
+    if isinstance(dados, dict):
+        return dados.get("id_usuario", dados.get("ids_usuarios"))
+    return None
+
+
+class PerfilMiddleware:
+    """
+    Middleware ASGI do modo de perfil: com o cabeçalho X-Profile (ou ?profile=) igual a
+    PROFILING_TOKEN, a requisição roda com o amostrador ligado; o perfil vai para o buffer
+    (GET /profiles) e o id volta no cabeçalho X-Profile-Id. Sem token configurado, não faz nada.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # As rotas de download (/profiles) usam o mesmo token para autenticar e não são perfiladas:
+        # senão cada leitura do buffer empurraria para fora os perfis que se quer baixar
+        if (scope["type"] != "http" or not PROFILING_TOKEN or scope["path"].startswith("/profiles")
+                or not token_valido(self._token(scope))):
+            await self.app(scope, receive, send)
+            return
+
+        perfil = Perfil(scope["method"], scope["path"])
+        perfil.entra(threading.get_ident())
+        corpo = bytearray()
+
+        async def _receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                corpo.extend(message.get("body", b""))
+            return message
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                perfil.status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", perfil.id)
+            await send(message)
+
+        token = _perfil_atual.set(perfil)
+        amostrador = Amostrador(perfil)
+        inicio = time.perf_counter()
+        amostrador.start()
+        try:
+            await self.app(scope, _receive, _send)
+        finally:
+            amostrador.stop()
+            _perfil_atual.reset(token)
+            perfil.duracao_ms = round(1000 * (time.perf_counter() - inicio), 3)
+            perfil.rota = scope["route"].path if "route" in scope else None
+            perfil.id_usuario = _id_usuario(scope, bytes(corpo))
+            registro_perfis.adiciona(perfil)
+
+    @staticmethod
+    def _token(scope) -> str | None:
+        for nome, valor in scope["headers"]:
+            if nome == b"x-profile":
+                return valor.decode("latin-1")
+        valores = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile")
+        return valores[0] if valores else None
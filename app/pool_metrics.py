@@ -0,0 +1,73 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """
+    Contadores de uso do pool de conexões: quantos checkouts, quanto tempo cada um
+    esperou por uma conexão livre e quantos estouraram o pool_timeout.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registra(self, espera: float, timeout: bool = False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+    def snapshot(self, pool) -> dict:
+        """
+        Estado atual do pool + contadores acumulados.
+        """
+        capacidade = pool.size() + max(pool._max_overflow, 0)
+        em_uso = pool.checkedout()
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "em_uso": em_uso,
+                "ociosas": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "utilizacao": round(em_uso / capacidade, 4) if capacidade > 0 else 0.0,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "espera_total_s": round(self.espera_total, 6),
+                "espera_media_ms": round(1000 * self.espera_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "espera_max_ms": round(1000 * self.espera_max, 3),
+            }
+
+
+class _MedeEsperaMixin:
+    """
+    Mede o tempo de espera por uma conexão em cada checkout do pool.
+    """
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.registra(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.metrics.registra(time.perf_counter() - inicio)
+        return conn
+
+
+def instrumented_pool_class(metrics: PoolMetrics, assincrono: bool = False):
+    """
+    Subclasse de QueuePool (ou AsyncAdaptedQueuePool) que alimenta `metrics`.
+    Usar como create_engine(..., poolclass=instrumented_pool_class(metrics)).
+    """
+    base = AsyncAdaptedQueuePool if assincrono else QueuePool
+    return type(f"Instrumented{base.__name__}", (_MedeEsperaMixin, base), {"metrics": metrics})
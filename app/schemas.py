@@ -1,10 +1,25 @@
-from pydantic import BaseModel
+import os
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 
+# Máximo de usuários por requisição nas rotas :batch (acima disso a API responde 422)
+BATCH_MAX_USUARIOS = int(os.getenv("BATCH_MAX_USUARIOS", "1000"))
+
 # --- Requests ---
 class UserRequestDTO(BaseModel):
     id_usuario: int
 
+class BatchUserRequestDTO(BaseModel):
+    ids_usuarios: List[int] = Field(max_length=BATCH_MAX_USUARIOS)
+
+    @field_validator("ids_usuarios")
+    @classmethod
+    def sem_repetidos(cls, ids_usuarios: List[int]) -> List[int]:
+        # As respostas são indexadas por id_usuario: um id repetido sumiria em silêncio
+        if len(set(ids_usuarios)) != len(ids_usuarios):
+            raise ValueError("ids_usuarios não pode ter ids repetidos.")
+        return ids_usuarios
+
 # --- Responses ---
 
 # 1. /recall/filtra_restricoes
@@ -65,3 +80,16 @@ class KNNRecommendationResponseDTO(BaseModel):
     recomendacoes: Optional[List[int]] = None
     message: Optional[str] = None
 
+# 6. Versões em lote (:batch) - um resultado por usuário
+class RecallBatchItemDTO(BaseModel):
+    id_usuario: int
+    id_refeicoes_candidatas: List[int]
+
+class RecallBatchResponseDTO(BaseModel):
+    resultados: List[RecallBatchItemDTO]
+
+class RankeiaScoreBatchResponseDTO(BaseModel):
+    resultados: List[RankeiaScoreResponseDTO]
+
+class KNNRecommendationBatchResponseDTO(BaseModel):
+    resultados: List[KNNRecommendationResponseDTO]
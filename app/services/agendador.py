@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from typing import Callable
+from sqlmodel import Session
+from services.ml.model_registry import model_registry, DOMINIOS
+from services.indice_restricoes import indice_restricoes
+from services.estatisticas_restaurantes import estatisticas_restaurantes
+from services.catalogo import catalogo
+
+# Intervalo (segundos) entre os ciclos do agendador (padrão: o antigo KNN_REFRESH_INTERVAL)
+AGENDADOR_INTERVALO = int(os.getenv("AGENDADOR_INTERVALO", os.getenv("KNN_REFRESH_INTERVAL", "60")))
+
+
+class Tarefa:
+    """
+    Uma estrutura reconstruída pelo agendador.
+    - precisa(session): consulta barata que diz se a estrutura está desatualizada
+    - executa(session): atualiza (delta quando possível) e publica com troca atômica da referência
+    """
+    def __init__(self, nome: str, executa: Callable[[Session], object], precisa: Callable[[Session], bool]):
+        self.nome = nome
+        self.executa = executa
+        self.precisa = precisa
+        self.ultima_duracao: float | None = None
+        self.ultimo_build_em: float | None = None
+        self.execucoes = 0
+        self.erros = 0
+        self.ultimo_erro: str | None = None
+
+    def status(self) -> dict:
+        agora = time.time()
+        return {
+            "ultima_duracao_s": None if self.ultima_duracao is None else round(self.ultima_duracao, 4),
+            "idade_s": None if self.ultimo_build_em is None else round(agora - self.ultimo_build_em, 1),
+            "execucoes": self.execucoes,
+            "erros": self.erros,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+class AgendadorRetreino:
+    """
+    Reconstrói em segundo plano os modelos KNN/fatoração e os snapshots do ranking (índice de
+    restrições, catálogo e estatísticas), numa única thread: a cada `intervalo` segundos, ou
+    assim que disparar() for chamado, cada tarefa desatualizada é reconstruída. Como há um único
+    executor, nunca roda mais de uma reconstrução ao mesmo tempo; disparos durante um ciclo são
+    agrupados no ciclo seguinte. As requisições continuam lendo a referência antiga até a troca.
+    """
+    def __init__(self, intervalo: int = AGENDADOR_INTERVALO):
+        self.intervalo = intervalo
+        self.tarefas: dict[str, Tarefa] = {}
+        self._engine = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._acorda = threading.Event()
+        self._forcar: set[str] = set()
+        self._lock = threading.Lock()
+        self._executando: str | None = None
+        self.ultimo_ciclo_em: float | None = None
+        self.ultimo_ciclo_duracao: float | None = None
+
+    def registra(self, nome: str, executa: Callable[[Session], object], precisa: Callable[[Session], bool]):
+        self.tarefas[nome] = Tarefa(nome, executa, precisa)
+
+    def disparar(self, nomes: list[str] | None = None, forcar: bool = False):
+        """
+        Gatilho de mudança: antecipa o próximo ciclo. Com forcar=True, reconstrói as tarefas
+        pedidas (padrão: todas) mesmo sem mudança de versão.
+        """
+        if forcar:
+            with self._lock:
+                self._forcar.update(nomes or self.tarefas)
+        self._acorda.set()
+
+    def ciclo(self, session: Session) -> list[str]:
+        """
+        Verifica e reconstrói as tarefas desatualizadas. Retorna as reconstruídas.
+        """
+        inicio = time.time()
+        with self._lock:
+            forcar, self._forcar = self._forcar, set()
+        reconstruidas = []
+        for tarefa in self.tarefas.values():
+            try:
+                if tarefa.nome not in forcar and not tarefa.precisa(session):
+                    continue
+                self._executando = tarefa.nome
+                t0 = time.perf_counter()
+                tarefa.executa(session)
+                tarefa.ultima_duracao = time.perf_counter() - t0
+                tarefa.ultimo_build_em = time.time()
+                tarefa.execucoes += 1
+                reconstruidas.append(tarefa.nome)
+            except Exception as e:
+                tarefa.erros += 1
+                tarefa.ultimo_erro = str(e)
+                print(f"Erro ao reconstruir '{tarefa.nome}': {e}")
+            finally:
+                self._executando = None
+        self.ultimo_ciclo_em = time.time()
+        self.ultimo_ciclo_duracao = self.ultimo_ciclo_em - inicio
+        return reconstruidas
+
+    def marca_construido(self, nomes: list[str] | None = None):
+        """
+        Registra como recém-construídas as estruturas montadas fora do agendador (ex.: no startup).
+        """
+        for nome in nomes or self.tarefas:
+            self.tarefas[nome].ultimo_build_em = time.time()
+
+    def start(self, engine):
+        """
+        Inicia a thread daemon do agendador e passa a ser o responsável por atualizar os snapshots
+        (as requisições deixam de conferir a versão e nunca esperam uma reconstrução).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._engine = engine
+        self._stop.clear()
+        for holder in (indice_restricoes, catalogo, estatisticas_restaurantes):
+            holder.segundo_plano = True
+
+        def _loop():
+            while not self._stop.is_set():
+                self._acorda.wait(self.intervalo)
+                self._acorda.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    with Session(self._engine) as session:
+                        reconstruidas = self.ciclo(session)
+                    if reconstruidas:
+                        print(f"Agendador: reconstruídos {reconstruidas}")
+                except Exception as e:
+                    print(f"Erro no ciclo do agendador: {e}")
+
+        self._thread = threading.Thread(target=_loop, name="agendador-retreino", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._acorda.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for holder in (indice_restricoes, catalogo, estatisticas_restaurantes):
+            holder.segundo_plano = False
+
+    def status(self) -> dict:
+        agora = time.time()
+        return {
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            "intervalo_s": self.intervalo,
+            "executando": self._executando,
+            "ultimo_ciclo_duracao_s": None if self.ultimo_ciclo_duracao is None else round(self.ultimo_ciclo_duracao, 4),
+            "ultimo_ciclo_idade_s": None if self.ultimo_ciclo_em is None else round(agora - self.ultimo_ciclo_em, 1),
+            "tarefas": {nome: tarefa.status() for nome, tarefa in self.tarefas.items()},
+        }
+
+
+def _tarefa_modelo(dominio: str):
+    def executa(session: Session):
+        return model_registry.atualiza(session, dominio)
+
+    def precisa(session: Session) -> bool:
+        return model_registry.desatualizado(session, dominio)
+    return executa, precisa
+
+
+def _agendador_padrao() -> AgendadorRetreino:
+    agendador = AgendadorRetreino()
+    # Snapshots do ranking primeiro: são baratos e usados por quase todas as rotas
+    agendador.registra("indice_restricoes", indice_restricoes.atualiza, indice_restricoes.desatualizado)
+    agendador.registra("catalogo", catalogo.atualiza, catalogo.desatualizado)
+    agendador.registra("estatisticas", estatisticas_restaurantes.atualiza, estatisticas_restaurantes.desatualizado)
+    for dominio in DOMINIOS:
+        agendador.registra(f"modelo_{dominio}", *_tarefa_modelo(dominio))
+    return agendador
+
+
+# Instância única compartilhada pela aplicação
+agendador = _agendador_padrao()
@@ -0,0 +1,246 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Callable
+from sqlmodel import Session
+from services.indice_restricoes import indice_restricoes
+from services.estatisticas_restaurantes import estatisticas_restaurantes
+from services.catalogo import catalogo
+from services.ml.model_registry import model_registry
+
+# Backend do cache de resultados: "memoria" (padrão), "redis" ou "desligado"
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memoria").lower()
+# Tempo de vida (segundos) de cada resultado
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+# Máximo de resultados no backend em memória (LRU)
+RESULT_CACHE_MAX_ITEMS = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "10000"))
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESULT_CACHE_PREFIXO = os.getenv("RESULT_CACHE_PREFIXO", "meal4you:resultados")
+
+
+class MemoriaBackend:
+    """
+    LRU + TTL dentro do processo. Guarda os objetos como estão (sem serializar):
+    quem lê um resultado do cache não deve alterá-lo.
+    """
+    def __init__(self, max_itens: int = RESULT_CACHE_MAX_ITEMS):
+        self.max_itens = max_itens
+        self._itens: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.time():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave: str, valor, ttl: int):
+        with self._lock:
+            self._itens[chave] = (time.time() + ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def geracao(self) -> int:
+        return self._geracao
+
+    def nova_geracao(self) -> int:
+        with self._lock:
+            self._geracao += 1
+            self._itens.clear()
+            return self._geracao
+
+    def __len__(self):
+        return len(self._itens)
+
+
+def _json_default(valor):
+    # Decimal (ex.: preço vindo do ORM) vira float, como na serialização dos DTOs
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"{type(valor).__name__} não é serializável em JSON")
+
+
+class RedisBackend:
+    """
+    Backend compartilhado entre processos/instâncias. Aceita qualquer cliente compatível com
+    redis-py (get, set(ex=), incr), ex.: redis.Redis ou um substituto local em desenvolvimento.
+    A geração fica no próprio Redis, então invalidar em uma instância vale para todas.
+    O LRU fica a cargo do Redis (maxmemory-policy allkeys-lru); o TTL vai em cada chave.
+    """
+    def __init__(self, cliente=None, url: str = RESULT_CACHE_REDIS_URL, prefixo: str = RESULT_CACHE_PREFIXO):
+        if cliente is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("RESULT_CACHE_BACKEND=redis requer o pacote 'redis'.") from e
+            cliente = redis.Redis.from_url(url)
+        self.cliente = cliente
+        self.prefixo = prefixo
+
+    def get(self, chave: str):
+        valor = self.cliente.get(f"{self.prefixo}:{chave}")
+        return None if valor is None else json.loads(valor)
+
+    def set(self, chave: str, valor, ttl: int):
+        self.cliente.set(f"{self.prefixo}:{chave}", json.dumps(valor, default=_json_default), ex=ttl)
+
+    def geracao(self) -> int:
+        return int(self.cliente.get(f"{self.prefixo}:geracao") or 0)
+
+    def nova_geracao(self) -> int:
+        # Chaves da geração anterior deixam de ser lidas e expiram pelo TTL
+        return int(self.cliente.incr(f"{self.prefixo}:geracao"))
+
+
+class CacheResultados:
+    """
+    Cache dos resultados por (endpoint, usuário, parâmetros, versão dos dados, geração).
+    - versão dos dados: versões dos snapshots em memória usados pelo cálculo; quando um
+      snapshot é reconstruído a chave muda e o resultado antigo deixa de ser usado
+    - geração: contador incrementado por invalidar(), para escritas que ainda não chegaram
+      aos snapshots (ex.: nova avaliação antes do próximo refresh)
+    """
+    def __init__(self, backend=None, ttl: int = RESULT_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._contadores: dict[str, list[int]] = {}
+
+    @property
+    def habilitado(self) -> bool:
+        return self.backend is not None
+
+    def _conta(self, endpoint: str, hit: bool):
+        with self._lock:
+            contador = self._contadores.setdefault(endpoint, [0, 0])
+            contador[0 if hit else 1] += 1
+
+    def obter(self, endpoint: str, id_usuario: int, params: dict, versao: tuple, calcula: Callable):
+        if not self.habilitado:
+            return calcula()
+        chave = f"{endpoint}:{id_usuario}:{json.dumps(params, sort_keys=True)}:{versao}:{self.backend.geracao()}"
+        valor = self.backend.get(chave)
+        if valor is not None:
+            self._conta(endpoint, hit=True)
+            return valor
+        self._conta(endpoint, hit=False)
+        valor = calcula()
+        self.backend.set(chave, valor, self.ttl)
+        return valor
+
+    def invalidar(self, recarregar_dados: bool = True):
+        """
+        Hook para escritas (avaliações, cardápio, restrições): descarta todos os resultados e,
+        se recarregar_dados, também os snapshots em memória, que são remontados na próxima leitura.
+        """
+        if recarregar_dados:
+            indice_restricoes.invalidar()
+            catalogo.invalidar()
+            estatisticas_restaurantes.invalidar()
+        if self.habilitado:
+            self.backend.nova_geracao()
+
+    def status(self) -> dict:
+        with self._lock:
+            por_endpoint = {
+                endpoint: {"hits": hits, "misses": misses,
+                           "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+                for endpoint, (hits, misses) in self._contadores.items()
+            }
+        hits = sum(c["hits"] for c in por_endpoint.values())
+        misses = sum(c["misses"] for c in por_endpoint.values())
+        return {
+            "backend": type(self.backend).__name__ if self.habilitado else "desligado",
+            "ttl_s": self.ttl,
+            "itens": len(self.backend) if isinstance(self.backend, MemoriaBackend) else None,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "endpoints": por_endpoint,
+        }
+
+
+def versao_recomendador(session: Session) -> tuple:
+    """
+    Versão dos snapshots usados por recall/rankeia_* (índice, catálogo e estatísticas).
+    """
+    estatisticas = estatisticas_restaurantes.get(session)
+    return (
+        indice_restricoes.get(session).versao,
+        catalogo.get(session).versao,
+        (str(estatisticas.watermark), estatisticas.total, sum(estatisticas.soma.values())),
+    )
+
+
+def versao_knn(dominio: str) -> Callable[[Session], tuple]:
+    """
+    Versão do modelo KNN do domínio (+ índice de restrições para as refeições).
+    """
+    def _versao(session: Session) -> tuple:
+        versao = model_registry.get_or_build(session, dominio).versao
+        if dominio == "refeicoes":
+            return versao, indice_restricoes.get(session).versao
+        return versao
+    return _versao
+
+
+def versao_fatoracao(dominio: str) -> Callable[[Session], tuple]:
+    """
+    Versão da fatoração do domínio + snapshots usados no recall dos candidatos (índice e catálogo).
+    """
+    def _versao(session: Session) -> tuple:
+        return (
+            model_registry.get_or_build(session, dominio).versao,
+            indice_restricoes.get(session).versao,
+            catalogo.get(session).versao,
+        )
+    return _versao
+
+
+def cacheado(versao_fn: Callable[[Session], tuple]):
+    """
+    Decora uma função pura de (session, id_usuario, *params), guardando o resultado
+    em cache_resultados sob o nome da função.
+    """
+    def decorator(fn):
+        assinatura = inspect.signature(fn)
+        nome_session, nome_usuario = list(assinatura.parameters)[:2]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            argumentos = assinatura.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            params = dict(argumentos.arguments)
+            session = params.pop(nome_session)
+            id_usuario = params.pop(nome_usuario)
+            return cache_resultados.obter(
+                fn.__name__, id_usuario, params, versao_fn(session),
+                lambda: fn(*args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+def _backend_padrao():
+    if RESULT_CACHE_BACKEND == "redis":
+        return RedisBackend()
+    if RESULT_CACHE_BACKEND == "memoria":
+        return MemoriaBackend()
+    return None
+
+
+# Instância única compartilhada pela aplicação
+cache_resultados = CacheResultados(_backend_padrao())
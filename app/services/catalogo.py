@@ -0,0 +1,215 @@
+import os
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func
+from services.snapshot_holder import SnapshotHolder
+from models.db_models import Refeicao, Restaurante
+
+# Intervalo mínimo (segundos) entre duas verificações de versão do catálogo no banco
+CATALOGO_CHECK_INTERVAL = int(os.getenv("CATALOGO_CHECK_INTERVAL", "30"))
+# Idade máxima (segundos) do catálogo antes de uma reconstrução completa mesmo sem mudança detectada
+CATALOGO_MAX_AGE = int(os.getenv("CATALOGO_MAX_AGE", "3600"))
+
+
+class PoolTextos:
+    """
+    Coluna de textos com cada valor distinto guardado uma única vez: `textos` (valores únicos,
+    None incluído) e `codigos` (int32, posição em `textos` de cada linha).
+    """
+    def __init__(self, textos: list, codigos: np.ndarray):
+        self.textos = textos
+        self.codigos = codigos
+
+    @classmethod
+    def de_valores(cls, valores: list, base: "PoolTextos | None" = None) -> "PoolTextos":
+        """
+        Pool com as linhas de `base` (se houver) seguidas de `valores`, reaproveitando os textos dela.
+        """
+        textos = list(base.textos) if base is not None else []
+        posicao = {texto: i for i, texto in enumerate(textos)}
+        novos = np.empty(len(valores), dtype=np.int32)
+        for i, texto in enumerate(valores):
+            codigo = posicao.get(texto)
+            if codigo is None:
+                codigo = posicao[texto] = len(textos)
+                textos.append(texto)
+            novos[i] = codigo
+        codigos = np.concatenate([base.codigos, novos]) if base is not None else novos
+        return cls(textos, codigos)
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def __getitem__(self, posicao: int):
+        return self.textos[self.codigos[posicao]]
+
+
+class Catalogo:
+    """
+    Snapshot do cardápio em arrays NumPy.
+    - ids_refeicao: ids das refeições em ordem crescente (mesma ordem do índice de restrições)
+    - rest_codigo: int32, posição em ids_restaurante do restaurante de cada refeição
+    - ids_restaurante: ids dos restaurantes que possuem refeições, em ordem crescente
+    - qtd_cardapio: total de refeições (disponíveis ou não) de cada restaurante
+    - precos: float64, preço de cada refeição (o Decimal do banco convertido uma vez, no build)
+    - nomes_refeicao / descricoes: PoolTextos na ordem de ids_refeicao
+    - nomes_restaurante: id_restaurante -> nome
+    """
+    def __init__(self, ids_refeicao: np.ndarray, rest_codigo: np.ndarray, ids_restaurante: np.ndarray,
+                 precos: np.ndarray, nomes_refeicao: PoolTextos, descricoes: PoolTextos,
+                 nomes_restaurante: dict[int, str], versao: tuple):
+        self.ids_refeicao = ids_refeicao
+        self.rest_codigo = rest_codigo
+        self.ids_restaurante = ids_restaurante
+        self.precos = precos
+        self.nomes_refeicao = nomes_refeicao
+        self.descricoes = descricoes
+        self.nomes_restaurante = nomes_restaurante
+        self.qtd_cardapio = np.bincount(rest_codigo, minlength=len(ids_restaurante))
+        self.versao = versao
+
+    def nome_restaurante(self, id_restaurante: int) -> str:
+        return self.nomes_restaurante.get(id_restaurante, "Desconhecido")
+
+    def alinha_mascara(self, ids_refeicao: np.ndarray, mascara: np.ndarray) -> np.ndarray:
+        """
+        Converte uma máscara sobre outro vetor de ids de refeição (ex.: o do índice de restrições)
+        para a ordem deste catálogo. Sem custo quando os dois vetores são iguais.
+        """
+        if ids_refeicao is self.ids_refeicao or np.array_equal(ids_refeicao, self.ids_refeicao):
+            return mascara
+        return np.isin(self.ids_refeicao, ids_refeicao[mascara])
+
+    def contagem_compativeis(self, mascara: np.ndarray) -> np.ndarray:
+        """
+        Quantidade de refeições marcadas na máscara por restaurante (um np.bincount).
+        """
+        return np.bincount(self.rest_codigo[mascara], minlength=len(self.ids_restaurante))
+
+    def restaurantes_compativeis(self, mascara: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Códigos dos restaurantes com ao menos uma refeição na máscara, na ordem da primeira
+        refeição (menor id) de cada um, e a contagem de refeições marcadas de cada um.
+        """
+        codigos_refeicoes = self.rest_codigo[mascara]
+        codigos, primeira = np.unique(codigos_refeicoes, return_index=True)
+        codigos = codigos[np.argsort(primeira, kind="stable")]
+        contagem = self.contagem_compativeis(mascara)
+        return codigos, contagem[codigos]
+
+
+def _checksum_linhas(session: Session, *colunas):
+    """
+    Soma de um checksum por linha das colunas: SUM(CRC32(CONCAT_WS('|', ...))) no MySQL, que muda
+    com qualquer edição (inclusive trocar valores entre linhas). Nos outros bancos (SQLite do
+    desenvolvimento e do benchmark) é a soma dos tamanhos: edições de mesmo tamanho só aparecem
+    na reconstrução completa por CATALOGO_MAX_AGE.
+    """
+    if session.get_bind().dialect.name == "mysql":
+        return func.sum(func.crc32(func.concat_ws("|", *colunas)))
+    return func.sum(sum(func.coalesce(func.length(coluna), 0) for coluna in colunas[1:]))
+
+
+def _conteudo_refeicoes(session: Session, max_id: int | None = None) -> tuple:
+    """
+    Checksum das colunas exibidas (soma dos preços em centavos e checksum de id, nome, descrição
+    e preço), de todas as refeições ou só das com id <= max_id. Pega as edições que não mexem nos ids.
+    """
+    stmt = select(
+        func.sum(Refeicao.preco),
+        _checksum_linhas(session, Refeicao.id_refeicao, Refeicao.nome, Refeicao.descricao, Refeicao.preco)
+    )
+    if max_id is not None:
+        stmt = stmt.where(Refeicao.id_refeicao <= max_id)
+    preco, checksum = session.exec(stmt).one()
+    return int(round(float(preco or 0) * 100)), int(checksum or 0)
+
+
+def versao_catalogo(session: Session) -> tuple:
+    """
+    Impressão digital barata de refeicao/restaurante: contagens e somas de ids ([0:3] e [5:7]),
+    checksum do conteúdo das refeições ([3:5]) e dos nomes dos restaurantes ([7]).
+    """
+    ref = session.exec(select(
+        func.count(), func.sum(Refeicao.id_refeicao), func.sum(Refeicao.id_restaurante)
+    )).one()
+    rest = session.exec(select(
+        func.count(), func.sum(Restaurante.id_restaurante),
+        _checksum_linhas(session, Restaurante.id_restaurante, Restaurante.nome)
+    )).one()
+    return (
+        tuple(int(v or 0) for v in ref) + _conteudo_refeicoes(session) + tuple(int(v or 0) for v in rest)
+    )
+
+
+def _le_refeicoes(session: Session, min_id: int = 0):
+    """
+    Colunas das refeições com id > min_id em ordem de id: (ids, ids_restaurante, preços, nomes, descrições).
+    """
+    rows = session.exec(
+        select(Refeicao.id_refeicao, Refeicao.id_restaurante, Refeicao.preco, Refeicao.nome, Refeicao.descricao)
+        .where(Refeicao.id_refeicao > min_id)
+        .order_by(Refeicao.id_refeicao)
+    ).all()
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    restaurantes = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    precos = np.fromiter((float(r[2]) for r in rows), dtype=np.float64, count=len(rows))
+    return ids, restaurantes, precos, [r[3] for r in rows], [r[4] for r in rows]
+
+
+def _le_nomes_restaurantes(session: Session) -> dict[int, str]:
+    return {
+        rid: nome
+        for rid, nome in session.exec(select(Restaurante.id_restaurante, Restaurante.nome)).all()
+    }
+
+
+def build_catalogo(session: Session) -> Catalogo:
+    versao = versao_catalogo(session)
+
+    ids_refeicao, restaurantes, precos, nomes_refeicao, descricoes = _le_refeicoes(session)
+    ids_restaurante, rest_codigo = np.unique(restaurantes, return_inverse=True)
+    return Catalogo(
+        ids_refeicao, rest_codigo.astype(np.int32), ids_restaurante, precos,
+        PoolTextos.de_valores(nomes_refeicao), PoolTextos.de_valores(descricoes),
+        _le_nomes_restaurantes(session), versao
+    )
+
+
+def atualiza_catalogo(session: Session, atual: Catalogo) -> Catalogo | None:
+    """
+    Acrescenta ao catálogo atual só as refeições novas (id maior que o último) e relê os nomes
+    quando a tabela de restaurantes mudou. Remoções, refeições trocadas de restaurante ou
+    refeições antigas editadas (somas que não batem) retornam None: reconstrução completa.
+    """
+    versao = versao_catalogo(session)
+    if versao == atual.versao:
+        return atual
+    max_id = int(atual.ids_refeicao[-1]) if len(atual.ids_refeicao) else 0
+    if _conteudo_refeicoes(session, max_id) != atual.versao[3:5]:
+        return None
+    ids_novas, rest_novas, precos_novas, nomes_novas, descricoes_novas = _le_refeicoes(session, max_id)
+    esperado = (atual.versao[0] + len(ids_novas), atual.versao[1] + int(ids_novas.sum()),
+                atual.versao[2] + int(rest_novas.sum()))
+    if tuple(versao[:3]) != esperado:
+        return None
+
+    ids_refeicao = np.concatenate([atual.ids_refeicao, ids_novas])
+    restaurantes = np.concatenate([atual.ids_restaurante[atual.rest_codigo], rest_novas])
+    ids_restaurante, rest_codigo = np.unique(restaurantes, return_inverse=True)
+
+    nomes = atual.nomes_restaurante
+    if versao[5:] != atual.versao[5:]:
+        nomes = _le_nomes_restaurantes(session)
+    return Catalogo(
+        ids_refeicao, rest_codigo.astype(np.int32), ids_restaurante,
+        np.concatenate([atual.precos, precos_novas]),
+        PoolTextos.de_valores(nomes_novas, atual.nomes_refeicao),
+        PoolTextos.de_valores(descricoes_novas, atual.descricoes),
+        nomes, versao
+    )
+
+
+# Instância única compartilhada pela aplicação
+catalogo = SnapshotHolder("catalogo", build_catalogo, versao_catalogo, CATALOGO_CHECK_INTERVAL, atualiza_catalogo,
+                          max_age=CATALOGO_MAX_AGE)
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from datetime import date
+import numpy as np
+from sqlmodel import Session, select, col
+from sqlalchemy import func
+from models.db_models import UsuarioAvalia
+from services.snapshot_holder import SnapshotIndisponivel, em_somente_leitura
+
+# Intervalo mínimo (segundos) entre duas atualizações incrementais pela marca d'água
+ESTATISTICAS_CHECK_INTERVAL = int(os.getenv("ESTATISTICAS_CHECK_INTERVAL", "30"))
+# Intervalo (segundos) entre recálculos completos (captura exclusões de avaliações)
+ESTATISTICAS_FULL_INTERVAL = int(os.getenv("ESTATISTICAS_FULL_INTERVAL", "3600"))
+
+
+class EstatisticasRestaurantes:
+    """
+    Soma e quantidade de notas por restaurante (usuario_avalia), com média e
+    quantidade máxima global. Imutável: cada atualização gera uma nova instância.
+    """
+    def __init__(self, soma: dict[int, int], qtd: dict[int, int], watermark: date | None):
+        self.soma = soma
+        self.qtd = qtd
+        self.watermark = watermark
+        self.total = sum(qtd.values())
+        self.max_qtd = max(qtd.values(), default=0)
+        # (versão do catálogo, soma, qtd) alinhados a Catalogo.ids_restaurante (ver alinhadas)
+        self._alinhadas = None
+
+    def media(self, id_restaurante: int) -> float:
+        qtd = self.qtd.get(id_restaurante, 0)
+        return (self.soma[id_restaurante] / qtd) if qtd > 0 else 0.0
+
+    def qtd_avaliacoes(self, id_restaurante: int) -> int:
+        return self.qtd.get(id_restaurante, 0)
+
+    def alinhadas(self, cat) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (média, quantidade de notas) de cada restaurante de cat.ids_restaurante, como arrays.
+        Montados uma vez por versão do catálogo (estas estatísticas já são de uma versão só).
+        """
+        alinhadas = self._alinhadas
+        if alinhadas is None or alinhadas[0] != cat.versao:
+            ids = cat.ids_restaurante.tolist()
+            soma = np.array([self.soma.get(rid, 0) for rid in ids], dtype=np.float64)
+            qtd = np.array([self.qtd.get(rid, 0) for rid in ids], dtype=np.int64)
+            media = np.divide(soma, qtd, out=np.zeros(len(ids)), where=qtd > 0)
+            alinhadas = self._alinhadas = (cat.versao, media, qtd)
+        return alinhadas[1], alinhadas[2]
+
+
+def _agrega(session: Session, ids_restaurantes: list[int] | None = None) -> tuple[dict, dict]:
+    """
+    SUM/COUNT de nota por restaurante (de todos ou só dos informados).
+    """
+    stmt = select(
+        UsuarioAvalia.id_restaurante,
+        func.sum(UsuarioAvalia.nota),
+        func.count(UsuarioAvalia.nota)
+    ).group_by(UsuarioAvalia.id_restaurante)
+    if ids_restaurantes is not None:
+        stmt = stmt.where(col(UsuarioAvalia.id_restaurante).in_(ids_restaurantes))
+
+    soma, qtd = {}, {}
+    for rid, s, n in session.exec(stmt).all():
+        soma[rid] = int(s or 0)
+        qtd[rid] = int(n)
+    return soma, qtd
+
+
+def _watermark(session: Session) -> date | None:
+    return session.exec(select(func.max(UsuarioAvalia.data_avaliacao))).one()
+
+
+def build_estatisticas(session: Session) -> EstatisticasRestaurantes:
+    """
+    Recálculo completo: um único GROUP BY sobre usuario_avalia.
+    """
+    watermark = _watermark(session)
+    soma, qtd = _agrega(session)
+    return EstatisticasRestaurantes(soma, qtd, watermark)
+
+
+def atualiza_incremental(session: Session, atual: EstatisticasRestaurantes) -> EstatisticasRestaurantes:
+    """
+    Reagrega só os restaurantes com avaliações em data_avaliacao >= marca d'água
+    (inserções e edições). Se a contagem ou a soma total das notas não baterem (exclusões ou
+    edições com data anterior à marca d'água), recalcula tudo.
+    """
+    if atual.watermark is None:
+        return build_estatisticas(session)
+
+    novo_watermark = _watermark(session)
+    afetados = session.exec(
+        select(UsuarioAvalia.id_restaurante)
+        .where(UsuarioAvalia.data_avaliacao >= atual.watermark)
+        .distinct()
+    ).all()
+
+    soma, qtd = dict(atual.soma), dict(atual.qtd)
+    if afetados:
+        soma_afetados, qtd_afetados = _agrega(session, list(afetados))
+        for rid in afetados:
+            soma[rid] = soma_afetados.get(rid, 0)
+            qtd[rid] = qtd_afetados.get(rid, 0)
+
+    novo = EstatisticasRestaurantes(soma, qtd, novo_watermark)
+    total_banco, soma_banco = session.exec(select(func.count(), func.sum(UsuarioAvalia.nota))).one()
+    if (int(total_banco), int(soma_banco or 0)) != (novo.total, sum(novo.soma.values())):
+        return build_estatisticas(session)
+    return novo
+
+
+class EstatisticasRestaurantesHolder:
+    """
+    Cache compartilhado das estatísticas. Atualiza de forma incremental no máximo a cada
+    ESTATISTICAS_CHECK_INTERVAL segundos e recalcula tudo a cada ESTATISTICAS_FULL_INTERVAL.
+    """
+    def __init__(self, check_interval: int = ESTATISTICAS_CHECK_INTERVAL,
+                 full_interval: int = ESTATISTICAS_FULL_INTERVAL):
+        self.check_interval = check_interval
+        self.full_interval = full_interval
+        self._estatisticas: EstatisticasRestaurantes | None = None
+        self._verificado_em = 0.0
+        self._completo_em = 0.0
+        self._lock = threading.Lock()
+        # True quando o agendador (services/agendador.py) é quem atualiza; get() não espera atualização
+        self.segundo_plano = False
+
+    def invalidar(self):
+        self._estatisticas = None
+
+    def _vencido(self, agora: float) -> bool:
+        return self._estatisticas is None or agora - self._completo_em > self.full_interval
+
+    def build(self, session: Session, se_vencido: bool = False) -> EstatisticasRestaurantes:
+        """
+        Recalcula tudo. Com se_vencido=True (get) o vencimento é conferido de novo já com o lock:
+        requisições que esperavam o mesmo recálculo recebem o snapshot recém-publicado.
+        """
+        with self._lock:
+            if se_vencido and not self._vencido(time.time()):
+                return self._estatisticas
+            estatisticas = build_estatisticas(session)
+            self._estatisticas = estatisticas
+            self._verificado_em = self._completo_em = time.time()
+            return estatisticas
+
+    def atualiza(self, session: Session, se_vencido: bool = False) -> EstatisticasRestaurantes:
+        """
+        Atualização incremental (ou completa, a cada full_interval), com troca atômica da referência.
+        Com se_vencido=True (get) só atualiza se ninguém verificou o banco enquanto esperava o lock.
+        """
+        if self._vencido(time.time()):
+            return self.build(session, se_vencido)
+        with self._lock:
+            if se_vencido and self._estatisticas is not None and time.time() - self._verificado_em <= self.check_interval:
+                return self._estatisticas
+            self._verificado_em = time.time()
+            atual = self._estatisticas
+            if atual is None:
+                estatisticas = build_estatisticas(session)
+            else:
+                estatisticas = atualiza_incremental(session, atual)
+            self._estatisticas = estatisticas
+            return estatisticas
+
+    def desatualizado(self, session: Session) -> bool:
+        """
+        Confere (contagem, soma das notas, marca d'água) do banco contra o snapshot.
+        """
+        atual = self._estatisticas
+        if atual is None or time.time() - self._completo_em > self.full_interval:
+            return True
+        row = session.exec(select(
+            func.count(), func.sum(UsuarioAvalia.nota), func.max(UsuarioAvalia.data_avaliacao)
+        )).one()
+        return (int(row[0]), int(row[1] or 0), row[2]) != (atual.total, sum(atual.soma.values()), atual.watermark)
+
+    def get(self, session: Session) -> EstatisticasRestaurantes:
+        estatisticas = self._estatisticas
+        agora = time.time()
+        if em_somente_leitura():
+            if estatisticas is None:
+                raise SnapshotIndisponivel("estatisticas")
+            return estatisticas
+        if estatisticas is None:
+            return self.build(session, se_vencido=True)
+        if self.segundo_plano:
+            return estatisticas
+        if agora - self._completo_em > self.full_interval:
+            return self.build(session, se_vencido=True)
+        if agora - self._verificado_em > self.check_interval:
+            return self.atualiza(session, se_vencido=True)
+        return estatisticas
+
+
+# Instância única compartilhada pela aplicação
+estatisticas_restaurantes = EstatisticasRestaurantesHolder()
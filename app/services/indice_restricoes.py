@@ -0,0 +1,225 @@
+import os
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func, case
+from services.snapshot_holder import SnapshotHolder
+from models.db_models import (
+    UsuarioRestricao,
+    IngredienteRestricao,
+    RefeicaoIngrediente,
+    Refeicao
+)
+
+# Intervalo mínimo (segundos) entre duas verificações de versão das tabelas no banco
+RESTRICOES_CHECK_INTERVAL = int(os.getenv("RESTRICOES_CHECK_INTERVAL", "30"))
+
+
+class IndiceRestricoes:
+    """
+    Índice em memória para o recall por restrição.
+    - ids_refeicao: ids de todas as refeições em ordem crescente (linha do bitset = posição aqui)
+    - disponiveis: bitset (np.packbits) das refeições com disponivel = True
+    - proibidas: id_restricao -> bitset das refeições com algum ingrediente ligado à restrição
+    - restricoes_usuario: id_usuario -> ids das restrições do usuário
+    """
+    def __init__(self, ids_refeicao: np.ndarray, disponiveis: np.ndarray,
+                 proibidas: dict[int, np.ndarray], restricoes_usuario: dict[int, tuple], versao: tuple):
+        self.ids_refeicao = ids_refeicao
+        self.disponiveis = disponiveis
+        self.proibidas = proibidas
+        self.restricoes_usuario = restricoes_usuario
+        self.versao = versao
+
+    def _bitset_proibidas(self, id_usuario: int) -> np.ndarray | None:
+        bitsets = [self.proibidas[r] for r in self.restricoes_usuario.get(id_usuario, ()) if r in self.proibidas]
+        if not bitsets:
+            return None
+        return np.bitwise_or.reduce(bitsets)
+
+    def mascara_proibidas(self, id_usuario: int) -> np.ndarray:
+        """
+        Máscara booleana (uma posição por refeição) das refeições proibidas para o usuário.
+        """
+        bits = self._bitset_proibidas(id_usuario)
+        if bits is None:
+            return np.zeros(len(self.ids_refeicao), dtype=bool)
+        return np.unpackbits(bits, count=len(self.ids_refeicao)).astype(bool)
+
+    def mascara_candidatas(self, id_usuario: int) -> np.ndarray:
+        """
+        Máscara booleana das refeições disponíveis e seguras: disponiveis AND NOT (OR das restrições).
+        """
+        bits = self.disponiveis
+        proibidas = self._bitset_proibidas(id_usuario)
+        if proibidas is not None:
+            bits = bits & ~proibidas
+        return np.unpackbits(bits, count=len(self.ids_refeicao)).astype(bool)
+
+    def candidatos(self, id_usuario: int) -> list[int]:
+        return self.ids_refeicao[self.mascara_candidatas(id_usuario)].tolist()
+
+    def remove_proibidas(self, id_usuario: int, ids: list[int]) -> list[int]:
+        """
+        Remove de `ids` as refeições proibidas para o usuário, mantendo a ordem.
+        """
+        if not ids or id_usuario not in self.restricoes_usuario:
+            return list(ids)
+        proibidas = self.ids_refeicao[self.mascara_proibidas(id_usuario)]
+        ids_arr = np.asarray(ids)
+        return ids_arr[~np.isin(ids_arr, proibidas)].tolist()
+
+
+def versao_tabelas(session: Session) -> tuple:
+    """
+    Impressão digital barata das tabelas usadas pelo índice (contagens, somas e maior id).
+    Qualquer inserção/remoção ou troca de 'disponivel' altera o resultado.
+    """
+    ref = session.exec(select(
+        func.count(),
+        func.sum(case((Refeicao.disponivel == True, Refeicao.id_refeicao), else_=0)),
+        func.max(Refeicao.id_refeicao)
+    )).one()
+    ing_restr = session.exec(select(
+        func.count(), func.sum(IngredienteRestricao.id_ingrediente), func.sum(IngredienteRestricao.id_restricao)
+    )).one()
+    ref_ing = session.exec(select(
+        func.count(), func.sum(RefeicaoIngrediente.id_ingrediente), func.sum(RefeicaoIngrediente.id_refeicao)
+    )).one()
+    usr_restr = session.exec(select(
+        func.count(), func.sum(UsuarioRestricao.id_usuario), func.sum(UsuarioRestricao.id_restricao)
+    )).one()
+    return tuple(int(v or 0) for row in (ref, ing_restr, ref_ing, usr_restr) for v in row)
+
+
+def build_indice(session: Session) -> IndiceRestricoes:
+    """
+    Lê as tabelas de refeições, ingredientes e restrições uma vez e monta os bitsets.
+    """
+    versao = versao_tabelas(session)
+
+    ref_rows = session.exec(select(Refeicao.id_refeicao, Refeicao.disponivel)).all()
+    ref = np.array(ref_rows, dtype=np.int64).reshape(-1, 2)
+    order = np.argsort(ref[:, 0], kind="stable")
+    ids_refeicao = ref[order, 0]
+    disponiveis = np.packbits(ref[order, 1].astype(bool))
+
+    # ingrediente -> restrições
+    restr_por_ingrediente: dict[int, list[int]] = {}
+    for id_ing, id_restr in session.exec(select(IngredienteRestricao.id_ingrediente, IngredienteRestricao.id_restricao)).all():
+        restr_por_ingrediente.setdefault(id_ing, []).append(id_restr)
+
+    # restrição -> linhas de refeições proibidas
+    linhas_por_restricao: dict[int, list[int]] = {}
+    ref_ing = np.array(
+        session.exec(select(RefeicaoIngrediente.id_ingrediente, RefeicaoIngrediente.id_refeicao)).all(),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    if len(ids_refeicao) and len(ref_ing):
+        linhas = np.searchsorted(ids_refeicao, ref_ing[:, 1]).clip(max=len(ids_refeicao) - 1)
+        existe = ids_refeicao[linhas] == ref_ing[:, 1]
+        for id_ing, linha in zip(ref_ing[existe, 0].tolist(), linhas[existe].tolist()):
+            for id_restr in restr_por_ingrediente.get(id_ing, ()):
+                linhas_por_restricao.setdefault(id_restr, []).append(linha)
+
+    proibidas = {}
+    for id_restr, linhas in linhas_por_restricao.items():
+        mask = np.zeros(len(ids_refeicao), dtype=bool)
+        mask[linhas] = True
+        proibidas[id_restr] = np.packbits(mask)
+
+    return IndiceRestricoes(ids_refeicao, disponiveis, proibidas, _le_restricoes_usuario(session), versao)
+
+
+def _le_restricoes_usuario(session: Session) -> dict[int, tuple]:
+    restricoes_usuario: dict[int, list[int]] = {}
+    for id_restr, id_usuario in session.exec(select(UsuarioRestricao.id_restricao, UsuarioRestricao.id_usuario)).all():
+        restricoes_usuario.setdefault(id_usuario, []).append(id_restr)
+    return {u: tuple(r) for u, r in restricoes_usuario.items()}
+
+
+def atualiza_indice(session: Session, atual: IndiceRestricoes) -> IndiceRestricoes | None:
+    """
+    Aplica ao índice atual só o que mudou, sem reler as tabelas inteiras:
+    - refeições novas (id maior que o último do índice) entram no fim dos bitsets, com os
+      ingredientes delas lidos agora
+    - troca de 'disponivel' em refeições existentes: relê só (id, disponivel)
+    - usuario_restricao alterada: relê só essa tabela
+    Retorna None (reconstrução completa) quando ingrediente_restricao mudou, quando houve remoções
+    ou quando os ingredientes de refeições antigas foram alterados.
+    """
+    versao = versao_tabelas(session)
+    if versao == atual.versao:
+        return atual
+    if versao[3:6] != atual.versao[3:6]:
+        return None
+
+    n = len(atual.ids_refeicao)
+    max_id = int(atual.ids_refeicao[-1]) if n else 0
+    novas = np.array(
+        session.exec(select(Refeicao.id_refeicao, Refeicao.disponivel).where(Refeicao.id_refeicao > max_id)).all(),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    novas = novas[np.argsort(novas[:, 0], kind="stable")]
+    if n + len(novas) != versao[0]:
+        return None
+    ref_ing = np.array(
+        session.exec(select(RefeicaoIngrediente.id_ingrediente, RefeicaoIngrediente.id_refeicao)
+                     .where(RefeicaoIngrediente.id_refeicao > max_id)).all(),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    esperado = (atual.versao[6] + len(ref_ing), atual.versao[7] + int(ref_ing[:, 0].sum()),
+                atual.versao[8] + int(ref_ing[:, 1].sum()))
+    if tuple(versao[6:9]) != esperado:
+        return None
+
+    ids_refeicao = np.concatenate([atual.ids_refeicao, novas[:, 0]]) if len(novas) else atual.ids_refeicao
+    total = len(ids_refeicao)
+    disponiveis = atual.disponiveis
+    if versao[1] != atual.versao[1] + int(novas[novas[:, 1] == 1, 0].sum()):
+        # Troca de disponibilidade em refeições antigas: relê só a coluna
+        ref = np.array(session.exec(select(Refeicao.id_refeicao, Refeicao.disponivel)).all(), dtype=np.int64).reshape(-1, 2)
+        ref = ref[np.argsort(ref[:, 0], kind="stable")]
+        if not np.array_equal(ref[:, 0], ids_refeicao):
+            return None
+        disponiveis = np.packbits(ref[:, 1].astype(bool))
+    elif len(novas):
+        flags = np.unpackbits(atual.disponiveis, count=n).astype(bool)
+        disponiveis = np.packbits(np.concatenate([flags, novas[:, 1].astype(bool)]))
+
+    proibidas = atual.proibidas
+    if len(novas):
+        # Linhas novas das restrições, pelos ingredientes das refeições novas
+        restr_por_ingrediente: dict[int, list[int]] = {}
+        if len(ref_ing):
+            ingredientes = np.unique(ref_ing[:, 0]).tolist()
+            for id_ing, id_restr in session.exec(
+                select(IngredienteRestricao.id_ingrediente, IngredienteRestricao.id_restricao)
+                .where(IngredienteRestricao.id_ingrediente.in_(ingredientes))
+            ).all():
+                restr_por_ingrediente.setdefault(id_ing, []).append(id_restr)
+        linhas_por_restricao: dict[int, list[int]] = {}
+        linhas = np.searchsorted(novas[:, 0], ref_ing[:, 1]).clip(max=max(len(novas) - 1, 0))
+        existe = novas[linhas, 0] == ref_ing[:, 1]
+        for id_ing, linha in zip(ref_ing[existe, 0].tolist(), (n + linhas[existe]).tolist()):
+            for id_restr in restr_por_ingrediente.get(id_ing, ()):
+                linhas_por_restricao.setdefault(id_restr, []).append(linha)
+
+        proibidas = {}
+        for id_restr in set(atual.proibidas) | set(linhas_por_restricao):
+            mask = np.zeros(total, dtype=bool)
+            if id_restr in atual.proibidas:
+                mask[:n] = np.unpackbits(atual.proibidas[id_restr], count=n).astype(bool)
+            mask[linhas_por_restricao.get(id_restr, [])] = True
+            proibidas[id_restr] = np.packbits(mask)
+
+    restricoes_usuario = atual.restricoes_usuario
+    if versao[9:] != atual.versao[9:]:
+        restricoes_usuario = _le_restricoes_usuario(session)
+
+    return IndiceRestricoes(ids_refeicao, disponiveis, proibidas, restricoes_usuario, versao)
+
+
+# Instância única compartilhada pela aplicação
+indice_restricoes = SnapshotHolder(
+    "indice_restricoes", build_indice, versao_tabelas, RESTRICOES_CHECK_INTERVAL, atualiza_indice
+)
@@ -1,133 +1,113 @@
-from sqlmodel import Session, select, col
-from models.db_models import (
-    UsuarioAvalia, RefeicaoAvalia, UsuarioRestricao,
-    IngredienteRestricao, RefeicaoIngrediente
-)
-from services.ml.pre_pocessing.processor import create_user_restaurant_matrix, create_user_meal_matrix
-from services.ml.recomendador_knn import KNNRecommender
-
-def get_restaurant_recommendations(session: Session, user_id: int, k=16, min_score: float = 3.0):
+from sqlmodel import Session
+from services.ml.model_registry import model_registry
+from services.indice_restricoes import indice_restricoes
+from services.cache_resultados import cacheado, versao_knn
+from instrumentacao import etapa
+
+COLD_START_RESTAURANTES = "Você não avaliou nenhum restaurante ainda, para poder receber recomendações mais alinhadas ao seu perfil avalie pelo menos 1 restaurante."
+COLD_START_REFEICOES = "Você não avaliou nenhuma refeição ainda, para poder receber recomendações mais alinhadas ao seu perfil avalie pelo menos 1 refeição."
+
+# Abordagens de filtragem colaborativa:
+# - "usuario": média das notas dos K usuários mais similares (KNNRecommender)
+# - "item": notas do próprio usuário nos itens mais similares a cada candidato (ItemKNNRecommender)
+ABORDAGENS = ("usuario", "item")
+
+
+def _get_recommender(session: Session, dominio: str, abordagem: str):
+    """
+    Recomendador já treinado do domínio (ver model_registry) para a abordagem pedida.
+    """
+    if abordagem not in ABORDAGENS:
+        raise ValueError(f"Abordagem desconhecida: '{abordagem}'. Opções: {', '.join(ABORDAGENS)}.")
+    with etapa("knn.modelo"):
+        modelo = model_registry.get_or_build(session, dominio)
+    return modelo.item_based() if abordagem == "item" else modelo.recommender
+
+@cacheado(versao_knn("restaurantes"))
+def get_restaurant_recommendations(session: Session, user_id: int, k=16, min_score: float = 3.0, weighted: bool = False,
+                                   abordagem: str = "usuario"):
     """
     Fluxo A: Orquestra recomendações de restaurantes usando KNN e filtra por nota >= min_score.
     """
-    # Buscar todas as linhas de usuario_avalia
-    avaliacoes = session.exec(select(UsuarioAvalia)).all()
-    if not avaliacoes:
+    # Modelo já treinado e compartilhado entre requisições (ver model_registry)
+    recommender = _get_recommender(session, "restaurantes", abordagem)
+    if recommender.matrix.empty:
         return []
 
     # Validar Cold Start
-    user_evals = [av for av in avaliacoes if av.id_usuario == user_id]
-    if not user_evals:
-        return {"message": "Você não avaliou nenhum restaurante ainda, para poder receber recomendações mais alinhadas ao seu perfil avalie pelo menos 1 restaurante."}
-
-    # Prepara dados para o processor criar a matriz
-    data = [{"id_usuario": av.id_usuario, "id_restaurante": av.id_restaurante, "nota": av.nota} for av in avaliacoes]
-    matrix = create_user_restaurant_matrix(data)
-
-    # Instanciar e treinar KNN
-    recommender = KNNRecommender(k_neighbors=k)
-    recommender.fit(matrix)
-    
-    # Buscar vizinhos
-    vizinhos = recommender.get_neighbors(user_id)
-    if not vizinhos:
-        return []
-
-    # Filtrar avaliações que pertencem apenas aos vizinhos encontrados
-    vizinhos_evals = [av for av in avaliacoes if av.id_usuario in vizinhos]
-    
-    restaurante_notas = {}
-    for av in vizinhos_evals:
-        if av.id_restaurante not in restaurante_notas:
-            restaurante_notas[av.id_restaurante] = []
-        restaurante_notas[av.id_restaurante].append(av.nota)
-
-    # Calcular média da nota dada *apenas* pelos vizinhos mais próximos
-    restaurante_medias = {rid: sum(notas)/len(notas) for rid, notas in restaurante_notas.items()}
-
-    # Filtro 1: Restaurantes bem avaliados pelos vizinhos (nota >= min_score)
-    recomendados = {rid: media for rid, media in restaurante_medias.items() if media >= min_score}
-
-    # Filtro 2: Remover restaurantes que o user_id alvo já avaliou/visitou
-    user_restaurantes = {av.id_restaurante for av in user_evals}
-    recomendados_filtrados = {rid: media for rid, media in recomendados.items() if rid not in user_restaurantes}
+    if not recommender.has_user(user_id):
+        return {"message": COLD_START_RESTAURANTES}
 
-    # Ordenação (Ranqueamento) pela média descrescente
-    ranked = sorted(recomendados_filtrados.keys(), key=lambda rid: recomendados_filtrados[rid], reverse=True)
+    # Média das notas dadas *apenas* pelos vizinhos mais próximos (ou, na abordagem "item", nota prevista
+    # a partir dos restaurantes similares), já filtrada (nota >= min_score, sem restaurantes que o
+    # usuário já avaliou) e ordenada
+    return recommender.recommend_items(user_id, k=k, min_score=min_score, weighted=weighted)
 
-    return ranked
 
-
-def get_meal_recommendations(session: Session, user_id: int, k=16, min_score: float = 3.0):
+@cacheado(versao_knn("refeicoes"))
+def get_meal_recommendations(session: Session, user_id: int, k=16, min_score: float = 3.0, weighted: bool = False,
+                             abordagem: str = "usuario"):
     """
     Fluxo B: Orquestra recomendações de refeições usando KNN e aplica filtro de restrição alimentar.
     """
-    # Buscar todas as linhas de refeicao_avalia
-    avaliacoes = session.exec(select(RefeicaoAvalia)).all()
-    if not avaliacoes:
+    # Modelo já treinado e compartilhado entre requisições (ver model_registry)
+    recommender = _get_recommender(session, "refeicoes", abordagem)
+    if recommender.matrix.empty:
         return []
 
     # Validar Cold Start
-    user_evals = [av for av in avaliacoes if av.id_usuario == user_id]
-    if not user_evals:
-        return {"message": "Você não avaliou nenhuma refeição ainda, para poder receber recomendações mais alinhadas ao seu perfil avalie pelo menos 1 refeição."}
-
-    # Prepara dados para o processor criar a matriz
-    data = [{"id_usuario": av.id_usuario, "id_refeicao": av.id_refeicao, "nota": av.nota} for av in avaliacoes]
-    matrix = create_user_meal_matrix(data)
-
-    # Instanciar e treinar KNN
-    recommender = KNNRecommender(k_neighbors=k)
-    recommender.fit(matrix)
-    
-    # Buscar vizinhos
-    vizinhos = recommender.get_neighbors(user_id)
-    if not vizinhos:
+    if not recommender.has_user(user_id):
+        return {"message": COLD_START_REFEICOES}
+
+    # Filtro 1: Refeições bem avaliadas pelos vizinhos (nota >= min_score) e ainda não testadas pelo usuário,
+    # já ordenadas pela média decrescente
+    ranked = recommender.recommend_items(user_id, k=k, min_score=min_score, weighted=weighted)
+
+    if not ranked:
         return []
 
-    # Filtrar avaliações da refeição que pertencem apenas aos vizinhos
-    vizinhos_evals = [av for av in avaliacoes if av.id_usuario in vizinhos]
-    
-    refeicao_notas = {}
-    for av in vizinhos_evals:
-        if av.id_refeicao not in refeicao_notas:
-            refeicao_notas[av.id_refeicao] = []
-        refeicao_notas[av.id_refeicao].append(av.nota)
+    # Filtro 2: Intersecção de Restrições (Remover refeições com ingredientes proibidos)
+    # usando o índice de restrições em memória, mantendo a ordem do ranking
+    indice = indice_restricoes.get(session)
+    with etapa("knn.filtro_restricoes"):
+        return indice.remove_proibidas(user_id, ranked)
 
-    # Calcular média da nota dada *apenas* pelos vizinhos mais próximos
-    refeicao_medias = {rid: sum(notas)/len(notas) for rid, notas in refeicao_notas.items()}
 
-    # Filtro 1: Refeições bem avaliadas pelos vizinhos (nota >= min_score) e ainda não testadas pelo usuário
-    user_refeicoes = {av.id_refeicao for av in user_evals}
-    recomendados_iniciais = [rid for rid, media in refeicao_medias.items() if media >= min_score and rid not in user_refeicoes]
+def get_restaurant_recommendations_batch(session: Session, user_ids: list[int], k=16, min_score: float = 3.0,
+                                         weighted: bool = False, abordagem: str = "usuario") -> dict:
+    """
+    Fluxo A para vários usuários: um único modelo e um único cálculo vetorizado para o lote.
+    Retorna id_usuario -> lista ranqueada (ou dict com 'message' em caso de Cold Start).
+    """
+    recommender = _get_recommender(session, "restaurantes", abordagem)
+    if recommender.matrix.empty:
+        return {u: [] for u in user_ids}
 
-    if not recomendados_iniciais:
-        return []
+    recomendacoes = recommender.recommend_items_batch(user_ids, k=k, min_score=min_score, weighted=weighted)
+    return {
+        u: recomendacoes[u] if u in recomendacoes else {"message": COLD_START_RESTAURANTES}
+        for u in user_ids
+    }
 
-    # Filtro 2: Intersecção de Restrições (Remover refeições com ingredientes proibidos)
-    user_restr = session.exec(
-        select(UsuarioRestricao.id_restricao).where(UsuarioRestricao.id_usuario == user_id)
-    ).all()
-
-    if user_restr:
-        # Pega IDs de ingredientes proibidos para essas restrições
-        ingred_proibidos = session.exec(
-            select(IngredienteRestricao.id_ingrediente).where(col(IngredienteRestricao.id_restricao).in_(user_restr))
-        ).all()
-
-        if ingred_proibidos:
-            # Encontra quais refeições recomendadas contêm ingredientes proibidos
-            ref_proibidas = session.exec(
-                select(RefeicaoIngrediente.id_refeicao)
-                .where(col(RefeicaoIngrediente.id_ingrediente).in_(ingred_proibidos))
-                .where(col(RefeicaoIngrediente.id_refeicao).in_(recomendados_iniciais))
-            ).all()
-
-            ref_proibidas_set = set(ref_proibidas)
-            # Exclui refeições proibidas da lista inicial
-            recomendados_iniciais = [rid for rid in recomendados_iniciais if rid not in ref_proibidas_set]
-
-    # Ordenação (Ranqueamento) pela média descrescente
-    ranked = sorted(recomendados_iniciais, key=lambda rid: refeicao_medias[rid], reverse=True)
-
-    return ranked
+
+def get_meal_recommendations_batch(session: Session, user_ids: list[int], k=16, min_score: float = 3.0,
+                                   weighted: bool = False, abordagem: str = "usuario") -> dict:
+    """
+    Fluxo B para vários usuários: um único modelo, um único cálculo vetorizado e um único
+    índice de restrições para o lote.
+    """
+    recommender = _get_recommender(session, "refeicoes", abordagem)
+    if recommender.matrix.empty:
+        return {u: [] for u in user_ids}
+
+    recomendacoes = recommender.recommend_items_batch(user_ids, k=k, min_score=min_score, weighted=weighted)
+    indice = indice_restricoes.get(session)
+
+    resultado = {}
+    with etapa("knn.filtro_restricoes"):
+        for u in user_ids:
+            if u not in recomendacoes:
+                resultado[u] = {"message": COLD_START_REFEICOES}
+            else:
+                resultado[u] = indice.remove_proibidas(u, recomendacoes[u]) if recomendacoes[u] else []
+    return resultado
@@ -0,0 +1,250 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from services.ml.neighbor_table import MAX_BLOCK_ELEMENTS
+from services.paginacao import top_indices
+
+MF_FACTORS = int(os.getenv("MF_FACTORS", "32"))
+MF_ITERATIONS = int(os.getenv("MF_ITERATIONS", "10"))
+MF_REGULARIZATION = float(os.getenv("MF_REGULARIZATION", "0.1"))
+MF_SEED = int(os.getenv("MF_SEED", "42"))
+
+
+def _als_step(indptr: np.ndarray, indices: np.ndarray, targets: np.ndarray, weights: np.ndarray,
+              fixed: np.ndarray, regularization: float) -> np.ndarray:
+    """
+    Resolve, para cada linha, o mínimo quadrado ponderado e regularizado:
+        x = argmin sum_j w_j (t_j - x . fixed[j])^2 + reg * sum_j w_j * |x|^2
+    As equações normais de todas as linhas saem de produtos esparso x denso:
+        A = W @ [fixed_j (x) fixed_j]   e   b = (W * T) @ fixed
+    seguidos de um np.linalg.solve em lote. Linhas e colunas são percorridas em blocos para
+    limitar a memória das matrizes d x d (max_block_elements).
+    """
+    n_rows, n_cols = len(indptr) - 1, len(fixed)
+    d = fixed.shape[1]
+    block_size = max(1, MAX_BLOCK_ELEMENTS // (d * d))
+    weights_csr = sp.csr_matrix((weights, indices, indptr), shape=(n_rows, n_cols))
+    targets_csr = sp.csr_matrix((weights * targets, indices, indptr), shape=(n_rows, n_cols))
+    eye = np.eye(d)
+    result = np.zeros((n_rows, d))
+
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        block = weights_csr[start:stop]
+        a = np.zeros((stop - start, d * d))
+        for col_start in range(0, n_cols, block_size):
+            sub = block[:, col_start:col_start + block_size]
+            if sub.nnz == 0:
+                continue
+            # Produtos externos só das colunas usadas pelo bloco
+            used = np.unique(sub.indices)
+            f = fixed[col_start + used]
+            a += sub[:, used] @ np.einsum("nf,ng->nfg", f, f).reshape(len(used), d * d)
+        b = targets_csr[start:stop] @ fixed
+        wsum = np.asarray(block.sum(axis=1)).ravel()
+
+        a = a.reshape(-1, d, d) + (regularization * np.maximum(wsum, 1.0))[:, None, None] * eye
+        result[start:stop] = np.linalg.solve(a, b[..., None])[..., 0]
+    return result
+
+
+class MatrixFactorizationRecommender:
+    FILES = ("user_ids.npy", "item_ids.npy", "user_factors.npy", "item_factors.npy", "global_mean.npy",
+             "rated_indices.npy", "rated_indptr.npy")
+
+    def __init__(self, factors: int = MF_FACTORS, iterations: int = MF_ITERATIONS,
+                 regularization: float = MF_REGULARIZATION, seed: int = MF_SEED):
+        """
+        Fatoração de matrizes por ALS (mínimos quadrados alternados) sobre notas explícitas,
+        com viés de usuário e de item:
+            nota(u, i) ~ media_global + b_u + c_i + p_u . q_i
+        Os vieses entram nos próprios embeddings (usuário = [p_u, b_u, 1], item = [q_i, 1, c_i]),
+        então servir é só um produto escalar float32 sobre os candidatos.
+        Aceita pesos por avaliação (ex.: favoritos como notas implícitas de peso menor).
+        """
+        self.factors = factors
+        self.iterations = iterations
+        self.regularization = regularization
+        self.seed = seed
+        self.user_ids: np.ndarray = None
+        self.item_ids: np.ndarray = None
+        self.user_factors: np.ndarray = None
+        self.item_factors: np.ndarray = None
+        self.global_mean = 0.0
+        self._user_pos: dict[int, int] = {}
+        self._rated: sp.csr_matrix = None
+
+    @property
+    def empty(self) -> bool:
+        return self.user_factors is None or len(self.user_factors) == 0
+
+    def fit(self, user_ids: np.ndarray, item_ids: np.ndarray, ratings: np.ndarray,
+            weights: np.ndarray | None = None, rated: np.ndarray | None = None):
+        """
+        Treina a partir de triplas (usuário, item, nota), sem pares repetidos.
+        - weights: peso de cada tripla (padrão 1)
+        - rated: máscara das triplas que são avaliações de verdade (itens já avaliados não são
+          recomendados); padrão: todas
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        weights = np.ones(len(ratings)) if weights is None else np.asarray(weights, dtype=np.float64)
+        rated = np.ones(len(ratings), dtype=bool) if rated is None else np.asarray(rated, dtype=bool)
+
+        self.user_ids, rows = np.unique(user_ids, return_inverse=True)
+        self.item_ids, cols = np.unique(item_ids, return_inverse=True)
+        self._user_pos = {int(uid): pos for pos, uid in enumerate(self.user_ids)}
+        n_users, n_items, f = len(self.user_ids), len(self.item_ids), self.factors
+
+        self._rated = sp.csr_matrix(
+            (np.ones(rated.sum()), (rows[rated], cols[rated])), shape=(n_users, n_items)
+        )
+        if len(ratings) == 0:
+            self.user_factors = np.zeros((0, f + 2), dtype=np.float32)
+            self.item_factors = np.zeros((n_items, f + 2), dtype=np.float32)
+            return self
+
+        self.global_mean = float(np.average(ratings, weights=weights))
+        by_user = sp.csr_matrix((np.arange(len(ratings)) + 1, (rows, cols)), shape=(n_users, n_items))
+        by_item = by_user.T.tocsr()
+        # Posição (na entrada) de cada avaliação, na ordem de cada CSR
+        user_order = by_user.data.astype(np.int64) - 1
+        item_order = by_item.data.astype(np.int64) - 1
+
+        rng = np.random.default_rng(self.seed)
+        user_emb = np.zeros((n_users, f + 2))
+        item_emb = np.zeros((n_items, f + 2))
+        item_emb[:, :f] = rng.normal(scale=0.1, size=(n_items, f))
+        user_emb[:, f + 1] = 1.0
+        item_emb[:, f] = 1.0
+
+        residual = ratings - self.global_mean
+        for _ in range(self.iterations):
+            # Usuários: resolve [p_u, b_u] com os itens fixos ([q_i, 1]) e alvo nota - média - c_i
+            targets = residual[user_order] - item_emb[by_user.indices, f + 1]
+            user_emb[:, :f + 1] = _als_step(by_user.indptr, by_user.indices, targets, weights[user_order],
+                                            item_emb[:, :f + 1], self.regularization)
+            # Itens: resolve [q_i, c_i] com os usuários fixos ([p_u, 1]) e alvo nota - média - b_u
+            fixed = np.concatenate([user_emb[:, :f], np.ones((n_users, 1))], axis=1)
+            targets = residual[item_order] - user_emb[by_item.indices, f]
+            solved = _als_step(by_item.indptr, by_item.indices, targets, weights[item_order],
+                               fixed, self.regularization)
+            item_emb[:, :f] = solved[:, :f]
+            item_emb[:, f + 1] = solved[:, f]
+
+        self.user_factors = user_emb.astype(np.float32)
+        self.item_factors = item_emb.astype(np.float32)
+        return self
+
+    def fold_in(self, user_ids: np.ndarray, item_ids: np.ndarray, ratings: np.ndarray,
+                users_to_update: np.ndarray) -> "MatrixFactorizationRecommender":
+        """
+        Novo modelo com os embeddings de `users_to_update` re-resolvidos (um passo de ALS com os
+        itens fixos) a partir de todas as notas explícitas desses usuários em (user_ids, item_ids, ratings).
+        Usuários novos entram no modelo; itens que o modelo não conhece são ignorados até o próximo
+        treino completo, assim como os favoritos desses usuários. Custo proporcional às notas deles.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        f = self.user_factors.shape[1] - 2
+        update = np.unique(np.asarray(users_to_update, dtype=np.int64))
+
+        # Notas dos usuários atualizados, nos itens conhecidos pelo modelo
+        if len(self.item_ids):
+            cols = np.searchsorted(self.item_ids, item_ids).clip(max=len(self.item_ids) - 1)
+            known = np.isin(user_ids, update) & (self.item_ids[cols] == item_ids)
+        else:
+            cols = np.zeros(len(item_ids), dtype=np.intp)
+            known = np.zeros(len(item_ids), dtype=bool)
+        rows = np.searchsorted(update, user_ids[known])
+        by_user = sp.csr_matrix((ratings[known], (rows, cols[known])), shape=(len(update), len(self.item_ids)))
+        item_emb = self.item_factors.astype(np.float64)
+        targets = by_user.data - self.global_mean - item_emb[by_user.indices, f + 1]
+        solved = _als_step(by_user.indptr, by_user.indices, targets, np.ones(by_user.nnz),
+                           item_emb[:, :f + 1], self.regularization)
+
+        model = MatrixFactorizationRecommender(f, self.iterations, self.regularization, self.seed)
+        model.global_mean = self.global_mean
+        model.item_ids = self.item_ids
+        model.item_factors = self.item_factors
+        model.user_ids = np.union1d(self.user_ids, update)
+        model.user_factors = np.zeros((len(model.user_ids), f + 2), dtype=np.float32)
+        model.user_factors[np.searchsorted(model.user_ids, self.user_ids)] = self.user_factors
+        updated = np.searchsorted(model.user_ids, update)
+        model.user_factors[updated, :f + 1] = solved
+        model.user_factors[updated, f + 1] = 1.0
+        model._user_pos = {int(uid): pos for pos, uid in enumerate(model.user_ids)}
+
+        # Itens já avaliados: os antigos remapeados + as notas atuais dos usuários atualizados
+        old = self._rated.tocoo()
+        old_rows = np.searchsorted(model.user_ids, self.user_ids)[old.row]
+        keep = ~np.isin(old_rows, updated)
+        new_rows = np.searchsorted(model.user_ids, user_ids[known])
+        model._rated = sp.csr_matrix(
+            (np.ones(keep.sum() + known.sum()),
+             (np.concatenate([old_rows[keep], new_rows]), np.concatenate([old.col[keep], cols[known]]))),
+            shape=(len(model.user_ids), len(model.item_ids))
+        )
+        return model
+
+    def has_user(self, user_id: int) -> bool:
+        """
+        Indica se o usuário tem avaliações (ou favoritos) no treino (False = Cold Start).
+        """
+        return user_id in self._user_pos
+
+    def score_items(self, user_id: int, item_ids) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Nota prevista do usuário para os itens informados que existem no modelo.
+        Retorna (ids dos itens conhecidos, notas previstas). Custo O(len(item_ids) x fatores).
+        """
+        ids = np.asarray(item_ids, dtype=np.int64)
+        if len(self.item_ids) == 0 or len(ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cols = np.searchsorted(self.item_ids, ids).clip(max=len(self.item_ids) - 1)
+        known = self.item_ids[cols] == ids
+        cols = cols[known]
+        scores = self.global_mean + self.item_factors[cols] @ self.user_factors[self._user_pos[user_id]]
+        return ids[known], scores
+
+    def recommend_items(self, user_id: int, candidates, k: int | None = None, min_score: float = 3.0) -> list[int]:
+        """
+        Top-k (padrão: todos) dos candidatos ainda não avaliados com nota prevista >= min_score,
+        da maior para a menor (empate: menor id primeiro, com candidatos em ordem crescente).
+        """
+        if not self.has_user(user_id):
+            return []
+        ids, scores = self.score_items(user_id, np.sort(np.asarray(candidates, dtype=np.int64)))
+        pos = self._user_pos[user_id]
+        own = self.item_ids[self._rated.indices[self._rated.indptr[pos]:self._rated.indptr[pos + 1]]]
+        keep = (scores >= min_score) & ~np.isin(ids, own)
+        ids, scores = ids[keep], scores[keep]
+        return [int(i) for i in ids[top_indices(scores, k)]]
+
+    def save(self, path: str):
+        """
+        Salva os embeddings como .npy separados (np.load(mmap_mode='r') compartilha as páginas).
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = (self.user_ids, self.item_ids, self.user_factors, self.item_factors,
+                  np.array([self.global_mean]), self._rated.indices, self._rated.indptr)
+        for name, arr in zip(self.FILES, arrays):
+            np.save(os.path.join(path, name), arr)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "MatrixFactorizationRecommender":
+        mode = "r" if mmap else None
+        user_ids, item_ids, user_factors, item_factors, global_mean, rated_indices, rated_indptr = (
+            np.load(os.path.join(path, name), mmap_mode=mode) for name in cls.FILES
+        )
+        model = cls(factors=user_factors.shape[1] - 2)
+        model.user_ids, model.item_ids = user_ids, item_ids
+        model.user_factors, model.item_factors = user_factors, item_factors
+        model.global_mean = float(global_mean[0])
+        model._user_pos = {int(uid): pos for pos, uid in enumerate(user_ids)}
+        model._rated = sp.csr_matrix(
+            (np.ones(len(rated_indices)), rated_indices, rated_indptr), shape=(len(user_ids), len(item_ids))
+        )
+        return model
@@ -0,0 +1,85 @@
+from sqlmodel import Session
+from services.ml.model_registry import model_registry
+from services.ml.matrix_factorization import MatrixFactorizationRecommender
+from services.ml.knn_service import COLD_START_RESTAURANTES, COLD_START_REFEICOES
+from services.recomendador import recall_por_restricao, recall_por_restricao_lote, restaurantes_candidatos
+from services.cache_resultados import cacheado, versao_fatoracao
+
+
+def _get_fatoracao(session: Session, dominio: str) -> MatrixFactorizationRecommender:
+    """
+    Fatoração já treinada do domínio (ver model_registry, MF_ENABLED).
+    """
+    fatoracao = model_registry.get_or_build(session, dominio).fatoracao
+    if fatoracao is None:
+        raise ValueError("Fatoração de matrizes desabilitada (MF_ENABLED=false).")
+    return fatoracao
+
+
+@cacheado(versao_fatoracao("restaurantes"))
+def get_restaurant_recommendations_mf(session: Session, user_id: int, min_score: float = 3.0,
+                                      limit: int | None = None):
+    """
+    Fluxo A com fatoração de matrizes: nota prevista (produto escalar dos embeddings) dos
+    restaurantes com refeições compatíveis com as restrições do usuário, filtrada por nota >= min_score.
+    """
+    fatoracao = _get_fatoracao(session, "restaurantes")
+    if fatoracao.empty:
+        return []
+
+    # Validar Cold Start
+    if not fatoracao.has_user(user_id):
+        return {"message": COLD_START_RESTAURANTES}
+
+    return fatoracao.recommend_items(user_id, restaurantes_candidatos(session, user_id), k=limit, min_score=min_score)
+
+
+@cacheado(versao_fatoracao("refeicoes"))
+def get_meal_recommendations_mf(session: Session, user_id: int, min_score: float = 3.0,
+                                limit: int | None = None):
+    """
+    Fluxo B com fatoração de matrizes: só as refeições do recall (disponíveis e sem ingredientes
+    proibidos) são pontuadas, então não há filtro de restrição depois do ranking.
+    """
+    fatoracao = _get_fatoracao(session, "refeicoes")
+    if fatoracao.empty:
+        return []
+
+    # Validar Cold Start
+    if not fatoracao.has_user(user_id):
+        return {"message": COLD_START_REFEICOES}
+
+    return fatoracao.recommend_items(user_id, recall_por_restricao(session, user_id), k=limit, min_score=min_score)
+
+
+def get_restaurant_recommendations_mf_batch(session: Session, user_ids: list[int], min_score: float = 3.0,
+                                            limit: int | None = None) -> dict:
+    """
+    Fluxo A (fatoração) para vários usuários, com um único modelo para o lote.
+    """
+    fatoracao = _get_fatoracao(session, "restaurantes")
+    if fatoracao.empty:
+        return {u: [] for u in user_ids}
+
+    return {
+        u: fatoracao.recommend_items(u, restaurantes_candidatos(session, u), k=limit, min_score=min_score)
+        if fatoracao.has_user(u) else {"message": COLD_START_RESTAURANTES}
+        for u in user_ids
+    }
+
+
+def get_meal_recommendations_mf_batch(session: Session, user_ids: list[int], min_score: float = 3.0,
+                                      limit: int | None = None) -> dict:
+    """
+    Fluxo B (fatoração) para vários usuários: usuários com as mesmas restrições compartilham o recall.
+    """
+    fatoracao = _get_fatoracao(session, "refeicoes")
+    if fatoracao.empty:
+        return {u: [] for u in user_ids}
+
+    candidatos = recall_por_restricao_lote(session, user_ids)
+    return {
+        u: fatoracao.recommend_items(u, candidatos[u], k=limit, min_score=min_score)
+        if fatoracao.has_user(u) else {"message": COLD_START_REFEICOES}
+        for u in user_ids
+    }
@@ -0,0 +1,354 @@
+import os
+import threading
+import time
+from datetime import date
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func
+from models.db_models import UsuarioAvalia, RefeicaoAvalia, RestauranteFavorito, RefeicaoFavorito
+from services.ml.pre_pocessing.processor import (
+    build_sparse_matrix, upsert_ratings, load_columns, SparseUserItemMatrix, RATING_DTYPES
+)
+from services.ml.recomendador_knn import KNNRecommender
+from services.ml.recomendador_item_knn import ItemKNNRecommender, KNN_ITEM_TOP_M
+from services.ml.neighbor_index import measure_recall, KNN_INDEX_BACKEND
+from services.ml.neighbor_table import NeighborTable, _normalize_rows
+from services.ml.matrix_factorization import (
+    MatrixFactorizationRecommender, MF_FACTORS, MF_ITERATIONS, MF_REGULARIZATION, MF_SEED
+)
+from services.ml.model_store import model_store
+from services.snapshot_holder import SnapshotIndisponivel, em_somente_leitura
+
+# Idade máxima (segundos) de um modelo antes de ser retreinado mesmo sem mudança detectada
+KNN_MAX_AGE = int(os.getenv("KNN_MAX_AGE", "3600"))
+KNN_K_NEIGHBORS = int(os.getenv("KNN_K_NEIGHBORS", "16"))
+# Pré-calcula a tabela top-K de vizinhos de todos os usuários a cada treino
+KNN_PRECOMPUTE_NEIGHBORS = os.getenv("KNN_PRECOMPUTE_NEIGHBORS", "true").lower() == "true"
+# Usuários amostrados para medir o recall@k de um backend aproximado (KNN_INDEX_BACKEND=lsh) a cada treino; 0 desliga
+KNN_RECALL_SAMPLE = int(os.getenv("KNN_RECALL_SAMPLE", "200"))
+# Pré-calcula também a matriz item x item (modo baseado em itens) a cada treino;
+# com false, ela é calculada no primeiro pedido do modo "item"
+KNN_ITEM_BASED = os.getenv("KNN_ITEM_BASED", "true").lower() == "true"
+# Treina também a fatoração de matrizes (ALS) a cada treino
+MF_ENABLED = os.getenv("MF_ENABLED", "true").lower() == "true"
+# Favoritos entram na fatoração como nota implícita MF_FAVORITE_RATING com peso MF_FAVORITE_WEIGHT
+# (0 ignora os favoritos); pares já avaliados ficam só com a nota explícita
+MF_FAVORITE_WEIGHT = float(os.getenv("MF_FAVORITE_WEIGHT", "0.5"))
+MF_FAVORITE_RATING = float(os.getenv("MF_FAVORITE_RATING", "5"))
+# Atualização incremental: aplica só as notas com data >= à mais recente do modelo enquanto elas
+# forem no máximo esta fração das notas da matriz (acima disso, treino completo)
+KNN_DELTA_ENABLED = os.getenv("KNN_DELTA_ENABLED", "true").lower() == "true"
+KNN_DELTA_MAX_FRACAO = float(os.getenv("KNN_DELTA_MAX_FRACAO", "0.2"))
+
+# Configuração de cada domínio: tabela de avaliações, coluna do item e tabela de favoritos
+DOMINIOS = {
+    "restaurantes": (UsuarioAvalia, "id_restaurante", RestauranteFavorito),
+    "refeicoes": (RefeicaoAvalia, "id_refeicao", RefeicaoFavorito),
+}
+
+
+class KNNModel:
+    """
+    Modelo KNN já treinado para um domínio. É imutável depois de construído:
+    uma atualização cria um novo KNNModel e troca a referência no registro.
+    criado_em é o instante do último treino completo (um delta aplicado o preserva).
+    """
+    def __init__(self, recommender: KNNRecommender, versao: tuple, item_recommender: ItemKNNRecommender | None = None,
+                 fatoracao: MatrixFactorizationRecommender | None = None, criado_em: float | None = None):
+        self.recommender = recommender
+        self.item_recommender = item_recommender
+        self.fatoracao = fatoracao
+        self.versao = versao
+        self.criado_em = time.time() if criado_em is None else criado_em
+        self._item_lock = threading.Lock()
+
+    def save(self, path: str):
+        """
+        Grava a matriz (com os mapeamentos de ids), a tabela de vizinhos, a matriz item x item
+        e os embeddings da fatoração como .npy em subdiretórios de `path`.
+        """
+        self.recommender.matrix.save(os.path.join(path, "matriz"))
+        if self.recommender.neighbor_table is not None:
+            self.recommender.neighbor_table.save(os.path.join(path, "vizinhos"))
+        if self.item_recommender is not None:
+            self.item_recommender.save(os.path.join(path, "item_knn"))
+        if self.fatoracao is not None:
+            self.fatoracao.save(os.path.join(path, "fatoracao"))
+
+    @classmethod
+    def load(cls, path: str, versao: tuple, k_neighbors: int, mmap: bool = True,
+             criado_em: float | None = None) -> "KNNModel":
+        """
+        Remonta o modelo salvo por save() sem retreinar: só o índice de vizinhos é reajustado
+        sobre a matriz carregada (barato; a parte cara, a tabela top-K, vem do disco).
+        criado_em é o instante do treino que gerou o artefato (ver model_store).
+        """
+        matrix = SparseUserItemMatrix.load(os.path.join(path, "matriz"), mmap)
+        recommender = KNNRecommender(k_neighbors=k_neighbors)
+        recommender.fit(matrix)
+        if os.path.isdir(os.path.join(path, "vizinhos")):
+            recommender.neighbor_table = NeighborTable.load(os.path.join(path, "vizinhos"), mmap)
+        item_recommender = None
+        if os.path.isdir(os.path.join(path, "item_knn")):
+            item_recommender = ItemKNNRecommender.load(os.path.join(path, "item_knn"), matrix, mmap)
+        fatoracao = None
+        if os.path.isdir(os.path.join(path, "fatoracao")):
+            fatoracao = MatrixFactorizationRecommender.load(os.path.join(path, "fatoracao"), mmap)
+        return cls(recommender, versao, item_recommender, fatoracao, criado_em)
+
+    def item_based(self) -> ItemKNNRecommender:
+        """
+        Recomendador baseado em itens sobre a mesma matriz do modelo (montado no treino,
+        ou aqui na primeira chamada se KNN_ITEM_BASED=false).
+        """
+        if self.item_recommender is None:
+            if em_somente_leitura():
+                raise SnapshotIndisponivel("item_knn")
+            with self._item_lock:
+                if self.item_recommender is None:
+                    self.item_recommender = ItemKNNRecommender().fit(self.recommender.matrix)
+        return self.item_recommender
+
+
+class ModelRegistry:
+    def __init__(self, k_neighbors: int = KNN_K_NEIGHBORS):
+        """
+        Registro de longa duração com um KNNModel por domínio, compartilhado entre as requisições.
+        """
+        self.k_neighbors = k_neighbors
+        self._modelos: dict[str, KNNModel] = {}
+        self._build_lock = threading.Lock()
+
+    def get(self, dominio: str) -> KNNModel | None:
+        return self._modelos.get(dominio)
+
+    def get_or_build(self, session: Session, dominio: str) -> KNNModel:
+        """
+        Retorna o modelo em memória; se ainda não existir (ex.: falha no startup), treina na hora.
+        """
+        modelo = self._modelos.get(dominio)
+        if modelo is None:
+            if em_somente_leitura():
+                raise SnapshotIndisponivel(f"modelo:{dominio}")
+            modelo = self.build(session, dominio, se_ausente=True)
+        return modelo
+
+    def versao_atual(self, session: Session, dominio: str) -> tuple:
+        """
+        Versão barata da tabela de avaliações: (quantidade de linhas, data mais recente) e um checksum
+        (somas das notas e dos ids), que também muda quando uma nota é editada ou uma linha trocada.
+        Com a fatoração usando favoritos, inclui também a quantidade e o checksum dos favoritos.
+        """
+        tabela, item_col, favoritos = DOMINIOS[dominio]
+        row = session.exec(select(
+            func.count(), func.max(tabela.data_avaliacao),
+            func.sum(tabela.nota), func.sum(tabela.id_usuario), func.sum(getattr(tabela, item_col))
+        )).one()
+        versao = (int(row[0]), str(row[1]), int(row[2] or 0), int(row[3] or 0), int(row[4] or 0))
+        if MF_ENABLED and MF_FAVORITE_WEIGHT > 0:
+            fav = session.exec(select(
+                func.count(), func.sum(favoritos.id_usuario), func.sum(getattr(favoritos, item_col))
+            )).one()
+            versao += (int(fav[0]), int(fav[1] or 0), int(fav[2] or 0))
+        return versao
+
+    def config_treino(self) -> dict:
+        """
+        Parâmetros que mudam o modelo treinado: um artefato em disco só é reaproveitado com os mesmos.
+        """
+        config = {
+            "formato": 1,
+            "k_neighbors": self.k_neighbors,
+            "index_backend": KNN_INDEX_BACKEND,
+            "precompute_neighbors": KNN_PRECOMPUTE_NEIGHBORS,
+            "item_top_m": KNN_ITEM_TOP_M if KNN_ITEM_BASED else None,
+            "fatoracao": None,
+        }
+        if MF_ENABLED:
+            config["fatoracao"] = [MF_FACTORS, MF_ITERATIONS, MF_REGULARIZATION, MF_SEED,
+                                   MF_FAVORITE_WEIGHT, MF_FAVORITE_RATING]
+        return config
+
+    def _treina_fatoracao(self, session: Session, dominio: str, usuarios: np.ndarray, itens: np.ndarray,
+                          notas: np.ndarray) -> MatrixFactorizationRecommender:
+        """
+        ALS sobre as notas explícitas (colunas id_usuario, id_item, nota) e, se MF_FAVORITE_WEIGHT > 0,
+        sobre os favoritos ainda não avaliados como notas implícitas de peso menor.
+        """
+        _, item_col, favoritos = DOMINIOS[dominio]
+        notas = notas.astype(np.float64)
+        pesos = np.ones(len(notas))
+        avaliadas = np.ones(len(notas), dtype=bool)
+
+        if MF_FAVORITE_WEIGHT > 0:
+            fav_usuarios, fav_itens = load_columns(
+                session, select(favoritos.id_usuario, getattr(favoritos, item_col)), RATING_DTYPES[:2]
+            )
+            # Remove os pares que já têm nota explícita
+            ja_avaliados = np.isin(fav_usuarios.astype(np.int64) * (2 ** 32) + fav_itens,
+                                   usuarios.astype(np.int64) * (2 ** 32) + itens)
+            usuarios = np.concatenate([usuarios, fav_usuarios[~ja_avaliados]])
+            itens = np.concatenate([itens, fav_itens[~ja_avaliados]])
+            qtd_fav = len(usuarios) - len(notas)
+            notas = np.concatenate([notas, np.full(qtd_fav, MF_FAVORITE_RATING)])
+            pesos = np.concatenate([pesos, np.full(qtd_fav, MF_FAVORITE_WEIGHT)])
+            avaliadas = np.concatenate([avaliadas, np.zeros(qtd_fav, dtype=bool)])
+
+        return MatrixFactorizationRecommender().fit(usuarios, itens, notas, pesos, avaliadas)
+
+    def _treina(self, session: Session, dominio: str, versao: tuple) -> KNNModel:
+        """
+        Lê a tabela de avaliações do domínio (só as três colunas usadas, em blocos, ver load_columns),
+        monta a matriz CSR e treina o KNN (e a fatoração, se MF_ENABLED).
+        """
+        tabela, item_col, _ = DOMINIOS[dominio]
+        usuarios, itens, notas = load_columns(
+            session, select(tabela.id_usuario, getattr(tabela, item_col), tabela.nota), RATING_DTYPES,
+            size_hint=versao[0]
+        )
+        matrix = build_sparse_matrix(usuarios, itens, notas)
+        recommender = KNNRecommender(k_neighbors=self.k_neighbors)
+        recommender.fit(matrix)
+        if KNN_PRECOMPUTE_NEIGHBORS and not matrix.empty:
+            recommender.precompute_neighbors()
+        if KNN_RECALL_SAMPLE > 0 and not recommender.index.exact and not matrix.empty:
+            recall = measure_recall(recommender.index, matrix.matrix, self.k_neighbors, KNN_RECALL_SAMPLE)
+            print(f"KNN '{dominio}': recall@{self.k_neighbors} do índice aproximado = {recall:.3f}")
+
+        item_recommender = ItemKNNRecommender().fit(matrix) if KNN_ITEM_BASED else None
+        fatoracao = self._treina_fatoracao(session, dominio, usuarios, itens, notas) if MF_ENABLED else None
+        return KNNModel(recommender, versao, item_recommender, fatoracao)
+
+    def build(self, session: Session, dominio: str, se_ausente: bool = False) -> KNNModel:
+        """
+        Publica o modelo da versão atual do domínio: carrega o artefato em disco (ver model_store)
+        quando a versão dos dados e a configuração batem e ele tem até KNN_MAX_AGE segundos; senão
+        treina e grava um novo artefato. O limite de idade vale para o artefato (criado_em do manifesto,
+        mantido no modelo carregado): reiniciar o processo não retreina, e o retreino por idade (a única
+        defesa contra edições que os checksums não enxergam, ex.: duas notas trocadas na mesma data)
+        treina de novo em vez de recarregar o mesmo artefato.
+        Com se_ausente=True (get_or_build) a ausência é conferida de novo já com o lock: requisições
+        que esperavam o mesmo build recebem o modelo publicado em vez de treinar outra vez.
+        """
+        with self._build_lock, model_store.trava(dominio):
+            if se_ausente and dominio in self._modelos:
+                return self._modelos[dominio]
+            versao = self.versao_atual(session, dominio)
+            config = self.config_treino()
+            modelo = model_store.carrega(
+                dominio, versao, config,
+                lambda caminho, mmap, criado_em: KNNModel.load(caminho, versao, self.k_neighbors, mmap, criado_em),
+                max_idade=KNN_MAX_AGE
+            )
+            if modelo is not None:
+                print(f"Modelo '{dominio}' carregado dos artefatos em disco.")
+            else:
+                modelo = self._treina(session, dominio, versao)
+                model_store.salva(dominio, versao, config, modelo.save)
+
+            # Troca atômica da referência: requisições em andamento continuam com o modelo antigo
+            self._modelos[dominio] = modelo
+            return modelo
+
+    def _aplica_delta(self, session: Session, dominio: str, modelo: KNNModel) -> KNNModel | None:
+        """
+        Novo modelo com só as notas inseridas/editadas desde o treino aplicadas ao modelo atual,
+        ou None quando a mudança exige treino completo. Não há tabela de mudanças: relemos as notas
+        com data >= à mais recente do modelo e conferimos, pelos checksums de versao_atual, que a matriz
+        resultante bate com a tabela (remoções ou edições de notas antigas não batem e caem no treino).
+        - matriz: upsert das notas em memória
+        - vizinhos: recalculados para os usuários alterados, para quem os tinha como vizinho e para quem
+          agora tem um deles acima do seu k-ésimo vizinho
+        - item x item: recalculadas as linhas dos itens alterados
+        - fatoração: embeddings dos usuários alterados re-resolvidos com os itens fixos (fold-in)
+        """
+        tabela, item_col, _ = DOMINIOS[dominio]
+        versao = self.versao_atual(session, dominio)
+        # Nada a aplicar (reconstrução forçada), favoritos alterados (só entram na fatoração)
+        # ou modelo sem notas: treino completo
+        if versao == modelo.versao or versao[5:] != modelo.versao[5:] or modelo.versao[1] == "None":
+            return None
+
+        delta_usuarios, delta_itens, delta_notas = load_columns(
+            session,
+            select(tabela.id_usuario, getattr(tabela, item_col), tabela.nota)
+            .where(tabela.data_avaliacao >= date.fromisoformat(modelo.versao[1])),
+            RATING_DTYPES
+        )
+        atual = modelo.recommender.matrix
+        if len(delta_notas) > KNN_DELTA_MAX_FRACAO * max(atual.matrix.nnz, 1):
+            return None
+
+        matrix = upsert_ratings(atual, delta_usuarios, delta_itens, delta_notas)
+        coo = matrix.matrix.tocoo()
+        conferencia = (coo.nnz, int(round(coo.data.sum())),
+                       int(matrix.user_ids[coo.row].sum()), int(matrix.item_ids[coo.col].sum()))
+        if conferencia != (versao[0], versao[2], versao[3], versao[4]):
+            return None
+
+        usuarios_alterados = np.unique(delta_usuarios).astype(np.int64)
+        itens_alterados = np.unique(delta_itens).astype(np.int64)
+        recommender = KNNRecommender(k_neighbors=self.k_neighbors)
+        recommender.fit(matrix)
+        tabela_antiga = modelo.recommender.neighbor_table
+        if tabela_antiga is not None and not matrix.empty:
+            vizinhos = tabela_antiga.remap(matrix.user_ids)
+            alteradas = np.searchsorted(matrix.user_ids, usuarios_alterados)
+            vizinhos.neighbors[alteradas], vizinhos.similarities[alteradas] = recommender.index.query(alteradas, vizinhos.k)
+            # O top-k não é simétrico: além de quem tinha um usuário alterado como vizinho, recalcula
+            # quem tem similaridade com algum alterado acima da sua k-ésima (ou tem menos de k vizinhos)
+            normalizada = _normalize_rows(matrix.matrix, np.float32)
+            maior = (normalizada @ normalizada[alteradas].T).max(axis=1).toarray().ravel()
+            afetadas = np.flatnonzero(
+                np.isin(vizinhos.neighbors, alteradas).any(axis=1)
+                | (maior > vizinhos.similarities[:, -1])
+                | ((vizinhos.neighbors[:, -1] < 0) & (maior > 0))
+            )
+            afetadas = np.setdiff1d(afetadas, alteradas)
+            if len(afetadas):
+                vizinhos.neighbors[afetadas], vizinhos.similarities[afetadas] = recommender.index.query(afetadas, vizinhos.k)
+            recommender.neighbor_table = vizinhos
+
+        item_recommender = None
+        if modelo.item_recommender is not None:
+            item_recommender = modelo.item_recommender.update(matrix, itens_alterados)
+        fatoracao = None
+        if modelo.fatoracao is not None:
+            linhas = np.searchsorted(matrix.user_ids, usuarios_alterados)
+            notas = matrix.matrix[linhas].tocoo()
+            fatoracao = modelo.fatoracao.fold_in(
+                usuarios_alterados[notas.row], matrix.item_ids[notas.col], notas.data, usuarios_alterados
+            )
+        return KNNModel(recommender, versao, item_recommender, fatoracao, criado_em=modelo.criado_em)
+
+    def atualiza(self, session: Session, dominio: str) -> KNNModel:
+        """
+        Atualização usada pelo agendador: aplica o delta das notas quando possível (ver _aplica_delta);
+        sem modelo, com o modelo mais velho que KNN_MAX_AGE ou com o delta recusado, faz o build completo.
+        """
+        modelo = self._modelos.get(dominio)
+        if KNN_DELTA_ENABLED and modelo is not None and (time.time() - modelo.criado_em) <= KNN_MAX_AGE:
+            with self._build_lock:
+                novo = self._aplica_delta(session, dominio, modelo)
+                if novo is not None:
+                    self._modelos[dominio] = novo
+                    return novo
+        return self.build(session, dominio)
+
+    def build_all(self, session: Session):
+        for dominio in DOMINIOS:
+            self.build(session, dominio)
+
+    def desatualizado(self, session: Session, dominio: str) -> bool:
+        """
+        O domínio precisa de um novo treino: sem modelo, versão das tabelas diferente,
+        ou modelo com mais de KNN_MAX_AGE segundos.
+        """
+        modelo = self._modelos.get(dominio)
+        if modelo is None or (time.time() - modelo.criado_em) > KNN_MAX_AGE:
+            return True
+        return self.versao_atual(session, dominio) != modelo.versao
+
+
+# Instância única compartilhada pela aplicação
+model_registry = ModelRegistry()
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Diretório dos artefatos dos modelos treinados (vazio desliga a persistência)
+MODEL_ARTIFACTS_DIR = os.getenv("MODEL_ARTIFACTS_DIR", "artefatos")
+# Versões mantidas em disco por domínio (as mais recentes)
+MODEL_ARTIFACTS_KEEP = int(os.getenv("MODEL_ARTIFACTS_KEEP", "2"))
+# Carrega os arrays com np.load(mmap_mode='r'): os workers do uvicorn compartilham as páginas
+MODEL_ARTIFACTS_MMAP = os.getenv("MODEL_ARTIFACTS_MMAP", "true").lower() == "true"
+
+MANIFESTO = "manifesto.json"
+
+
+class ModelStore:
+    """
+    Artefatos versionados em disco: <base>/<dominio>/<chave>/, onde a chave é um hash da versão
+    dos dados (lida do banco) + configuração do treino. Um artefato só é reaproveitado quando a
+    chave bate, então qualquer mudança nas avaliações ou nos parâmetros força um novo treino,
+    e só enquanto for mais novo que a idade máxima pedida em carrega.
+    Cada versão é escrita num diretório temporário e publicada com os.replace (o manifesto é o
+    último arquivo escrito), então um leitor nunca vê um artefato pela metade.
+    """
+    def __init__(self, base_dir: str = MODEL_ARTIFACTS_DIR, keep: int = MODEL_ARTIFACTS_KEEP,
+                 mmap: bool = MODEL_ARTIFACTS_MMAP):
+        self.base_dir = base_dir
+        self.keep = keep
+        self.mmap = mmap
+
+    @property
+    def habilitado(self) -> bool:
+        return bool(self.base_dir)
+
+    @staticmethod
+    def chave(versao: tuple, config: dict) -> str:
+        conteudo = json.dumps({"versao": list(versao), "config": config}, sort_keys=True, default=str)
+        return hashlib.sha256(conteudo.encode()).hexdigest()[:16]
+
+    def _dir_dominio(self, dominio: str) -> str:
+        return os.path.join(self.base_dir, dominio)
+
+    @contextmanager
+    def trava(self, dominio: str):
+        """
+        Trava exclusiva por domínio entre processos (fcntl.flock): com vários workers subindo juntos,
+        só um treina e grava; os outros esperam e carregam o artefato publicado.
+        """
+        if not self.habilitado or fcntl is None:
+            yield
+            return
+        os.makedirs(self._dir_dominio(dominio), exist_ok=True)
+        with open(os.path.join(self._dir_dominio(dominio), ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def carrega(self, dominio: str, versao: tuple, config: dict, load_fn: Callable[[str, bool, float], object],
+                max_idade: float | None = None):
+        """
+        load_fn(caminho, mmap, criado_em) do artefato da versão/configuração atuais, ou None se não existir,
+        se tiver sido treinado há mais de max_idade segundos (criado_em do manifesto) ou se estiver
+        ilegível; nos três casos o chamador treina de novo.
+        """
+        if not self.habilitado:
+            return None
+        caminho = os.path.join(self._dir_dominio(dominio), self.chave(versao, config))
+        if not os.path.exists(os.path.join(caminho, MANIFESTO)):
+            return None
+        try:
+            with open(os.path.join(caminho, MANIFESTO)) as f:
+                criado_em = float(json.load(f)["criado_em"])
+            if max_idade is not None and time.time() - criado_em > max_idade:
+                print(f"Artefato '{caminho}' com mais de {max_idade} segundos, treinando de novo.")
+                return None
+            return load_fn(caminho, self.mmap, criado_em)
+        except Exception as e:
+            print(f"Artefato '{caminho}' ilegível, treinando de novo: {e}")
+            return None
+
+    def salva(self, dominio: str, versao: tuple, config: dict, save_fn: Callable[[str], None]):
+        """
+        save_fn(caminho) grava os arrays num diretório temporário, publicado de uma vez ao final.
+        Um artefato da mesma chave publicado antes do início da gravação (recusado por idade em
+        carrega) é substituído; um publicado durante a gravação, por outro processo, é mantido.
+        Falhas de escrita (ex.: disco somente leitura) não impedem o uso do modelo em memória.
+        """
+        if not self.habilitado:
+            return
+        inicio = time.time()
+        chave = self.chave(versao, config)
+        dir_dominio = self._dir_dominio(dominio)
+        destino = os.path.join(dir_dominio, chave)
+        tmp = None
+        try:
+            os.makedirs(dir_dominio, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=dir_dominio)
+            save_fn(tmp)
+            with open(os.path.join(tmp, MANIFESTO), "w") as f:
+                json.dump({"chave": chave, "versao": list(versao), "config": config,
+                           "criado_em": time.time()}, f, default=str)
+            if not os.path.exists(destino):
+                os.replace(tmp, destino)
+            elif os.path.getmtime(os.path.join(destino, MANIFESTO)) >= inicio:
+                # Outro processo publicou a mesma versão primeiro
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                # Artefato vencido da mesma chave: sai do caminho antes da publicação do novo
+                # (quem já o mapeou continua lendo os arquivos antigos até fechá-los)
+                antigo = tmp + ".antigo"
+                os.replace(destino, antigo)
+                os.replace(tmp, destino)
+                shutil.rmtree(antigo, ignore_errors=True)
+            self._limpa(dominio, manter=chave)
+        except Exception as e:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+            print(f"Erro ao salvar artefato do modelo '{dominio}': {e}")
+
+    def _limpa(self, dominio: str, manter: str):
+        """
+        Remove as versões mais antigas além de `keep` (arquivos ainda mapeados por outro processo
+        continuam válidos para ele até serem fechados).
+        """
+        dir_dominio = self._dir_dominio(dominio)
+        versoes = [
+            nome for nome in os.listdir(dir_dominio)
+            if nome != manter and os.path.exists(os.path.join(dir_dominio, nome, MANIFESTO))
+        ]
+        versoes.sort(key=lambda nome: os.path.getmtime(os.path.join(dir_dominio, nome, MANIFESTO)), reverse=True)
+        for nome in versoes[max(self.keep - 1, 0):]:
+            shutil.rmtree(os.path.join(dir_dominio, nome), ignore_errors=True)
+
+
+# Instância única compartilhada pela aplicação
+model_store = ModelStore()
@@ -0,0 +1,226 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+from services.ml.neighbor_table import (
+    NeighborTable, compute_neighbor_table, top_k_neighbors, _normalize_rows, MAX_BLOCK_ELEMENTS
+)
+
+# Backend de busca de vizinhos do KNNRecommender:
+# - "brute": NearestNeighbors(metric='cosine', algorithm='brute') do scikit-learn (exato)
+# - "blocked": produto de matrizes em blocos sobre vetores L2-normalizados em float32 (exato)
+# - "lsh": hiperplanos aleatórios (random-projection LSH) + re-rank exato dos candidatos (aproximado)
+KNN_INDEX_BACKEND = os.getenv("KNN_INDEX_BACKEND", "brute").lower()
+KNN_LSH_TABLES = int(os.getenv("KNN_LSH_TABLES", "16"))
+KNN_LSH_BITS = int(os.getenv("KNN_LSH_BITS", "10"))
+# Multi-probe: também consulta os buckets a 1 bit de distância (mais recall, mais candidatos)
+KNN_LSH_MULTIPROBE = os.getenv("KNN_LSH_MULTIPROBE", "true").lower() == "true"
+KNN_LSH_SEED = int(os.getenv("KNN_LSH_SEED", "42"))
+
+
+class NeighborIndex:
+    """
+    Interface comum dos backends. As consultas são sempre por LINHA da matriz usada no fit
+    (o recomendador só busca vizinhos de usuários conhecidos), e o próprio usuário nunca
+    aparece entre os vizinhos.
+    """
+    exact = True
+
+    def fit(self, features):
+        raise NotImplementedError
+
+    def query(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (vizinhos int32, similaridades float32), ambos (len(rows) x k), ordenados pela
+        similaridade decrescente, com -1 / 0 quando faltam vizinhos.
+        """
+        raise NotImplementedError
+
+    def build_table(self, user_ids: np.ndarray, k: int, chunk_size: int = 1024) -> NeighborTable:
+        """
+        Tabela de vizinhos de todos os usuários, consultando em lotes de linhas.
+        """
+        n_users = len(user_ids)
+        neighbors = np.full((n_users, k), -1, dtype=np.int32)
+        similarities = np.zeros((n_users, k), dtype=np.float32)
+        for start in range(0, n_users, chunk_size):
+            rows = np.arange(start, min(start + chunk_size, n_users))
+            neighbors[rows], similarities[rows] = self.query(rows, k)
+        return NeighborTable(user_ids, neighbors, similarities)
+
+
+class BruteForceIndex(NeighborIndex):
+    """
+    Busca exata com o NearestNeighbors do scikit-learn (comportamento original).
+    """
+    def __init__(self):
+        self.model = NearestNeighbors(metric='cosine', algorithm='brute')
+        self._features = None
+
+    def fit(self, features):
+        self._features = features
+        self.model.fit(features)
+        return self
+
+    def query(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+        similarities = np.zeros((len(rows), k), dtype=np.float32)
+        # Consideramos buscar (k+1) porque o próprio usuário alvo entrará como primeiro
+        n_neighbors_to_fetch = min(k + 1, self._features.shape[0])
+        if len(rows) == 0 or n_neighbors_to_fetch == 0:
+            return neighbors, similarities
+
+        distances, indices = self.model.kneighbors(self._features[rows], n_neighbors=n_neighbors_to_fetch)
+        for i, (row, dist, idx) in enumerate(zip(rows, distances, indices)):
+            keep = idx != row
+            found = idx[keep][:k]
+            neighbors[i, :len(found)] = found
+            similarities[i, :len(found)] = 1.0 - dist[keep][:k]
+        return neighbors, similarities
+
+    def build_table(self, user_ids: np.ndarray, k: int, chunk_size: int = 1024) -> NeighborTable:
+        return compute_neighbor_table(self._features, user_ids, k)
+
+
+class BlockedCosineIndex(NeighborIndex):
+    """
+    Busca exata: vetores L2-normalizados em float32 e produto de matrizes em blocos
+    (memória de pico limitada por max_block_elements).
+    """
+    def __init__(self, dtype=np.float32, max_block_elements: int = MAX_BLOCK_ELEMENTS):
+        self.dtype = dtype
+        self.max_block_elements = max_block_elements
+        self._normalized = None
+        self._transposed = None
+
+    def fit(self, features):
+        self._normalized = _normalize_rows(features, self.dtype)
+        self._transposed = self._normalized.T.tocsc() if sp.issparse(self._normalized) else self._normalized.T
+        return self
+
+    def query(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        return top_k_neighbors(self._normalized, self._transposed, np.asarray(rows), k, self.max_block_elements)
+
+    def build_table(self, user_ids: np.ndarray, k: int, chunk_size: int = 1024) -> NeighborTable:
+        return NeighborTable(user_ids, *self.query(np.arange(len(user_ids)), k))
+
+
+class LSHIndex(NeighborIndex):
+    """
+    Busca aproximada por random-projection LSH (hiperplanos aleatórios, que aproximam o cosseno).
+    Cada uma das n_tables tabelas agrupa os usuários pelo sinal de n_bits projeções; os candidatos
+    de uma consulta são os usuários que caem no mesmo bucket em alguma tabela (ou, com multiprobe,
+    num bucket a 1 bit de distância), re-ranqueados pelo cosseno exato. Custo por consulta ~ número de candidatos, em vez de todos os usuários.
+    Quando há menos de k candidatos, completa com a busca exata (usuários isolados).
+    """
+    exact = False
+
+    def __init__(self, n_tables: int = KNN_LSH_TABLES, n_bits: int = KNN_LSH_BITS,
+                 multiprobe: bool = KNN_LSH_MULTIPROBE, seed: int = KNN_LSH_SEED):
+        if not 1 <= n_bits <= 62:
+            raise ValueError("n_bits deve estar entre 1 e 62.")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.multiprobe = multiprobe
+        self.seed = seed
+        self._normalized = None
+        self._codes = None
+        self._buckets = []
+
+    def fit(self, features):
+        self._normalized = _normalize_rows(features, np.float32)
+        n_users, n_items = self._normalized.shape
+        rng = np.random.default_rng(self.seed)
+        planes = rng.standard_normal((n_items, self.n_tables * self.n_bits)).astype(np.float32)
+
+        # Códigos dos buckets (um int64 por tabela), projetando em blocos de linhas
+        self._codes = np.zeros((n_users, self.n_tables), dtype=np.int64)
+        shifts = np.arange(self.n_bits, dtype=np.int64)
+        block_size = max(1, MAX_BLOCK_ELEMENTS // planes.shape[1])
+        for start in range(0, n_users, block_size):
+            stop = min(start + block_size, n_users)
+            projected = np.asarray(self._normalized[start:stop] @ planes)
+            bits = (projected > 0).reshape(stop - start, self.n_tables, self.n_bits)
+            self._codes[start:stop] = (bits.astype(np.int64) << shifts).sum(axis=2)
+
+        # Por tabela: linhas ordenadas pelo código do bucket; o bucket é uma fatia via searchsorted
+        self._buckets = []
+        for t in range(self.n_tables):
+            order = np.argsort(self._codes[:, t], kind="stable")
+            self._buckets.append((self._codes[order, t], order))
+        return self
+
+    def candidates(self, row: int) -> np.ndarray:
+        flips = np.int64(1) << np.arange(self.n_bits, dtype=np.int64)
+        found = []
+        for t, (sorted_codes, order) in enumerate(self._buckets):
+            code = self._codes[row, t]
+            probes = np.concatenate([[code], code ^ flips]) if self.multiprobe else np.array([code])
+            lo = np.searchsorted(sorted_codes, probes, side="left")
+            hi = np.searchsorted(sorted_codes, probes, side="right")
+            found.extend(order[a:b] for a, b in zip(lo, hi) if b > a)
+        candidates = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+        return candidates[candidates != row]
+
+    def query(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        n_users = self._normalized.shape[0]
+        neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+        similarities = np.zeros((len(rows), k), dtype=np.float32)
+
+        for i, row in enumerate(rows):
+            candidates = self.candidates(row)
+            if len(candidates) < min(k, n_users - 1):
+                candidates = np.delete(np.arange(n_users), row)
+            if len(candidates) == 0:
+                continue
+
+            sims = self._normalized[candidates] @ self._normalized[row].T
+            sims = (sims.toarray() if sp.issparse(sims) else np.asarray(sims)).ravel()
+
+            k_eff = min(k, len(candidates))
+            top = np.argpartition(-sims, k_eff - 1)[:k_eff]
+            # Desempate determinístico: maior similaridade, depois menor linha
+            order = np.lexsort((candidates[top], -sims[top]))
+            neighbors[i, :k_eff] = candidates[top][order]
+            similarities[i, :k_eff] = sims[top][order]
+        return neighbors, similarities
+
+
+BACKENDS = {
+    "brute": BruteForceIndex,
+    "blocked": BlockedCosineIndex,
+    "lsh": LSHIndex,
+}
+
+
+def make_index(backend: str | None = None) -> NeighborIndex:
+    backend = (backend or KNN_INDEX_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de vizinhos desconhecido: '{backend}'. Opções: {', '.join(BACKENDS)}.")
+    return BACKENDS[backend]()
+
+
+def recall_at_k(approx: np.ndarray, exact: np.ndarray) -> float:
+    """
+    Recall@k médio: fração dos vizinhos exatos (ignorando -1) que aparecem na resposta aproximada.
+    """
+    recalls = []
+    for approx_row, exact_row in zip(approx, exact):
+        expected = exact_row[exact_row >= 0]
+        if len(expected) == 0:
+            continue
+        recalls.append(len(np.intersect1d(approx_row[approx_row >= 0], expected)) / len(expected))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def measure_recall(index: NeighborIndex, features, k: int, sample_size: int | None = 200, seed: int = 0) -> float:
+    """
+    Recall@k do índice contra a busca exata (BlockedCosineIndex em float64), numa amostra de usuários.
+    """
+    n_users = features.shape[0]
+    rows = np.arange(n_users)
+    if sample_size is not None and sample_size < n_users:
+        rows = np.sort(np.random.default_rng(seed).choice(n_users, sample_size, replace=False))
+    exact, _ = BlockedCosineIndex(dtype=np.float64).fit(features).query(rows, k)
+    approx, _ = index.query(rows, k)
+    return recall_at_k(approx, exact)
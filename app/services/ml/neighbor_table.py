@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+
+# Limite de elementos do bloco denso de similaridades (linhas do bloco x usuários) por iteração.
+# 2**24 elementos float64 ~ 128MB.
+MAX_BLOCK_ELEMENTS = int(os.getenv("KNN_MAX_BLOCK_ELEMENTS", str(2 ** 24)))
+
+
+class NeighborTable:
+    """
+    Tabela com os top-K vizinhos de todos os usuários.
+    - user_ids: id_usuario de cada linha (mesma ordem da matriz usuário x item)
+    - neighbors: int32 (n_usuarios x k) com a LINHA de cada vizinho (-1 quando não há vizinho)
+    - similarities: float32 (n_usuarios x k) com a similaridade de cosseno correspondente
+    """
+    FILES = ("user_ids.npy", "neighbors.npy", "similarities.npy")
+
+    def __init__(self, user_ids: np.ndarray, neighbors: np.ndarray, similarities: np.ndarray):
+        self.user_ids = user_ids
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+
+    def lookup(self, row: int, k: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vizinhos (linhas) e similaridades de um usuário, já ordenados. Custo O(k).
+        """
+        k_val = self.k if k is None else min(k, self.k)
+        rows = self.neighbors[row, :k_val]
+        valid = rows >= 0
+        return rows[valid], self.similarities[row, :k_val][valid]
+
+    def remap(self, user_ids: np.ndarray) -> "NeighborTable":
+        """
+        Mesma tabela sobre um novo vetor de usuários (ordenado, contendo todos os atuais): as linhas
+        e os vizinhos passam para as novas posições, e os usuários novos ficam sem vizinhos (-1).
+        """
+        new_pos = np.searchsorted(user_ids, self.user_ids)
+        neighbors = np.full((len(user_ids), self.k), -1, dtype=np.int32)
+        similarities = np.zeros((len(user_ids), self.k), dtype=np.float32)
+        valid = self.neighbors >= 0
+        neighbors[new_pos] = np.where(valid, new_pos[np.where(valid, self.neighbors, 0)], -1)
+        similarities[new_pos] = self.similarities
+        return NeighborTable(user_ids, neighbors, similarities)
+
+    def save(self, path: str):
+        """
+        Salva os arrays como .npy separados para permitir np.load(mmap_mode='r').
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, arr in zip(self.FILES, (self.user_ids, self.neighbors, self.similarities)):
+            np.save(os.path.join(path, name), arr)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "NeighborTable":
+        """
+        Carrega a tabela salva por save(); com mmap=True as páginas são compartilhadas entre processos.
+        """
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, name), mmap_mode=mode) for name in cls.FILES]
+        return cls(*arrays)
+
+
+def _normalize_rows(features, dtype=np.float64):
+    """
+    Normaliza cada linha pela norma L2 (linhas zeradas permanecem zeradas).
+    """
+    if sp.issparse(features):
+        features = sp.csr_matrix(features, dtype=dtype)
+        norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return (sp.diags((1.0 / norms).astype(dtype)) @ features).tocsr()
+    features = np.asarray(features, dtype=dtype)
+    norms = np.linalg.norm(features, axis=1)
+    norms[norms == 0] = 1.0
+    return features / norms[:, None]
+
+
+def top_k_neighbors(normalized, transposed, rows: np.ndarray, k: int,
+                    max_block_elements: int = MAX_BLOCK_ELEMENTS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k vizinhos por cosseno das linhas `rows` de uma matriz já normalizada (transposed = normalized.T).
+    Retorna (vizinhos int32, similaridades float32), ambos (len(rows) x k), com -1 / 0 quando faltam vizinhos.
+    A multiplicação é feita em blocos de linhas, então a memória de pico fica limitada a
+    ~max_block_elements similaridades densas. O próprio usuário é excluído da sua lista de vizinhos.
+    """
+    n_users = normalized.shape[0]
+    k_eff = max(0, min(k, n_users - 1))
+    neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+    similarities = np.zeros((len(rows), k), dtype=np.float32)
+    if len(rows) == 0 or k_eff == 0:
+        return neighbors, similarities
+
+    block_size = max(1, max_block_elements // n_users)
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        sims = normalized[rows[start:stop]] @ transposed
+        sims = sims.toarray() if sp.issparse(sims) else np.asarray(sims)
+
+        # Exclui o próprio usuário
+        sims[np.arange(stop - start), rows[start:stop]] = -np.inf
+
+        # Seleção parcial O(n) seguida de ordenação só dos k escolhidos
+        top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        # Desempate determinístico: maior similaridade, depois menor linha
+        order = np.lexsort((top, -top_sims), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+        neighbors[start:stop, :k_eff] = top
+        similarities[start:stop, :k_eff] = top_sims
+
+    return neighbors, similarities
+
+
+def compute_neighbor_table(features, user_ids: np.ndarray, k: int,
+                           max_block_elements: int = MAX_BLOCK_ELEMENTS, dtype=np.float64) -> NeighborTable:
+    """
+    Calcula os top-k vizinhos por similaridade de cosseno para todos os usuários de uma vez
+    (ver top_k_neighbors). dtype=np.float32 reduz memória e tempo da multiplicação pela metade.
+    """
+    n_users = features.shape[0]
+    if n_users == 0:
+        return NeighborTable(user_ids, np.full((0, k), -1, dtype=np.int32), np.zeros((0, k), dtype=np.float32))
+
+    normalized = _normalize_rows(features, dtype)
+    transposed = normalized.T.tocsc() if sp.issparse(normalized) else normalized.T
+    neighbors, similarities = top_k_neighbors(normalized, transposed, np.arange(n_users), k, max_block_elements)
+    return NeighborTable(user_ids, neighbors, similarities)
@@ -1,5 +1,16 @@
+import os
+from itertools import chain
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from instrumentacao import etapa
 
+# Linhas lidas por vez do cursor no servidor ao carregar as avaliações (load_columns)
+RATINGS_CHUNK_SIZE = int(os.getenv("RATINGS_CHUNK_SIZE", "50000"))
+# dtypes de (id_usuario, id_item, nota): ids INT do MySQL cabem em int32 e as notas (1 a 5) em int8
+RATING_DTYPES = (np.int32, np.int32, np.int8)
+
+@etapa("matriz.pivot")
 def create_user_restaurant_matrix(data: list[dict]) -> pd.DataFrame:
     """
     Pivot: cria matriz de usuários vs restaurantes usando as notas como valores.
@@ -21,6 +32,7 @@ def create_user_restaurant_matrix(data: list[dict]) -> pd.DataFrame:
     return matrix
 
 
+@etapa("matriz.pivot")
 def create_user_meal_matrix(data: list[dict]) -> pd.DataFrame:
     """
     Pivot: cria matriz de usuários vs refeições usando as notas como valores.
@@ -39,3 +51,168 @@ def create_user_meal_matrix(data: list[dict]) -> pd.DataFrame:
     # Preenche valores nulos com 0 conforme a Task 3.1
     matrix = matrix.fillna(0)
     return matrix
+
+
+class SparseUserItemMatrix:
+    """
+    Matriz usuários x itens esparsa (CSR) com os mapeamentos id <-> linha/coluna.
+    Linhas e colunas seguem a ordem crescente dos ids, como no pivot_table.
+    """
+    def __init__(self, matrix: sp.csr_matrix, user_ids: np.ndarray, item_ids: np.ndarray):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.matrix.shape
+
+    @property
+    def empty(self) -> bool:
+        return self.matrix.nnz == 0
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def user_row(self, user_id: int) -> int | None:
+        """Linha do usuário na matriz, ou None se ele não tiver avaliações."""
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos < len(self.user_ids) and self.user_ids[pos] == user_id:
+            return pos
+        return None
+
+    def item_col(self, item_id: int) -> int | None:
+        """Coluna do item na matriz, ou None se ele não tiver avaliações."""
+        pos = int(np.searchsorted(self.item_ids, item_id))
+        if pos < len(self.item_ids) and self.item_ids[pos] == item_id:
+            return pos
+        return None
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Versão densa equivalente à gerada por create_user_*_matrix (uso em debug/testes)."""
+        return pd.DataFrame(self.matrix.toarray(), index=self.user_ids, columns=self.item_ids)
+
+    FILES = ("user_ids.npy", "item_ids.npy", "data.npy", "indices.npy", "indptr.npy")
+
+    def save(self, path: str):
+        """
+        Salva os mapeamentos e os arrays do CSR como .npy separados (np.load(mmap_mode='r')
+        compartilha as páginas entre processos, o que um .npz compactado não permite).
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = (self.user_ids, self.item_ids, self.matrix.data, self.matrix.indices, self.matrix.indptr)
+        for name, arr in zip(self.FILES, arrays):
+            np.save(os.path.join(path, name), arr)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "SparseUserItemMatrix":
+        mode = "r" if mmap else None
+        user_ids, item_ids, data, indices, indptr = (
+            np.load(os.path.join(path, name), mmap_mode=mode) for name in cls.FILES
+        )
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(user_ids), len(item_ids)), copy=False)
+        return cls(matrix, user_ids, item_ids)
+
+
+@etapa("matriz.esparsa")
+def build_sparse_matrix(user_ids: np.ndarray, item_ids: np.ndarray, notas: np.ndarray) -> SparseUserItemMatrix:
+    """
+    Monta a matriz CSR a partir de três colunas paralelas (id_usuario, id_item, nota).
+    Ids são convertidos em códigos inteiros compactos; pares duplicados viram a média,
+    como o aggfunc='mean' do pivot_table.
+    """
+    user_ids = np.asarray(user_ids)
+    item_ids = np.asarray(item_ids)
+    notas = np.asarray(notas, dtype=np.float64)
+
+    users, rows = np.unique(user_ids, return_inverse=True)
+    items, cols = np.unique(item_ids, return_inverse=True)
+
+    # Chave linear por célula para agregar duplicados sem materializar a matriz densa
+    keys = rows.astype(np.int64) * len(items) + cols
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    if len(unique_keys) == len(keys):
+        values = notas
+        rows_u, cols_u = rows, cols
+    else:
+        values = np.bincount(inverse, weights=notas) / np.bincount(inverse)
+        rows_u = unique_keys // len(items)
+        cols_u = unique_keys % len(items)
+
+    matrix = sp.csr_matrix((values, (rows_u, cols_u)), shape=(len(users), len(items)))
+    # Mapeamentos sempre em int64, mesmo quando as colunas vêm compactas (ver load_columns)
+    return SparseUserItemMatrix(matrix, users.astype(np.int64, copy=False), items.astype(np.int64, copy=False))
+
+
+@etapa("matriz.carga")
+def load_columns(session, stmt, dtypes: tuple, size_hint: int = 0,
+                 chunk_size: int = RATINGS_CHUNK_SIZE) -> tuple[np.ndarray, ...]:
+    """
+    Lê as colunas inteiras de `stmt` (ex.: select(id_usuario, id_item, nota)) em blocos de chunk_size
+    linhas, por um cursor no servidor (stream_results; SSCursor no PyMySQL), direto para arrays NumPy
+    pré-alocados com os `dtypes` informados: sem objetos ORM nem a lista de todas as linhas em memória.
+    size_hint (ex.: o count(*) de versao_atual) dimensiona os arrays; se vierem mais linhas, eles crescem.
+    """
+    buffers = [np.empty(size_hint, dtype=dtype) for dtype in dtypes]
+    total = 0
+    result = session.exec(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for chunk in result.partitions(chunk_size):
+        # np.fromiter sobre as linhas achatadas: np.array(chunk) trata cada Row como sequência genérica
+        # e chega a ser uma ordem de grandeza mais lento
+        bloco = np.fromiter(chain.from_iterable(chunk), dtype=np.int64, count=len(chunk) * len(dtypes))
+        bloco = bloco.reshape(-1, len(dtypes))
+        fim = total + len(bloco)
+        if fim > len(buffers[0]):
+            capacidade = max(fim, 2 * len(buffers[0]))
+            novos = [np.empty(capacidade, dtype=dtype) for dtype in dtypes]
+            for novo, antigo in zip(novos, buffers):
+                novo[:total] = antigo[:total]
+            buffers = novos
+        for j, buffer in enumerate(buffers):
+            buffer[total:fim] = bloco[:, j]
+        total = fim
+    return tuple(buffer[:total] for buffer in buffers)
+
+
+def upsert_ratings(matrix: SparseUserItemMatrix, user_ids: np.ndarray, item_ids: np.ndarray,
+                   notas: np.ndarray) -> SparseUserItemMatrix:
+    """
+    Nova matriz com as notas (id_usuario, id_item, nota) inseridas ou substituídas (a nota nova
+    prevalece sobre a da matriz). Trabalha só em memória: custo O(nnz log nnz), sem reler a tabela.
+    """
+    coo = matrix.matrix.tocoo()
+    users = np.concatenate([np.asarray(user_ids, dtype=np.int64), matrix.user_ids[coo.row].astype(np.int64)])
+    items = np.concatenate([np.asarray(item_ids, dtype=np.int64), matrix.item_ids[coo.col].astype(np.int64)])
+    values = np.concatenate([np.asarray(notas, dtype=np.float64), coo.data])
+
+    # np.unique devolve a primeira ocorrência de cada par: a das notas novas
+    _, first = np.unique(users * (2 ** 32) + items, return_index=True)
+    return build_sparse_matrix(users[first], items[first], values[first])
+
+
+def _create_sparse_matrix(data: list[dict], item_col: str) -> SparseUserItemMatrix:
+    if not data:
+        return build_sparse_matrix(np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([]))
+
+    if not all(col in data[0] for col in ['id_usuario', item_col, 'nota']):
+        raise ValueError(f"Dados insuficientes: faltando id_usuario, {item_col} ou nota")
+
+    return build_sparse_matrix(
+        np.fromiter((d['id_usuario'] for d in data), dtype=np.int64, count=len(data)),
+        np.fromiter((d[item_col] for d in data), dtype=np.int64, count=len(data)),
+        np.fromiter((d['nota'] for d in data), dtype=np.float64, count=len(data)),
+    )
+
+
+def create_sparse_user_restaurant_matrix(data: list[dict]) -> SparseUserItemMatrix:
+    """
+    Versão esparsa de create_user_restaurant_matrix: memória proporcional ao número de avaliações.
+    """
+    return _create_sparse_matrix(data, 'id_restaurante')
+
+
+def create_sparse_user_meal_matrix(data: list[dict]) -> SparseUserItemMatrix:
+    """
+    Versão esparsa de create_user_meal_matrix: memória proporcional ao número de avaliações.
+    """
+    return _create_sparse_matrix(data, 'id_refeicao')
@@ -0,0 +1,192 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from services.ml.pre_pocessing.processor import SparseUserItemMatrix
+from services.ml.neighbor_table import top_k_neighbors, _normalize_rows
+
+# Vizinhos (itens mais similares) guardados por item na matriz item x item
+KNN_ITEM_TOP_M = int(os.getenv("KNN_ITEM_TOP_M", "50"))
+# Atualização incremental da matriz item x item só enquanto os itens alterados forem no máximo esta
+# fração dos itens (acima disso, recálculo completo no update)
+KNN_ITEM_DELTA_MAX_FRACAO = float(os.getenv("KNN_ITEM_DELTA_MAX_FRACAO", "0.1"))
+
+
+class ItemKNNRecommender:
+    def __init__(self, top_m: int = KNN_ITEM_TOP_M):
+        """
+        Filtragem colaborativa baseada em itens: a similaridade de cosseno entre itens (colunas
+        da matriz usuário x item) é pré-calculada no fit, guardando apenas os top_m vizinhos de
+        cada item numa matriz esparsa. Na consulta, a nota prevista de um item não avaliado é a
+        média das notas do próprio usuário nos vizinhos desse item, ponderada pela similaridade:
+            previsto(u, j) = sum_i S[j, i] * r(u, i) / sum_i S[j, i]   (i avaliados por u)
+        O custo por usuário é proporcional às suas avaliações x top_m, não ao total de usuários.
+        """
+        self.top_m = top_m
+        self.matrix: SparseUserItemMatrix = None
+        self.user_ids: np.ndarray = None
+        self.item_ids: np.ndarray = None
+        self.similarity: sp.csr_matrix = None
+        self._ratings: sp.csr_matrix = None
+        self._rated: sp.csr_matrix = None
+        self._similarity_t: sp.csr_matrix = None
+        self._user_pos: dict[int, int] = {}
+
+    FILES = ("data.npy", "indices.npy", "indptr.npy")
+
+    def fit(self, matrix: pd.DataFrame | SparseUserItemMatrix, similarity: sp.csr_matrix | None = None):
+        """
+        Calcula a matriz item x item top-M. Aceita o DataFrame do pivot_table ou a SparseUserItemMatrix.
+        similarity: matriz item x item já calculada para esta mesma matriz (ex.: carregada por load).
+        """
+        if isinstance(matrix, pd.DataFrame):
+            matrix = SparseUserItemMatrix(
+                sp.csr_matrix(matrix.values, dtype=np.float64), matrix.index.to_numpy(), matrix.columns.to_numpy()
+            )
+        self.matrix = matrix
+        self.user_ids = matrix.user_ids
+        self.item_ids = matrix.item_ids
+        self._user_pos = {int(uid): pos for pos, uid in enumerate(self.user_ids)}
+
+        self._ratings = sp.csr_matrix(matrix.matrix, dtype=np.float64)
+        self._rated = self._ratings.copy()
+        self._rated.data = (self._rated.data != 0).astype(np.float64)
+
+        n_items = len(self.item_ids)
+        if similarity is not None:
+            self.similarity = similarity
+        elif matrix.empty:
+            self.similarity = sp.csr_matrix((n_items, n_items), dtype=np.float32)
+        else:
+            # Itens como linhas (item x usuário), normalizados: produto = cosseno entre itens
+            normalized = _normalize_rows(self._ratings.T.tocsr(), np.float32)
+            neighbors, sims = top_k_neighbors(normalized, normalized.T.tocsc(), np.arange(n_items), self.top_m)
+            valid = (neighbors >= 0) & (sims > 0)
+            rows = np.repeat(np.arange(n_items), valid.sum(axis=1))
+            self.similarity = sp.csr_matrix(
+                (sims[valid], (rows, neighbors[valid])), shape=(n_items, n_items), dtype=np.float32
+            )
+        # r(u, :) @ S^T percorre só as linhas de S^T dos itens avaliados por u
+        self._similarity_t = self.similarity.T.tocsr().astype(np.float64)
+        return self
+
+    def update(self, matrix: SparseUserItemMatrix, changed_items: np.ndarray) -> "ItemKNNRecommender":
+        """
+        Novo recomendador sobre `matrix` (a matriz atual com notas inseridas/alteradas) recalculando na
+        matriz item x item só as linhas que podem mudar com `changed_items` (itens com notas novas):
+        - as dos próprios itens alterados
+        - as que têm um item alterado entre os top_m vizinhos (a similaridade com ele mudou)
+        - as em que um item alterado agora alcança a sua menor similaridade guardada (ou que têm
+          menos de top_m vizinhos e passaram a ter similaridade positiva com um deles)
+        As demais são só remapeadas: a similaridade entre dois itens não alterados não muda.
+        Com mais de KNN_ITEM_DELTA_MAX_FRACAO dos itens alterados, recalcula tudo (fit).
+        """
+        n_items = len(matrix.item_ids)
+        changed = np.searchsorted(matrix.item_ids, np.asarray(changed_items, dtype=np.int64))
+        if len(changed) > KNN_ITEM_DELTA_MAX_FRACAO * n_items:
+            return ItemKNNRecommender(self.top_m).fit(matrix)
+
+        new_pos = np.searchsorted(matrix.item_ids, self.item_ids)
+        old = self.similarity.tocoo()
+        previous = sp.csr_matrix((old.data, (new_pos[old.row], new_pos[old.col])), shape=(n_items, n_items))
+        if not len(changed):
+            return ItemKNNRecommender(self.top_m).fit(matrix, previous.astype(np.float32))
+
+        normalized = _normalize_rows(sp.csr_matrix(matrix.matrix, dtype=np.float64).T.tocsr(), np.float32)
+        counts = np.diff(previous.indptr)
+        lowest = np.zeros(n_items, dtype=np.float32)
+        filled = counts > 0
+        if filled.any():
+            lowest[filled] = np.minimum.reduceat(previous.data, previous.indptr[:-1][filled])
+        best = (normalized @ normalized[changed].T).max(axis=1).toarray().ravel()
+        rows = np.repeat(np.arange(n_items), counts)
+        has_changed = rows[np.isin(previous.indices, changed)]
+        affected = np.union1d(changed, np.union1d(has_changed, np.flatnonzero(
+            np.where(counts >= self.top_m, best >= lowest, best > 0)
+        )))
+
+        keep = ~np.isin(rows, affected)
+        rows, cols, data = rows[keep], previous.indices[keep], previous.data[keep]
+        neighbors, sims = top_k_neighbors(normalized, normalized.T.tocsc(), affected, self.top_m)
+        valid = (neighbors >= 0) & (sims > 0)
+        rows = np.concatenate([rows, np.repeat(affected, valid.sum(axis=1))])
+        cols = np.concatenate([cols, neighbors[valid]])
+        data = np.concatenate([data, sims[valid]])
+
+        similarity = sp.csr_matrix((data, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+        return ItemKNNRecommender(self.top_m).fit(matrix, similarity)
+
+    def save(self, path: str):
+        """
+        Salva a matriz item x item como .npy separados (CSR), para np.load(mmap_mode='r').
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, arr in zip(self.FILES, (self.similarity.data, self.similarity.indices, self.similarity.indptr)):
+            np.save(os.path.join(path, name), arr)
+
+    @classmethod
+    def load(cls, path: str, matrix: SparseUserItemMatrix, mmap: bool = True, top_m: int = KNN_ITEM_TOP_M) -> "ItemKNNRecommender":
+        """
+        Recomendador sobre `matrix` com a matriz item x item salva por save() (sem recalcular vizinhos).
+        """
+        mode = "r" if mmap else None
+        data, indices, indptr = (np.load(os.path.join(path, name), mmap_mode=mode) for name in cls.FILES)
+        n_items = len(matrix.item_ids)
+        similarity = sp.csr_matrix((data, indices, indptr), shape=(n_items, n_items), copy=False)
+        return cls(top_m).fit(matrix, similarity)
+
+    def has_user(self, user_id: int) -> bool:
+        """
+        Indica se o usuário tem avaliações na matriz (False = Cold Start).
+        """
+        return user_id in self._user_pos
+
+    def recommend_items(self, user_id: int, k=None, min_score: float = 3.0, weighted: bool = True) -> list[int]:
+        """
+        Itens não avaliados com nota prevista >= min_score, da maior para a menor.
+        k e weighted existem só pela compatibilidade com KNNRecommender (a previsão já é ponderada
+        pela similaridade e o número de vizinhos é o top_m do fit).
+        """
+        return self.recommend_items_batch([user_id], min_score=min_score).get(user_id, [])
+
+    def recommend_items_batch(self, user_ids: list[int], k=None, min_score: float = 3.0,
+                              weighted: bool = True) -> dict[int, list[int]]:
+        """
+        Versão em lote: R(lote) @ S^T (somas ponderadas) e indicadora(lote) @ S^T (pesos),
+        ambos esparsos, para todos os usuários de uma vez. Usuários em Cold Start ficam de fora.
+        """
+        known = [u for u in dict.fromkeys(user_ids) if u in self._user_pos]
+        result = {u: [] for u in known}
+        if not known or self.matrix.empty:
+            return result
+
+        positions = [self._user_pos[u] for u in known]
+        sums = (self._ratings[positions] @ self._similarity_t).tocsr()
+        weights = (self._rated[positions] @ self._similarity_t).tocsr()
+        sums.sort_indices()
+        weights.sort_indices()
+
+        for i, u in enumerate(known):
+            cols = weights.indices[weights.indptr[i]:weights.indptr[i + 1]]
+            w = weights.data[weights.indptr[i]:weights.indptr[i + 1]]
+            sum_cols = sums.indices[sums.indptr[i]:sums.indptr[i + 1]]
+            sum_vals = sums.data[sums.indptr[i]:sums.indptr[i + 1]]
+
+            # Alinha as somas às colunas dos pesos (ambas ordenadas): O(m log m), m = itens vizinhos
+            aligned = np.zeros(len(cols))
+            if len(sum_cols):
+                pos = np.searchsorted(sum_cols, cols).clip(max=len(sum_cols) - 1)
+                found = sum_cols[pos] == cols
+                aligned[found] = sum_vals[pos[found]]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                predicted = np.where(w > 0, aligned / w, 0.0)
+
+            own = self._ratings.indices[self._ratings.indptr[positions[i]]:self._ratings.indptr[positions[i] + 1]]
+            keep = (w > 0) & (predicted >= min_score) & ~np.isin(cols, own)
+            cols, predicted = cols[keep], predicted[keep]
+
+            # Ordenação estável pela nota prevista decrescente (empate: menor id do item primeiro)
+            order = np.lexsort((cols, -predicted))
+            result[u] = [int(item_id) for item_id in self.item_ids[cols[order]]]
+
+        return result
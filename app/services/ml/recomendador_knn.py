@@ -1,55 +1,192 @@
 import pandas as pd
-from sklearn.neighbors import NearestNeighbors
 import numpy as np
+import scipy.sparse as sp
+from services.ml.pre_pocessing.processor import SparseUserItemMatrix
+from services.ml.neighbor_table import NeighborTable, MAX_BLOCK_ELEMENTS
+from services.ml.neighbor_index import NeighborIndex, make_index
+from instrumentacao import etapa
 
 class KNNRecommender:
-    def __init__(self, k_neighbors: int):
+    def __init__(self, k_neighbors: int, index_backend: str | None = None):
         """
-        Inicializa o wrapper do NearestNeighbors.
-        Métrica deve ser cosine e algoritmo brute.
+        Inicializa o recomendador com o backend de busca de vizinhos (similaridade de cosseno).
+        index_backend: "brute" (NearestNeighbors exato), "blocked" (exato, float32 em blocos)
+        ou "lsh" (aproximado); padrão em KNN_INDEX_BACKEND (ver neighbor_index).
         """
         self.k_neighbors = k_neighbors
-        self.model = NearestNeighbors(n_neighbors=self.k_neighbors, metric='cosine', algorithm='brute')
-        self.matrix: pd.DataFrame = None
+        self.index: NeighborIndex = make_index(index_backend)
+        self.matrix: pd.DataFrame | SparseUserItemMatrix = None
+        self.user_ids: np.ndarray = None
+        self.item_ids: np.ndarray = None
+        self._features = None
+        self._user_pos: dict[int, int] = {}
+        self.neighbor_table: NeighborTable = None
+        self._rated = None
 
-    def fit(self, matrix: pd.DataFrame):
+    def fit(self, matrix: pd.DataFrame | SparseUserItemMatrix):
         """
         Carrega a matriz para a memória e treina o modelo.
+        Aceita o DataFrame denso do pivot_table ou a SparseUserItemMatrix (CSR).
         """
         self.matrix = matrix
-        if not self.matrix.empty:
+        if isinstance(matrix, SparseUserItemMatrix):
+            self.user_ids = matrix.user_ids
+            self.item_ids = matrix.item_ids
+            self._features = matrix.matrix
+        else:
+            self.user_ids = matrix.index.to_numpy()
+            self.item_ids = matrix.columns.to_numpy()
             # O Numpy Array extraído do DataFrame será mantido na memória (Stateless para a execução atual)
-            self.model.fit(self.matrix.values)
+            self._features = matrix.values
+        self._user_pos = {int(uid): pos for pos, uid in enumerate(self.user_ids)}
+        self.neighbor_table = None
+        self._rated = None
 
-    def get_neighbors(self, user_id: int, k=None) -> list[int]:
+        if not self.matrix.empty:
+            with etapa("knn.fit"):
+                self.index.fit(self._features)
+
+    def precompute_neighbors(self, k=None):
         """
-        Retorna uma lista contendo os IDs dos usuários mais similares.
+        Calcula de uma vez os vizinhos de todos os usuários (ver neighbor_table).
+        Depois disso get_neighbors vira uma consulta O(1) na tabela.
+        """
+        k_val = k if k is not None else self.k_neighbors
+        with etapa("knn.tabela_vizinhos"):
+            self.neighbor_table = self.index.build_table(self.user_ids, k_val)
+        return self.neighbor_table
+
+    def has_user(self, user_id: int) -> bool:
+        """
+        Indica se o usuário tem avaliações na matriz (False = Cold Start).
+        """
+        return user_id in self._user_pos
+
+    def get_neighbor_rows(self, user_id: int, k=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (linhas na matriz, similaridades de cosseno) dos vizinhos mais próximos.
         """
+        empty = (np.array([], dtype=np.int64), np.array([], dtype=np.float32))
         if self.matrix is None or self.matrix.empty:
-            return []
-            
-        if user_id not in self.matrix.index:
+            return empty
+
+        user_index = self._user_pos.get(user_id)
+        if user_index is None:
             # Caso o usuário nunca tenha avaliado antes (Cold Start)
-            return []
-            
+            return empty
+
         k_val = k if k is not None else self.k_neighbors
-        
-        # Consideramos buscar (k+1) porque a própria distância pro usuário alvo entrará como primeira
-        n_neighbors_to_fetch = min(k_val + 1, len(self.matrix))
-        if n_neighbors_to_fetch == 0:
-            return []
-            
-        # Pega a feature row do usuário alvo
-        user_index = self.matrix.index.get_loc(user_id)
-        user_features = self.matrix.iloc[user_index, :].values.reshape(1, -1)
-        
-        distances, indices = self.model.kneighbors(user_features, n_neighbors=n_neighbors_to_fetch)
-        
-        # Remapeia o índice do numpy para o 'id_usuario' da matriz pandas
-        neighbors_ids = []
-        for idx in indices.flatten():
-            n_id = self.matrix.index[idx]
-            if n_id != user_id:
-                neighbors_ids.append(int(n_id))
-                
-        return neighbors_ids[:k_val]
+
+        # Caminho rápido: vizinhos já pré-calculados para todos os usuários
+        if self.neighbor_table is not None and k_val <= self.neighbor_table.k:
+            return self.neighbor_table.lookup(user_index, k_val)
+
+        with etapa("knn.vizinhos"):
+            neighbors, sims = self.index.query(np.array([user_index]), k_val)
+        valid = neighbors[0] >= 0
+        return neighbors[0][valid], sims[0][valid]
+
+    def get_neighbors(self, user_id: int, k=None) -> list[int]:
+        """
+        Retorna uma lista contendo os IDs dos usuários mais similares.
+        """
+        rows, _ = self.get_neighbor_rows(user_id, k)
+        # Remapeia o índice do numpy para o 'id_usuario' da matriz
+        return [int(uid) for uid in self.user_ids[rows]]
+
+    def get_neighbor_rows_batch(self, user_ids: list[int], k=None) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        """
+        Vizinhos (linhas, similaridades) de vários usuários. Sem a tabela pré-calculada,
+        faz uma única consulta ao índice para todos. Usuários em Cold Start ficam de fora.
+        """
+        known = [u for u in dict.fromkeys(user_ids) if u in self._user_pos]
+        if not known or self.matrix is None or self.matrix.empty:
+            return {}
+
+        k_val = k if k is not None else self.k_neighbors
+        if self.neighbor_table is not None and k_val <= self.neighbor_table.k:
+            return {u: self.neighbor_table.lookup(self._user_pos[u], k_val) for u in known}
+
+        positions = np.array([self._user_pos[u] for u in known])
+        neighbors, sims = self.index.query(positions, k_val)
+
+        result = {}
+        for u, rows, row_sims in zip(known, neighbors, sims):
+            valid = rows >= 0
+            result[u] = (rows[valid], row_sims[valid])
+        return result
+
+    def _rated_indicator(self):
+        """
+        Indicadora de "usuário avaliou o item" com a mesma esparsidade da matriz (calculada uma vez).
+        """
+        if self._rated is None:
+            if sp.issparse(self._features):
+                rated = sp.csr_matrix(self._features, copy=True)
+                rated.data = (rated.data != 0).astype(np.float64)
+            else:
+                rated = (self._features != 0).astype(np.float64)
+            self._rated = rated
+        return self._rated
+
+    def recommend_items(self, user_id: int, k=None, min_score: float = 3.0, weighted: bool = False) -> list[int]:
+        """
+        Ranqueia os itens pela nota média dada pelos vizinhos, direto na matriz usuário x item:
+        seleciona as linhas dos vizinhos e soma/conta por coluna.
+        - weighted=True usa a média ponderada pela similaridade de cada vizinho.
+        Remove itens já avaliados pelo usuário e com média < min_score.
+        """
+        return self.recommend_items_batch([user_id], k=k, min_score=min_score, weighted=weighted).get(user_id, [])
+
+    def recommend_items_batch(self, user_ids: list[int], k=None, min_score: float = 3.0,
+                              weighted: bool = False) -> dict[int, list[int]]:
+        """
+        Versão em lote de recommend_items. Monta uma matriz esparsa de pesos W (usuários do lote x
+        usuários da base, um peso por vizinho) e calcula W @ M (somas) e W @ indicadora (contagens)
+        para todos de uma vez, em blocos de linhas para limitar a memória.
+        """
+        with etapa("knn.vizinhos"):
+            neighbors = self.get_neighbor_rows_batch(user_ids, k)
+        users = [u for u, (rows, _) in neighbors.items() if len(rows) > 0]
+        result = {u: [] for u in neighbors}
+        if not users:
+            return result
+
+        with etapa("knn.scoring"):
+            indptr = np.zeros(len(users) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(neighbors[u][0]) for u in users])
+            indices = np.concatenate([neighbors[u][0] for u in users])
+            if weighted:
+                data = np.concatenate([neighbors[u][1] for u in users]).astype(np.float64)
+            else:
+                data = np.ones(len(indices), dtype=np.float64)
+            weights = sp.csr_matrix((data, indices, indptr), shape=(len(users), len(self.user_ids)))
+
+            rated = self._rated_indicator()
+            n_items = len(self.item_ids)
+            block_size = max(1, MAX_BLOCK_ELEMENTS // max(n_items, 1))
+
+            for start in range(0, len(users), block_size):
+                block_users = users[start:start + block_size]
+                w = weights[start:start + len(block_users)]
+
+                # w @ M = soma (ponderada) por coluna, sem laço em Python
+                sums = w @ self._features
+                counts = w @ rated
+                sums = sums.toarray() if sp.issparse(sums) else np.asarray(sums)
+                counts = counts.toarray() if sp.issparse(counts) else np.asarray(counts)
+
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    means = np.where(counts > 0, sums / counts, 0.0)
+
+                own = self._features[[self._user_pos[u] for u in block_users]]
+                already_rated = (own.toarray() if sp.issparse(own) else np.asarray(own)) != 0
+
+                mask = (counts > 0) & (means >= min_score) & ~already_rated
+                for u, row_mask, row_means in zip(block_users, mask, means):
+                    cols = np.flatnonzero(row_mask)
+                    # Ordenação estável pela média decrescente (empate: menor id do item primeiro)
+                    ranked = cols[np.argsort(-row_means[cols], kind="stable")]
+                    result[u] = [int(item_id) for item_id in self.item_ids[ranked]]
+
+        return result
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def top_indices(scores: np.ndarray, limit: int | None = None, offset: int = 0) -> np.ndarray:
+    """
+    Índices de `scores` em ordem decrescente (empate: menor índice primeiro), da posição
+    `offset` até `offset + limit`. Mesmo resultado de np.argsort(-scores, kind="stable")[offset:offset + limit],
+    mas com seleção parcial (np.partition): O(n + k log k), com k = offset + limit.
+    """
+    n = len(scores)
+    fim = n if limit is None else min(offset + limit, n)
+    if offset >= fim:
+        return np.empty(0, dtype=np.intp)
+
+    if fim < n:
+        # k-ésimo maior score: tudo acima dele entra, e dos empatados entram os de menor índice
+        limiar = np.partition(scores, n - fim)[n - fim]
+        acima = np.flatnonzero(scores > limiar)
+        empatados = np.flatnonzero(scores == limiar)[:fim - len(acima)]
+        selecionados = np.concatenate([acima, empatados])
+    else:
+        selecionados = np.arange(n)
+
+    ordem = np.lexsort((selecionados, -scores[selecionados]))
+    return selecionados[ordem][offset:fim]
+
+
+def primeiros_por_grupo(grupos: np.ndarray, n: int | None) -> np.ndarray:
+    """
+    Máscara que mantém, para cada valor de `grupos`, apenas as `n` primeiras ocorrências
+    (na ordem do vetor). n=None mantém tudo.
+    """
+    if n is None:
+        return np.ones(len(grupos), dtype=bool)
+    ordem = np.argsort(grupos, kind="stable")
+    ordenados = grupos[ordem]
+    inicio_grupo = np.r_[0, np.flatnonzero(ordenados[1:] != ordenados[:-1]) + 1]
+    tamanho_grupo = np.diff(np.r_[inicio_grupo, len(ordenados)])
+    posicao_no_grupo = np.arange(len(ordenados)) - np.repeat(inicio_grupo, tamanho_grupo)
+    mantem = np.zeros(len(grupos), dtype=bool)
+    mantem[ordem[posicao_no_grupo < n]] = True
+    return mantem
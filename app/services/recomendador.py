@@ -1,13 +1,11 @@
-from sqlmodel import Session, select, col
-from sqlalchemy import func 
-from models.db_models import (
-    UsuarioRestricao, 
-    IngredienteRestricao, 
-    RefeicaoIngrediente, 
-    Refeicao,
-    UsuarioAvalia,
-    Restaurante
-)
+import numpy as np
+from sqlmodel import Session
+from services.indice_restricoes import indice_restricoes
+from services.estatisticas_restaurantes import estatisticas_restaurantes
+from services.catalogo import catalogo
+from services.cache_resultados import cacheado, versao_recomendador
+from services.paginacao import top_indices, primeiros_por_grupo
+from instrumentacao import etapa
 from typing import List, Dict
 
 def recall_por_restricao(session: Session, id_usuario: int) -> list[int]:
@@ -15,176 +13,247 @@ def recall_por_restricao(session: Session, id_usuario: int) -> list[int]:
     Passo 1: Recupera todas as refeições que NÃO contêm ingredientes
     conflitantes com as restrições do usuário.
     """
-    
-    # 1. Buscar IDs das restrições do usuário
-    # SQL: SELECT id_restricao FROM usuario_restricao WHERE id_usuario = ...
-    statement_restricoes = select(UsuarioRestricao.id_restricao).where(
-        UsuarioRestricao.id_usuario == id_usuario
-    )
-    ids_restricoes = session.exec(statement_restricoes).all()
-
-    # Se o usuário não tem restrições, retorna todas as refeições disponíveis
-    if not ids_restricoes:
-        statement_all = select(Refeicao.id_refeicao).where(Refeicao.disponivel == True)
-        return session.exec(statement_all).all()
-
-    # 2. Buscar IDs dos ingredientes que possuem essas restrições
-    # SQL: SELECT id_ingrediente FROM ingrediente_restricao WHERE id_restricao IN (...)
-    statement_ingredientes = select(IngredienteRestricao.id_ingrediente).where(
-        col(IngredienteRestricao.id_restricao).in_(ids_restricoes)
-    )
-    ids_ingredientes_proibidos = session.exec(statement_ingredientes).all()
-
-    # Se não há ingredientes proibidos vinculados, retorna tudo
-    if not ids_ingredientes_proibidos:
-        statement_all = select(Refeicao.id_refeicao).where(Refeicao.disponivel == True)
-        return session.exec(statement_all).all()
-
-    # 3. Buscar IDs das refeições que contêm esses ingredientes proibidos
-    # SQL: SELECT id_refeicao FROM refeicao_ingrediente WHERE id_ingrediente IN (...)
-    statement_refeicoes_proibidas = select(RefeicaoIngrediente.id_refeicao).where(
-        col(RefeicaoIngrediente.id_ingrediente).in_(ids_ingredientes_proibidos)
-    )
-    ids_refeicoes_proibidas = session.exec(statement_refeicoes_proibidas).unique().all()
-
-    # 4. Buscar as refeições finais (Todas DISPONIVEIS exceto as proibidas)
-    # SQL: SELECT id_refeicao FROM refeicao WHERE disponivel=1 AND id_refeicao NOT IN (...)
-    query_final = select(Refeicao.id_refeicao).where(
-        Refeicao.disponivel == True
-    )
-    
-    if ids_refeicoes_proibidas:
-        query_final = query_final.where(
-            col(Refeicao.id_refeicao).not_in(ids_refeicoes_proibidas)
-        )
-
-    candidatos = session.exec(query_final).all()
-    
-    return list(candidatos)
+    # Usa o índice de bitsets em memória (ver services/indice_restricoes.py):
+    # candidatas = disponiveis AND NOT (OR das refeições proibidas por cada restrição do usuário)
+    indice = indice_restricoes.get(session)
+    with etapa("recall"):
+        return indice.candidatos(id_usuario)
+
+
+def recall_por_restricao_lote(session: Session, ids_usuarios: list[int]) -> Dict[int, list[int]]:
+    """
+    Recall para vários usuários com um único índice. Usuários com o mesmo conjunto
+    de restrições compartilham o mesmo cálculo.
+    """
+    indice = indice_restricoes.get(session)
+    with etapa("recall"):
+        por_restricoes = {}
+        resultado = {}
+        for id_usuario in ids_usuarios:
+            chave = tuple(sorted(indice.restricoes_usuario.get(id_usuario, ())))
+            if chave not in por_restricoes:
+                por_restricoes[chave] = indice.candidatos(id_usuario)
+            resultado[id_usuario] = por_restricoes[chave]
+    return resultado
+
+
+def _compativeis_por_restaurante(session: Session, id_usuario: int):
+    """
+    Recall + contagem de refeições compatíveis por restaurante sobre o snapshot do catálogo
+    (um np.bincount sobre a máscara de candidatas, sem consultas extras).
+    Retorna (catalogo, máscara de candidatas no catálogo,
+    códigos dos restaurantes na ordem da primeira refeição compatível, contagens).
+    """
+    indice = indice_restricoes.get(session)
+    cat = catalogo.get(session)
+    with etapa("recall.restaurantes"):
+        mascara = cat.alinha_mascara(indice.ids_refeicao, indice.mascara_candidatas(id_usuario))
+        codigos, contagem = cat.restaurantes_compativeis(mascara)
+    return cat, mascara, codigos, contagem
+
+
+def restaurantes_candidatos(session: Session, id_usuario: int) -> list[int]:
+    """
+    Restaurantes com pelo menos uma refeição do recall do usuário (ordem do catálogo).
+    """
+    cat, _, codigos, _ = _compativeis_por_restaurante(session, id_usuario)
+    return [int(rid) for rid in cat.ids_restaurante[codigos]]
 
 
 def rankeia_por_score(
     session: Session,
     id_usuario: int,
     peso_nota: float = 0.7,
-    peso_qtd: float = 0.3
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
 ) -> List[Dict]:
+    """
+    Recall + ranking por score (média do restaurante + volume de avaliações).
+    limit/offset paginam o ranking; só as refeições da página são montadas.
+    """
+    return rankeia_por_score_com_total(session, id_usuario, peso_nota, peso_qtd, limit, offset)[0]
+
 
+@cacheado(versao_recomendador)
+def rankeia_por_score_com_total(
+    session: Session,
+    id_usuario: int,
+    peso_nota: float = 0.7,
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
+) -> tuple[List[Dict], int]:
+    """
+    (página de rankeia_por_score, tamanho do ranking completo), do mesmo recall e snapshot.
+    """
     # 1) Recall
     candidatos = recall_por_restricao(session, id_usuario)
     if not candidatos:
-        return []
+        return [], 0
 
-    # 2) Buscar informações das refeições
-    stmt_ref = select(
-        Refeicao.id_refeicao,
-        Refeicao.nome,
-        Refeicao.preco,
-        Refeicao.id_restaurante
-    ).where(col(Refeicao.id_refeicao).in_(candidatos))
-
-    refeicoes_rows = session.exec(stmt_ref).all()
-
-    # 3) Agregar média e quantidade de avaliações por restaurante
-    stmt_agg = select(
-        UsuarioAvalia.id_restaurante,
-        func.avg(UsuarioAvalia.nota).label("nota_media"),
-        func.count(UsuarioAvalia.nota).label("qtd_avaliacoes")
-    ).group_by(UsuarioAvalia.id_restaurante)
-
-    agg_rows = session.exec(stmt_agg).all()
-
-    agg_map = {
-        r[0]: {
-            "nota_media": float(r[1]) if r[1] is not None else 0.0,
-            "qtd_avaliacoes": int(r[2])
-        }
-        for r in agg_rows
-    }
+    cat = catalogo.get(session)
+    estatisticas = estatisticas_restaurantes.get(session)
+    # 2) Score de cada candidata + seleção parcial da página
+    with etapa("score.ranking"):
+        posicoes = _posicoes_no_catalogo(cat, candidatos)
+        scores_rest = _scores_restaurantes(cat, estatisticas, peso_nota, peso_qtd)
+        pagina = top_indices(scores_rest[cat.rest_codigo[posicoes]], limit, offset)
 
-    max_qtd = max((v["qtd_avaliacoes"] for v in agg_map.values()), default=0)
+    # 3) Informações apenas das refeições da página
+    return _monta_refeicoes_rankeadas(cat, estatisticas, scores_rest, posicoes[pagina]), len(posicoes)
 
-    # 4) Buscar nomes dos restaurantes
-    ids_restaurantes = list({row[3] for row in refeicoes_rows})
 
-    stmt_rest = select(Restaurante.id_restaurante, Restaurante.nome).where(
-        col(Restaurante.id_restaurante).in_(ids_restaurantes)
-    )
-    rest_rows = session.exec(stmt_rest).all()
+def _posicoes_no_catalogo(cat, ids_refeicao: list[int]) -> np.ndarray:
+    """
+    Posições no catálogo dos ids informados (em ordem crescente de id); ids que não estão
+    no catálogo são descartados.
+    """
+    if len(cat.ids_refeicao) == 0:
+        return np.empty(0, dtype=np.intp)
+    ids = np.asarray(ids_refeicao, dtype=np.int64)
+    posicoes = np.searchsorted(cat.ids_refeicao, ids).clip(max=len(cat.ids_refeicao) - 1)
+    return posicoes[cat.ids_refeicao[posicoes] == ids]
 
-    # dicionário id_restaurante → nome_restaurante
-    restaurante_map = {r[0]: r[1] for r in rest_rows}
 
-    # 5) Montar resultado final com score + nome restaurante
-    resultados = []
+def _scores_restaurantes(cat, estatisticas, peso_nota: float, peso_qtd: float) -> np.ndarray:
+    """
+    Score de cada restaurante do catálogo (o score de uma refeição é o do seu restaurante),
+    arredondado como na resposta: o ranking usa o score arredondado.
+    """
+    max_qtd = estatisticas.max_qtd
+    media, qtd = estatisticas.alinhadas(cat)
+    popularidade_norm = (qtd / max_qtd) if max_qtd > 0 else np.zeros(len(qtd))
+
+    return _arredonda_4((media * peso_nota) + (popularidade_norm * peso_qtd * 5))
+
+
+def _arredonda_4(valores: np.ndarray) -> np.ndarray:
+    """
+    round(v, 4) do Python, vetorizado: np.round escala por 10^4 e erra alguns casos
+    de meio; esses poucos valores perto de x.5 na 5ª casa são refeitos com round().
+    """
+    arredondados = np.round(valores, 4)
+    escalados = valores * 1e4
+    duvidosos = np.flatnonzero(np.abs(escalados - np.floor(escalados) - 0.5) < 1e-6)
+    for i in duvidosos.tolist():
+        arredondados[i] = round(float(valores[i]), 4)
+    return arredondados
 
-    for rid, nome_ref, preco, id_rest in refeicoes_rows:
-        stats = agg_map.get(id_rest, {"nota_media": 0.0, "qtd_avaliacoes": 0})
-        nota_media = stats["nota_media"]
-        qtd_av = stats["qtd_avaliacoes"]
 
-        popularidade_norm = (qtd_av / max_qtd) if max_qtd > 0 else 0
+def _monta_refeicoes_rankeadas(cat, estatisticas, scores_rest: np.ndarray,
+                               posicoes: np.ndarray) -> List[Dict]:
+    """
+    Monta a resposta das refeições nas posições do catálogo informadas (na mesma ordem),
+    com nome e preço lidos das colunas do snapshot (sem consultas).
+    """
+    if len(posicoes) == 0:
+        return []
+    with etapa("score.montagem"):
+        return _monta_refeicoes(cat, estatisticas, scores_rest, posicoes)
 
-        score = (nota_media * peso_nota) + (popularidade_norm * peso_qtd * 5)
 
+def _monta_refeicoes(cat, estatisticas, scores_rest: np.ndarray, posicoes: np.ndarray) -> List[Dict]:
+    resultados = []
+    for pos in posicoes.tolist():
+        codigo = int(cat.rest_codigo[pos])
+        id_rest = int(cat.ids_restaurante[codigo])
         resultados.append({
-            "id_refeicao": rid,
-            "nome_refeicao": nome_ref,
-            "preco": float(preco),
+            "id_refeicao": int(cat.ids_refeicao[pos]),
+            "nome_refeicao": cat.nomes_refeicao[pos],
+            "preco": float(cat.precos[pos]),
             "id_restaurante": id_rest,
-            "nome_restaurante": restaurante_map.get(id_rest, "Desconhecido"),
+            "nome_restaurante": cat.nome_restaurante(id_rest),
 
-            "nota_media_restaurante": round(nota_media, 3),
-            "qtd_avaliacoes_restaurante": qtd_av,
+            "nota_media_restaurante": round(estatisticas.media(id_rest), 3),
+            "qtd_avaliacoes_restaurante": estatisticas.qtd_avaliacoes(id_rest),
 
-            "score": round(score, 4)
+            "score": float(scores_rest[codigo])
         })
+    return resultados
 
-    return sorted(resultados, key=lambda x: x["score"], reverse=True)
 
-def rankeia_restaurante(session: Session, id_usuario: int) -> List[Dict]:
+def rankeia_por_score_lote(
+    session: Session,
+    ids_usuarios: list[int],
+    peso_nota: float = 0.7,
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
+) -> Dict[int, List[Dict]]:
     """
-    Conta quantas refeições compatíveis (após recall) cada restaurante tem
-    e retorna ranking com id, nome e quantidade de refeições compatíveis.
+    rankeia_por_score para vários usuários (ver rankeia_por_score_lote_com_totais).
     """
-    # 1) recall (retorna lista de ids de refeicao)
-    candidatos = recall_por_restricao(session, id_usuario)
-    if not candidatos:
-        return []
+    return rankeia_por_score_lote_com_totais(session, ids_usuarios, peso_nota, peso_qtd, limit, offset)[0]
 
-    # 2) buscar id_refeicao -> id_restaurante para os candidatos
-    stmt_ref = select(Refeicao.id_refeicao, Refeicao.id_restaurante).where(
-        col(Refeicao.id_refeicao).in_(candidatos)
-    )
-    refeicoes_rows = session.exec(stmt_ref).all()  # lista de (id_refeicao, id_restaurante)
-    if not refeicoes_rows:
-        return []
 
-    # 3) contar quantas refeições compatíveis por restaurante
-    contagem = {}
-    for _, id_rest in refeicoes_rows:
-        contagem[id_rest] = contagem.get(id_rest, 0) + 1
+def rankeia_por_score_lote_com_totais(
+    session: Session,
+    ids_usuarios: list[int],
+    peso_nota: float = 0.7,
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
+) -> tuple[Dict[int, List[Dict]], Dict[int, int]]:
+    """
+    rankeia_por_score para vários usuários: ordena uma única vez a união dos candidatos,
+    filtra o ranking pelos candidatos de cada usuário (a ordem relativa é preservada)
+    e monta as refeições de todas as páginas uma única vez.
+    O score de uma refeição só depende do seu restaurante, então isso equivale ao ranking individual.
+    Retorna (páginas, tamanho do ranking completo de cada usuário).
+    """
+    candidatos_por_usuario = recall_por_restricao_lote(session, ids_usuarios)
+    uniao = sorted(set().union(*candidatos_por_usuario.values())) if candidatos_por_usuario else []
+    if not uniao:
+        return {id_usuario: [] for id_usuario in ids_usuarios}, {id_usuario: 0 for id_usuario in ids_usuarios}
+
+    cat = catalogo.get(session)
+    estatisticas = estatisticas_restaurantes.get(session)
+    with etapa("score.ranking"):
+        posicoes = _posicoes_no_catalogo(cat, uniao)
+        scores_rest = _scores_restaurantes(cat, estatisticas, peso_nota, peso_qtd)
+        posicoes_ordenadas = posicoes[top_indices(scores_rest[cat.rest_codigo[posicoes]])]
+        ids_ordenados = cat.ids_refeicao[posicoes_ordenadas]
+        fim = None if limit is None else offset + limit
+
+        paginas = {}
+        totais = {}
+        for id_usuario, candidatos in candidatos_por_usuario.items():
+            ranking = posicoes_ordenadas[np.isin(ids_ordenados, candidatos)]
+            paginas[id_usuario] = ranking[offset:fim]
+            totais[id_usuario] = len(ranking)
+
+    todas = np.unique(np.concatenate(list(paginas.values())))
+    por_id = {
+        r["id_refeicao"]: r
+        for r in _monta_refeicoes_rankeadas(cat, estatisticas, scores_rest, todas)
+    }
+    return {
+        id_usuario: [por_id[rid] for rid in cat.ids_refeicao[pagina].tolist() if rid in por_id]
+        for id_usuario, pagina in paginas.items()
+    }, totais
 
-    if not contagem:
+@cacheado(versao_recomendador)
+def rankeia_restaurante(session: Session, id_usuario: int, limit: int | None = None, offset: int = 0) -> List[Dict]:
+    """
+    Conta quantas refeições compatíveis (após recall) cada restaurante tem
+    e retorna ranking com id, nome e quantidade de refeições compatíveis.
+    """
+    # 1) recall + 2) contar quantas refeições compatíveis por restaurante (vetorizado)
+    cat, _, codigos, contagem = _compativeis_por_restaurante(session, id_usuario)
+    if len(codigos) == 0:
         return []
 
-    ids_restaurantes = list(contagem.keys())
-
-    # 4) buscar nomes dos restaurantes
-    stmt_rest = select(Restaurante.id_restaurante, Restaurante.nome).where(
-        col(Restaurante.id_restaurante).in_(ids_restaurantes)
-    )
-    rest_rows = session.exec(stmt_rest).all()  # lista de (id_restaurante, nome)
-    rest_map = {r[0]: r[1] for r in rest_rows}
-
-    # 5) montar lista ordenada pelo número de refeições compatíveis (desc)
-    resultado = []
-    for id_rest, qtd in sorted(contagem.items(), key=lambda x: x[1], reverse=True):
-        resultado.append({
-            "id_restaurante": int(id_rest),
-            "nome_restaurante": rest_map.get(id_rest, "Desconhecido"),
-            "qtd_refeicoes_compativeis": int(qtd)
-        })
+    # 3) montar lista ordenada pelo número de refeições compatíveis (desc)
+    with etapa("restaurante.ranking"):
+        resultado = []
+        for pos in top_indices(contagem, limit, offset):
+            id_rest = int(cat.ids_restaurante[codigos[pos]])
+            resultado.append({
+                "id_restaurante": id_rest,
+                "nome_restaurante": cat.nome_restaurante(id_rest),
+                "qtd_refeicoes_compativeis": int(contagem[pos])
+            })
 
     return resultado
 
@@ -193,131 +262,119 @@ def rankeia_restaurante_composto(
     id_usuario: int,
     w_compat: float = 0.6,
     w_avg: float = 0.2,
-    w_rev: float = 0.2
+    w_rev: float = 0.2,
+    limit: int | None = None,
+    offset: int = 0,
+    max_refeicoes: int | None = None
 ) -> List[Dict]:
+    """
+    Ranking de restaurantes por compatibilidade, média e volume de avaliações.
+    limit/offset paginam os restaurantes e max_refeicoes limita refeicoes_compativeis
+    de cada um (as de menor id); só os restaurantes da página recebem refeições.
+    """
+    return rankeia_restaurante_composto_com_total(
+        session, id_usuario, w_compat, w_avg, w_rev, limit, offset, max_refeicoes
+    )[0]
 
-    candidatos = recall_por_restricao(session, id_usuario)
-    if not candidatos:
-        return []
-
-    stmt_ref = select(
-        Refeicao.id_refeicao,
-        Refeicao.id_restaurante
-    ).where(col(Refeicao.id_refeicao).in_(candidatos))
-
-    rows = session.exec(stmt_ref).all()
-    if not rows:
-        return []
-
-    rest_compat = {}
-    for _, id_rest in rows:
-        rest_compat[id_rest] = rest_compat.get(id_rest, 0) + 1
-
-    ids_restaurantes = list(rest_compat.keys())
-
-    stmt_total = select(
-        Refeicao.id_restaurante,
-        func.count(Refeicao.id_refeicao)
-    ).where(col(Refeicao.id_restaurante).in_(ids_restaurantes)) \
-     .group_by(Refeicao.id_restaurante)
-
-    total_rows = session.exec(stmt_total).all()
-    rest_total = {r[0]: r[1] for r in total_rows}
-
-    compat = {}
-    for rid in ids_restaurantes:
-        compat[rid] = rest_compat[rid] / rest_total.get(rid, 1)
-
-    stmt_eval = select(
-        UsuarioAvalia.id_restaurante,
-        UsuarioAvalia.nota
-    ).where(col(UsuarioAvalia.id_restaurante).in_(ids_restaurantes))
-
-    eval_rows = session.exec(stmt_eval).all()
 
-    soma_nota = {}
-    qtd_nota = {}
+@cacheado(versao_recomendador)
+def rankeia_restaurante_composto_com_total(
+    session: Session,
+    id_usuario: int,
+    w_compat: float = 0.6,
+    w_avg: float = 0.2,
+    w_rev: float = 0.2,
+    limit: int | None = None,
+    offset: int = 0,
+    max_refeicoes: int | None = None
+) -> tuple[List[Dict], int]:
+    """
+    (página de rankeia_restaurante_composto, quantidade de restaurantes compatíveis), do mesmo recall.
+    """
+    # Recall + refeições compatíveis e tamanho do cardápio por restaurante (snapshot do catálogo)
+    cat, mascara, codigos, contagem = _compativeis_por_restaurante(session, id_usuario)
+    if len(codigos) == 0:
+        return [], 0
 
-    for rid, nota in eval_rows:
-        soma_nota[rid] = soma_nota.get(rid, 0) + nota
-        qtd_nota[rid] = qtd_nota.get(rid, 0) + 1
+    with etapa("composto.ranking"):
+        ids_restaurantes = [int(rid) for rid in cat.ids_restaurante[codigos]]
+        rest_compat = dict(zip(ids_restaurantes, contagem.tolist()))
+        rest_total = dict(zip(ids_restaurantes, cat.qtd_cardapio[codigos].tolist()))
 
-    media_aval = {}
-    total_aval = {}
+        compat = {}
+        for rid in ids_restaurantes:
+            compat[rid] = rest_compat[rid] / rest_total.get(rid, 1)
 
-    for rid in ids_restaurantes:
-        total = qtd_nota.get(rid, 0)
-        total_aval[rid] = total
-        media_aval[rid] = (soma_nota.get(rid, 0) / total) if total > 0 else 0.0
+        estatisticas = estatisticas_restaurantes.get(session)
 
-    max_media = max(media_aval.values()) if media_aval else 1
-    min_media = min(media_aval.values()) if media_aval else 0
+        media_aval = {}
+        total_aval = {}
 
-    media_norm = {}
-    if max_media == min_media:
-        for rid in ids_restaurantes:
-            media_norm[rid] = 1.0 if media_aval[rid] > 0 else 0.0
-    else:
         for rid in ids_restaurantes:
-            media_norm[rid] = (media_aval[rid] - min_media) / (max_media - min_media)
-
-    max_reviews = max(total_aval.values()) if total_aval else 1
-    reviews_norm = {
-        rid: (total_aval[rid] / max_reviews) if max_reviews > 0 else 0.0
-        for rid in ids_restaurantes
-    }
+            total_aval[rid] = estatisticas.qtd_avaliacoes(rid)
+            media_aval[rid] = estatisticas.media(rid)
+
+        max_media = max(media_aval.values()) if media_aval else 1
+        min_media = min(media_aval.values()) if media_aval else 0
+
+        media_norm = {}
+        if max_media == min_media:
+            for rid in ids_restaurantes:
+                media_norm[rid] = 1.0 if media_aval[rid] > 0 else 0.0
+        else:
+            for rid in ids_restaurantes:
+                media_norm[rid] = (media_aval[rid] - min_media) / (max_media - min_media)
+
+        max_reviews = max(total_aval.values()) if total_aval else 1
+        reviews_norm = {
+            rid: (total_aval[rid] / max_reviews) if max_reviews > 0 else 0.0
+            for rid in ids_restaurantes
+        }
 
-    score_final = {}
-    for rid in ids_restaurantes:
-        score_final[rid] = (
-            compat[rid] * w_compat
-            + media_norm[rid] * w_avg
-            + reviews_norm[rid] * w_rev
-        )
-
-    stmt_rest = select(Restaurante.id_restaurante, Restaurante.nome).where(
-        col(Restaurante.id_restaurante).in_(ids_restaurantes)
-    )
-    rest_rows = session.exec(stmt_rest).all()
-    rest_nomes = {r[0]: r[1] for r in rest_rows}
-
-    resultado = []
-    for rid in sorted(score_final, key=score_final.get, reverse=True):
-        resultado.append({
-            "id_restaurante": rid,
-            "nome_restaurante": rest_nomes.get(rid, "Desconhecido"),
-            "compatibilidade_percent": round(compat[rid] * 100, 1),
-            "media_avaliacao": round(media_aval[rid], 2),
-            "total_avaliacoes": total_aval[rid],
-            "score_final": round(score_final[rid], 4),
-            "qtd_refeicoes_compativeis": rest_compat[rid]
-        })
+        score_final = {}
+        for rid in ids_restaurantes:
+            score_final[rid] = (
+                compat[rid] * w_compat
+                + media_norm[rid] * w_avg
+                + reviews_norm[rid] * w_rev
+            )
+
+        # Seleção parcial da página (empate: ordem da primeira refeição compatível, como no sort estável)
+        pagina = top_indices(np.array([score_final[rid] for rid in ids_restaurantes]), limit, offset)
+
+        resultado = []
+        for pos in pagina.tolist():
+            rid = ids_restaurantes[pos]
+            resultado.append({
+                "id_restaurante": rid,
+                "nome_restaurante": cat.nome_restaurante(rid),
+                "compatibilidade_percent": round(compat[rid] * 100, 1),
+                "media_avaliacao": round(media_aval[rid], 2),
+                "total_avaliacoes": total_aval[rid],
+                "score_final": round(score_final[rid], 4),
+                "qtd_refeicoes_compativeis": rest_compat[rid]
+            })
 
     # ---------------------------
-    # REFEIÇÕES COMPATÍVEIS POR RESTAURANTE (NOVO BLOCO)
+    # REFEIÇÕES COMPATÍVEIS POR RESTAURANTE (apenas da página, até max_refeicoes cada)
     # ---------------------------
-    stmt_ref_info = select(
-        Refeicao.id_refeicao,
-        Refeicao.id_restaurante,
-        Refeicao.nome,
-        Refeicao.descricao,
-        Refeicao.preco,
-    ).where(col(Refeicao.id_refeicao).in_(candidatos))
-
-    ref_info_rows = session.exec(stmt_ref_info).all()
-
-    refeicoes_por_rest = {rid: [] for rid in ids_restaurantes}
-
-    for r in ref_info_rows:
-        refeicoes_por_rest[r.id_restaurante].append({
-            "id_refeicao": r.id_refeicao,
-            "nome": r.nome,
-            "descricao": r.descricao,
-            "preco": r.preco,
-        })
-
-    for item in resultado:
-        rid = item["id_restaurante"]
-        item["refeicoes_compativeis"] = refeicoes_por_rest.get(rid, [])
-
-    return resultado
+    with etapa("composto.montagem"):
+        selecionadas = np.flatnonzero(mascara & np.isin(cat.rest_codigo, codigos[pagina]))
+        selecionadas = selecionadas[primeiros_por_grupo(cat.rest_codigo[selecionadas], max_refeicoes)]
+
+        # Nome, descrição e preço vêm das colunas do snapshot do catálogo (sem consulta)
+        refeicoes_por_rest = {item["id_restaurante"]: [] for item in resultado}
+
+        for pos in selecionadas.tolist():
+            refeicoes_por_rest[int(cat.ids_restaurante[cat.rest_codigo[pos]])].append({
+                "id_refeicao": int(cat.ids_refeicao[pos]),
+                "nome": cat.nomes_refeicao[pos],
+                "descricao": cat.descricoes[pos],
+                "preco": float(cat.precos[pos]),
+            })
+
+        for item in resultado:
+            rid = item["id_restaurante"]
+            item["refeicoes_compativeis"] = refeicoes_por_rest.get(rid, [])
+
+    return resultado, len(codigos)
@@ -0,0 +1,32 @@
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+import connection
+from services.snapshot_holder import somente_leitura
+
+# Execução dos serviços síncronos a partir das rotas assíncronas (api/endpoints_async.py).
+# - modo "memoria" (índice, catálogo, rankings vetorizados, KNN, fatoração, lotes): trabalho de CPU
+#   sobre os snapshots em memória, que pode montar/atualizar um deles (travas de thread, NumPy/ALS).
+#   Roda no threadpool com uma sessão síncrona, para não parar o event loop.
+# - modo "sql": a conta é do banco; roda via AsyncSession.run_sync, onde as consultas usam o driver
+#   asyncio (greenlet) e liberam o event loop enquanto esperam o MySQL. Lá dentro nenhum snapshot é
+#   montado (somente_leitura): se um serviço sql passar a depender de um, falha em vez de travar o loop.
+
+
+def _em_thread(fn, *args, **kwargs):
+    with Session(connection.engine) as session:
+        return fn(session, *args, **kwargs)
+
+
+def _no_banco(sync_session, fn, *args, **kwargs):
+    with somente_leitura():
+        return fn(sync_session, *args, **kwargs)
+
+
+async def executa(session: AsyncSession, fn, *args, modo: str = "memoria", **kwargs):
+    """
+    fn(session, *args, **kwargs) sem bloquear o event loop (ver o comentário acima).
+    """
+    if modo == "sql":
+        return await session.run_sync(_no_banco, fn, *args, **kwargs)
+    return await run_in_threadpool(_em_thread, fn, *args, **kwargs)
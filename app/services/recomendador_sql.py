@@ -0,0 +1,364 @@
+from sqlmodel import Session, select
+from sqlalchemy import func, exists, literal, literal_column, case, and_
+from models.db_models import (
+    UsuarioRestricao,
+    IngredienteRestricao,
+    RefeicaoIngrediente,
+    Refeicao,
+    UsuarioAvalia,
+    Restaurante
+)
+from typing import List, Dict
+
+# Modo "sql": cada função monta UMA instrução com CTEs e anti-join (NOT EXISTS),
+# sem trazer a lista de candidatos para o Python e devolvê-la num IN (...).
+
+
+def _candidatos_cte(id_usuario: int):
+    """
+    CTE com as refeições disponíveis sem nenhum ingrediente proibido para o usuário:
+    SELECT ... FROM refeicao r WHERE r.disponivel AND NOT EXISTS (
+        SELECT 1 FROM refeicao_ingrediente ri
+        JOIN ingrediente_restricao ir ON ir.id_ingrediente = ri.id_ingrediente
+        JOIN usuario_restricao ur ON ur.id_restricao = ir.id_restricao
+        WHERE ri.id_refeicao = r.id_refeicao AND ur.id_usuario = :id_usuario)
+    """
+    proibida = (
+        select(literal(1))
+        .select_from(RefeicaoIngrediente)
+        .join(IngredienteRestricao, IngredienteRestricao.id_ingrediente == RefeicaoIngrediente.id_ingrediente)
+        .join(UsuarioRestricao, UsuarioRestricao.id_restricao == IngredienteRestricao.id_restricao)
+        .where(RefeicaoIngrediente.id_refeicao == Refeicao.id_refeicao)
+        .where(UsuarioRestricao.id_usuario == id_usuario)
+    )
+    return (
+        select(
+            Refeicao.id_refeicao,
+            Refeicao.id_restaurante,
+            Refeicao.nome,
+            Refeicao.descricao,
+            Refeicao.preco
+        )
+        .where(Refeicao.disponivel == True)
+        .where(~exists(proibida))
+        .cte("candidatos")
+    )
+
+
+def _real(expr):
+    """
+    expr em ponto flutuante (DOUBLE), como as contas do modo em memória. O SQLAlchemy não gera
+    CAST(... AS DOUBLE) para o MySQL (que faria a divisão em DECIMAL com 4 casas): multiplicar
+    por um literal em notação científica, que é DOUBLE no MySQL e REAL no SQLite, resolve.
+    """
+    return expr * literal_column("1e0")
+
+
+def _avaliacoes_cte():
+    """
+    CTE com média e quantidade de avaliações por restaurante.
+    """
+    return (
+        select(
+            UsuarioAvalia.id_restaurante,
+            (_real(func.sum(UsuarioAvalia.nota)) / func.count(UsuarioAvalia.nota)).label("nota_media"),
+            func.count(UsuarioAvalia.nota).label("qtd_avaliacoes")
+        )
+        .group_by(UsuarioAvalia.id_restaurante)
+        .cte("avaliacoes")
+    )
+
+
+def recall_por_restricao_sql(session: Session, id_usuario: int) -> list[int]:
+    """
+    Passo 1 (modo sql): recall resolvido inteiramente no banco.
+    """
+    candidatos = _candidatos_cte(id_usuario)
+    stmt = select(candidatos.c.id_refeicao).order_by(candidatos.c.id_refeicao)
+    return list(session.exec(stmt).all())
+
+
+def rankeia_por_score_sql(
+    session: Session,
+    id_usuario: int,
+    peso_nota: float = 0.7,
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
+) -> List[Dict]:
+    """
+    Mesmo resultado de rankeia_por_score, com recall, join em restaurante e agregação
+    de usuario_avalia numa única instrução. Só as linhas da página viram dicts.
+    """
+    return rankeia_por_score_sql_com_total(session, id_usuario, peso_nota, peso_qtd, limit, offset)[0]
+
+
+def rankeia_por_score_sql_com_total(
+    session: Session,
+    id_usuario: int,
+    peso_nota: float = 0.7,
+    peso_qtd: float = 0.3,
+    limit: int | None = None,
+    offset: int = 0
+) -> tuple[List[Dict], int]:
+    """
+    (página de rankeia_por_score_sql, tamanho do ranking completo), da mesma instrução:
+    o score é calculado no banco, ORDER BY score DESC, id_refeicao + LIMIT/OFFSET trazem só a
+    página e COUNT(*) OVER () o total de candidatas.
+    """
+    candidatos = _candidatos_cte(id_usuario)
+    avaliacoes = _avaliacoes_cte()
+    max_qtd = select(func.max(avaliacoes.c.qtd_avaliacoes)).scalar_subquery()
+
+    nota_media = func.coalesce(avaliacoes.c.nota_media, 0.0)
+    qtd_av = func.coalesce(avaliacoes.c.qtd_avaliacoes, 0)
+    popularidade_norm = case(
+        (func.coalesce(max_qtd, 0) > 0, _real(qtd_av) / max_qtd),
+        else_=0.0
+    )
+    score = func.round((nota_media * peso_nota) + (popularidade_norm * peso_qtd * 5), 4).label("score")
+
+    stmt = (
+        select(
+            candidatos.c.id_refeicao,
+            candidatos.c.nome,
+            candidatos.c.preco,
+            candidatos.c.id_restaurante,
+            Restaurante.nome.label("nome_restaurante"),
+            nota_media.label("nota_media"),
+            qtd_av.label("qtd_avaliacoes"),
+            score,
+            func.count().over().label("total")
+        )
+        .select_from(candidatos)
+        .outerjoin(Restaurante, Restaurante.id_restaurante == candidatos.c.id_restaurante)
+        .outerjoin(avaliacoes, avaliacoes.c.id_restaurante == candidatos.c.id_restaurante)
+        # Desempate igual ao modo em memória: menor id_refeicao primeiro
+        .order_by(score.desc(), candidatos.c.id_refeicao)
+    )
+    stmt = _pagina(stmt, limit, offset)
+
+    resultados = []
+    total = 0
+    for r in session.exec(stmt).all():
+        total = int(r.total)
+        resultados.append({
+            "id_refeicao": r.id_refeicao,
+            "nome_refeicao": r.nome,
+            "preco": float(r.preco),
+            "id_restaurante": r.id_restaurante,
+            "nome_restaurante": r.nome_restaurante if r.nome_restaurante is not None else "Desconhecido",
+
+            "nota_media_restaurante": round(float(r.nota_media), 3),
+            "qtd_avaliacoes_restaurante": int(r.qtd_avaliacoes),
+
+            "score": float(r.score)
+        })
+    if not resultados and (offset or limit == 0):
+        # Página depois do fim (ou vazia): sem linhas não há COUNT(*) OVER ()
+        total = int(session.exec(select(func.count()).select_from(candidatos)).one())
+    return resultados, total
+
+
+def _pagina(stmt, limit: int | None, offset: int):
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def rankeia_restaurante_sql(session: Session, id_usuario: int, limit: int | None = None, offset: int = 0) -> List[Dict]:
+    """
+    Mesmo resultado de rankeia_restaurante: contagem de refeições compatíveis
+    por restaurante agrupada no banco.
+    """
+    candidatos = _candidatos_cte(id_usuario)
+    qtd = func.count(candidatos.c.id_refeicao)
+
+    # Desempate igual ao modo em memória: ordem da primeira refeição candidata do restaurante
+    stmt = (
+        select(candidatos.c.id_restaurante, Restaurante.nome, qtd)
+        .select_from(candidatos)
+        .outerjoin(Restaurante, Restaurante.id_restaurante == candidatos.c.id_restaurante)
+        .group_by(candidatos.c.id_restaurante, Restaurante.nome)
+        .order_by(qtd.desc(), func.min(candidatos.c.id_refeicao))
+    )
+    # Paginação direto no banco (a ordenação já é total)
+    stmt = _pagina(stmt, limit, offset)
+
+    return [
+        {
+            "id_restaurante": int(id_rest),
+            "nome_restaurante": nome if nome is not None else "Desconhecido",
+            "qtd_refeicoes_compativeis": int(n)
+        }
+        for id_rest, nome, n in session.exec(stmt).all()
+    ]
+
+
+def rankeia_restaurante_composto_sql(
+    session: Session,
+    id_usuario: int,
+    w_compat: float = 0.6,
+    w_avg: float = 0.2,
+    w_rev: float = 0.2,
+    limit: int | None = None,
+    offset: int = 0,
+    max_refeicoes: int | None = None
+) -> List[Dict]:
+    """
+    Mesmo resultado de rankeia_restaurante_composto. Uma única instrução devolve cada refeição
+    candidata junto com os agregados do seu restaurante (refeições compatíveis, total do
+    cardápio, soma e quantidade de notas); o Python só normaliza e monta a resposta.
+    """
+    return rankeia_restaurante_composto_sql_com_total(
+        session, id_usuario, w_compat, w_avg, w_rev, limit, offset, max_refeicoes
+    )[0]
+
+
+def rankeia_restaurante_composto_sql_com_total(
+    session: Session,
+    id_usuario: int,
+    w_compat: float = 0.6,
+    w_avg: float = 0.2,
+    w_rev: float = 0.2,
+    limit: int | None = None,
+    offset: int = 0,
+    max_refeicoes: int | None = None
+) -> tuple[List[Dict], int]:
+    """
+    (página de rankeia_restaurante_composto_sql, quantidade de restaurantes compatíveis).
+    Normalização (MIN/MAX ... OVER ()), score, ORDER BY + LIMIT/OFFSET dos restaurantes e
+    ROW_NUMBER() OVER (PARTITION BY id_restaurante) <= max_refeicoes ficam no banco: só as
+    linhas da página voltam.
+    """
+    candidatos = _candidatos_cte(id_usuario)
+
+    compat = (
+        select(
+            candidatos.c.id_restaurante,
+            func.count(candidatos.c.id_refeicao).label("qtd_compat"),
+            func.min(candidatos.c.id_refeicao).label("primeira")
+        )
+        .group_by(candidatos.c.id_restaurante)
+        .cte("compat")
+    )
+    cardapio = (
+        select(
+            Refeicao.id_restaurante,
+            func.count(Refeicao.id_refeicao).label("qtd_total")
+        )
+        .where(Refeicao.id_restaurante.in_(select(compat.c.id_restaurante)))
+        .group_by(Refeicao.id_restaurante)
+        .cte("cardapio")
+    )
+    notas = (
+        select(
+            UsuarioAvalia.id_restaurante,
+            func.sum(UsuarioAvalia.nota).label("soma_nota"),
+            func.count(UsuarioAvalia.nota).label("qtd_nota")
+        )
+        .where(UsuarioAvalia.id_restaurante.in_(select(compat.c.id_restaurante)))
+        .group_by(UsuarioAvalia.id_restaurante)
+        .cte("notas")
+    )
+
+    # Agregados por restaurante + extremos globais (para a normalização) e total, numa janela única
+    total_aval = func.coalesce(notas.c.qtd_nota, 0)
+    media_aval = case((total_aval > 0, _real(notas.c.soma_nota) / total_aval), else_=0.0)
+    restaurantes = (
+        select(
+            compat.c.id_restaurante,
+            compat.c.primeira,
+            compat.c.qtd_compat,
+            (_real(compat.c.qtd_compat) / func.coalesce(cardapio.c.qtd_total, 1)).label("compat"),
+            total_aval.label("total_aval"),
+            media_aval.label("media_aval"),
+            func.max(media_aval).over().label("max_media"),
+            func.min(media_aval).over().label("min_media"),
+            func.max(total_aval).over().label("max_reviews"),
+            func.count().over().label("total")
+        )
+        .select_from(compat)
+        .outerjoin(cardapio, cardapio.c.id_restaurante == compat.c.id_restaurante)
+        .outerjoin(notas, notas.c.id_restaurante == compat.c.id_restaurante)
+        .cte("restaurantes")
+    )
+    r = restaurantes.c
+    media_norm = case(
+        (r.max_media == r.min_media, case((r.media_aval > 0, 1.0), else_=0.0)),
+        else_=(r.media_aval - r.min_media) / (r.max_media - r.min_media)
+    )
+    reviews_norm = case((r.max_reviews > 0, _real(r.total_aval) / r.max_reviews), else_=0.0)
+    score = (r.compat * w_compat + media_norm * w_avg + reviews_norm * w_rev).label("score_final")
+
+    # Desempate igual ao modo em memória: ordem da primeira refeição candidata do restaurante
+    pagina = _pagina(
+        select(
+            r.id_restaurante, r.primeira, r.qtd_compat, r.compat, r.total_aval, r.media_aval, r.total,
+            score, Restaurante.nome.label("nome_restaurante")
+        )
+        .select_from(restaurantes)
+        .outerjoin(Restaurante, Restaurante.id_restaurante == r.id_restaurante)
+        .order_by(score.desc(), r.primeira),
+        limit, offset
+    ).cte("pagina")
+
+    # Refeições só dos restaurantes da página, as max_refeicoes de menor id de cada um
+    refeicoes = (
+        select(
+            candidatos.c.id_refeicao,
+            candidatos.c.id_restaurante,
+            candidatos.c.nome,
+            candidatos.c.descricao,
+            candidatos.c.preco,
+            func.row_number().over(
+                partition_by=candidatos.c.id_restaurante, order_by=candidatos.c.id_refeicao
+            ).label("ordem")
+        )
+        .where(candidatos.c.id_restaurante.in_(select(pagina.c.id_restaurante)))
+        .subquery("refeicoes")
+    )
+    juncao = refeicoes.c.id_restaurante == pagina.c.id_restaurante
+    if max_refeicoes is not None:
+        juncao = and_(juncao, refeicoes.c.ordem <= max_refeicoes)
+
+    stmt = (
+        select(pagina, refeicoes.c.id_refeicao, refeicoes.c.nome, refeicoes.c.descricao, refeicoes.c.preco)
+        .select_from(pagina)
+        .outerjoin(refeicoes, juncao)
+        .order_by(pagina.c.score_final.desc(), pagina.c.primeira, refeicoes.c.id_refeicao)
+    )
+    rows = session.exec(stmt).all()
+    if not rows:
+        if offset or limit == 0:
+            # Página depois do fim (ou vazia): sem linhas não há COUNT(*) OVER ()
+            return [], int(session.exec(select(func.count()).select_from(compat)).one())
+        return [], 0
+
+    resultado = []
+    por_restaurante = {}
+    for row in rows:
+        item = por_restaurante.get(row.id_restaurante)
+        if item is None:
+            item = por_restaurante[row.id_restaurante] = {
+                "id_restaurante": row.id_restaurante,
+                "nome_restaurante": row.nome_restaurante if row.nome_restaurante is not None else "Desconhecido",
+                "compatibilidade_percent": round(float(row.compat) * 100, 1),
+                "media_avaliacao": round(float(row.media_aval), 2),
+                "total_avaliacoes": int(row.total_aval),
+                "score_final": round(float(row.score_final), 4),
+                "qtd_refeicoes_compativeis": int(row.qtd_compat),
+                "refeicoes_compativeis": []
+            }
+            resultado.append(item)
+        if row.id_refeicao is not None:
+            item["refeicoes_compativeis"].append({
+                "id_refeicao": row.id_refeicao,
+                "nome": row.nome,
+                "descricao": row.descricao,
+                "preco": float(row.preco),
+            })
+
+    return resultado, int(rows[0].total)
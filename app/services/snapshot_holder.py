@@ -0,0 +1,121 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from sqlmodel import Session
+
+
+class SnapshotIndisponivel(RuntimeError):
+    """
+    Leitura somente_leitura() de um snapshot (ou modelo) que ainda não foi publicado.
+    """
+
+
+# Ligado enquanto o código roda no event loop (modo sql via AsyncSession.run_sync, ver
+# services/recomendador_async.py): aí get() só lê o que já foi publicado. Montar ou atualizar pega travas de thread e, se a corrotina
+# que tem a trava ceder o loop esperando o banco, a próxima bloqueia a thread do loop no acquire().
+_somente_leitura: ContextVar[bool] = ContextVar("somente_leitura", default=False)
+
+
+@contextmanager
+def somente_leitura():
+    token = _somente_leitura.set(True)
+    try:
+        yield
+    finally:
+        _somente_leitura.reset(token)
+
+
+def em_somente_leitura() -> bool:
+    return _somente_leitura.get()
+
+
+class SnapshotHolder:
+    """
+    Guarda um snapshot imutável em memória compartilhado entre as requisições.
+    - build_fn(session) monta o snapshot, que deve expor o atributo `versao`
+    - versao_fn(session) calcula a versão atual das tabelas de origem (consulta barata)
+    - delta_fn(session, atual), opcional, aplica só as mudanças ao snapshot atual e retorna o novo
+      (ou None quando a mudança exige reconstrução completa)
+    A versão é conferida no máximo a cada `check_interval` segundos; invalidar() força a reconstrução.
+    Com `max_age`, um snapshot montado há mais tempo que isso é reconstruído por inteiro mesmo com a
+    mesma versão (para mudanças que a impressão digital não enxerga).
+    Com segundo_plano=True (ver services/agendador.py) quem confere a versão e reconstrói é o
+    agendador, e get() só monta o snapshot quando ele ainda não existe.
+    """
+    def __init__(self, nome: str, build_fn: Callable, versao_fn: Callable, check_interval: int,
+                 delta_fn: Callable | None = None, max_age: int | None = None):
+        self.nome = nome
+        self.build_fn = build_fn
+        self.versao_fn = versao_fn
+        self.delta_fn = delta_fn
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._verificado_em = 0.0
+        self._montado_em = 0.0
+        self._publicado_em = 0.0
+        self._lock = threading.Lock()
+        self.segundo_plano = False
+
+    def invalidar(self):
+        """
+        Hook para escritas que alteram as tabelas de origem.
+        """
+        self._snapshot = None
+
+    def build(self, session: Session, desde: float | None = None):
+        """
+        Reconstrução completa. Com `desde` (get) a necessidade é conferida de novo já com o lock:
+        requisições que esperavam o mesmo build recebem o snapshot montado depois desse instante
+        em vez de montar outro.
+        """
+        with self._lock:
+            if desde is not None and self._snapshot is not None and self._montado_em >= desde:
+                return self._snapshot
+            snapshot = self.build_fn(session)
+            # Troca atômica da referência
+            self._snapshot = snapshot
+            self._verificado_em = self._montado_em = self._publicado_em = time.time()
+            return snapshot
+
+    def _expirado(self) -> bool:
+        return self.max_age is not None and time.time() - self._montado_em > self.max_age
+
+    def atualiza(self, session: Session, desde: float | None = None):
+        """
+        Atualização incremental pelo delta_fn quando possível; senão reconstrução completa.
+        Com `desde` (get), como em build: um snapshot publicado (por delta ou build) depois desse
+        instante enquanto a requisição esperava o lock é retornado sem atualizar de novo.
+        """
+        if self._snapshot is not None and self.delta_fn is not None and not self._expirado():
+            with self._lock:
+                if desde is not None and self._snapshot is not None and self._publicado_em >= desde:
+                    return self._snapshot
+                atual = self._snapshot
+                novo = self.delta_fn(session, atual) if atual is not None else None
+                if novo is not None:
+                    self._snapshot = novo
+                    self._verificado_em = self._publicado_em = time.time()
+                    return novo
+        return self.build(session, desde)
+
+    def desatualizado(self, session: Session) -> bool:
+        snapshot = self._snapshot
+        return snapshot is None or self._expirado() or self.versao_fn(session) != snapshot.versao
+
+    def get(self, session: Session):
+        inicio = time.time()
+        snapshot = self._snapshot
+        if em_somente_leitura():
+            if snapshot is None:
+                raise SnapshotIndisponivel(self.nome)
+            return snapshot
+        if snapshot is None:
+            return self.build(session, desde=inicio)
+        if not self.segundo_plano and inicio - self._verificado_em > self.check_interval:
+            self._verificado_em = inicio
+            if self._expirado() or self.versao_fn(session) != snapshot.versao:
+                return self.atualiza(session, desde=inicio)
+        return snapshot
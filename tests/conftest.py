@@ -0,0 +1,96 @@
+import datetime
+import os
+import random
+import sys
+from decimal import Decimal
+
+# connection.py exige as variáveis do banco na importação; os testes usam só SQLite em memória
+os.environ.update(DB_USER="teste", DB_PASSWORD="teste", DB_HOST="localhost", DB_PORT="3306", DB_NAME="teste")
+# Sem artefatos em disco nem cache de resultados: cada teste calcula tudo do zero
+os.environ["MODEL_ARTIFACTS_DIR"] = ""
+os.environ["RESULT_CACHE_BACKEND"] = "desligado"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+from models.db_models import (
+    AdministradorRestaurante, Usuario, Restricao, Restaurante, Ingrediente, Refeicao,
+    IngredienteRestricao, RefeicaoIngrediente, UsuarioRestricao, UsuarioAvalia, RefeicaoAvalia,
+    RefeicaoFavorito
+)
+from services.indice_restricoes import indice_restricoes
+from services.catalogo import catalogo
+from services.estatisticas_restaurantes import estatisticas_restaurantes
+from services.ml.model_registry import model_registry
+
+DATA_INICIAL = datetime.date(2025, 1, 1)
+
+
+def popula(session: Session, seed: int = 0, n_usuarios: int = 60, n_restaurantes: int = 12,
+           n_refeicoes: int = 80, n_ingredientes: int = 30, n_restricoes: int = 5):
+    """
+    Base aleatória (mas reprodutível) com todas as tabelas usadas pelo recall, rankings e modelos.
+    Um em cada dez usuários fica sem avaliações (Cold Start).
+    """
+    rnd = random.Random(seed)
+    session.add(AdministradorRestaurante(id_admin=1, email="admin@teste", nome="admin"))
+    for u in range(1, n_usuarios + 1):
+        session.add(Usuario(id_usuario=u, email=f"{u}@teste", nome=f"usuario {u}"))
+    for r in range(1, n_restricoes + 1):
+        session.add(Restricao(id_restricao=r, tipo=f"restricao {r}"))
+    for r in range(1, n_restaurantes + 1):
+        session.add(Restaurante(id_restaurante=r, ativo=True, bairro="b", cep="0", cidade="c", descricao="d",
+                                logradouro="l", nome=f"Restaurante {r}", numero=1, tipo_comida="t", uf="SP",
+                                id_admin=1))
+    for i in range(1, n_ingredientes + 1):
+        session.add(Ingrediente(id_ingrediente=i, nome=f"ingrediente {i}", id_admin=1))
+    for m in range(1, n_refeicoes + 1):
+        session.add(Refeicao(id_refeicao=m, descricao=f"descricao {m}", disponivel=rnd.random() < 0.85,
+                             nome=f"Refeicao {m}", preco=Decimal(f"{rnd.randint(5, 80)}.{rnd.randint(0, 99):02d}"),
+                             id_restaurante=rnd.randint(1, n_restaurantes)))
+    session.commit()
+
+    for i in range(1, n_ingredientes + 1):
+        for r in rnd.sample(range(1, n_restricoes + 1), rnd.randint(0, 2)):
+            session.add(IngredienteRestricao(id_ingrediente=i, id_restricao=r))
+    for m in range(1, n_refeicoes + 1):
+        for i in rnd.sample(range(1, n_ingredientes + 1), rnd.randint(1, 4)):
+            session.add(RefeicaoIngrediente(id_ingrediente=i, id_refeicao=m))
+    for u in range(1, n_usuarios + 1):
+        for r in rnd.sample(range(1, n_restricoes + 1), rnd.choice([0, 0, 1, 2])):
+            session.add(UsuarioRestricao(id_restricao=r, id_usuario=u))
+        if u % 10 == 0:
+            continue
+        for r in rnd.sample(range(1, n_restaurantes + 1), rnd.randint(1, 6)):
+            session.add(UsuarioAvalia(id_restaurante=r, id_usuario=u, nota=rnd.randint(1, 5), comentario="c",
+                                      data_avaliacao=DATA_INICIAL + datetime.timedelta(days=rnd.randint(0, 300))))
+        for m in rnd.sample(range(1, n_refeicoes + 1), rnd.randint(1, 10)):
+            session.add(RefeicaoAvalia(id_refeicao=m, id_usuario=u, nota=rnd.randint(1, 5), comentario="c",
+                                       data_avaliacao=DATA_INICIAL + datetime.timedelta(days=rnd.randint(0, 300))))
+        for m in rnd.sample(range(1, n_refeicoes + 1), rnd.randint(0, 3)):
+            session.add(RefeicaoFavorito(id_refeicao=m, id_usuario=u))
+    session.commit()
+
+
+@pytest.fixture
+def session():
+    """
+    Sessão sobre um SQLite em memória populado por popula(). Os snapshots e modelos compartilhados
+    pela aplicação são descartados antes e depois, para não vazarem entre testes.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    _descarta_snapshots()
+    with Session(engine) as sessao:
+        popula(sessao)
+        yield sessao
+    _descarta_snapshots()
+    engine.dispose()
+
+
+def _descarta_snapshots():
+    indice_restricoes.invalidar()
+    catalogo.invalidar()
+    estatisticas_restaurantes.invalidar()
+    model_registry._modelos.clear()
@@ -0,0 +1,166 @@
+import datetime
+from decimal import Decimal
+import numpy as np
+import pytest
+from sqlmodel import select
+from models.db_models import (
+    Refeicao, RefeicaoIngrediente, UsuarioRestricao, IngredienteRestricao, UsuarioAvalia
+)
+from services.ml.pre_pocessing.processor import build_sparse_matrix, upsert_ratings
+from services.ml.recomendador_item_knn import ItemKNNRecommender
+from services.ml.model_registry import model_registry, DOMINIOS
+from services.indice_restricoes import build_indice, atualiza_indice
+from conftest import DATA_INICIAL
+
+
+def _triplas(seed: int, n: int, n_usuarios: int = 120, n_itens: int = 80) -> dict:
+    rng = np.random.default_rng(seed)
+    return {(int(u), int(i)): float(nota) for u, i, nota in
+            zip(rng.integers(1, n_usuarios + 1, n), rng.integers(1, n_itens + 1, n), rng.uniform(1, 5, n))}
+
+
+def _matriz(triplas: dict):
+    usuarios, itens = (np.array(coluna, dtype=np.int64) for coluna in zip(*triplas))
+    return build_sparse_matrix(usuarios, itens, np.array(list(triplas.values())))
+
+
+def _iguais(a, b):
+    assert np.array_equal(a.user_ids, b.user_ids)
+    assert np.array_equal(a.item_ids, b.item_ids)
+    assert np.array_equal(a.matrix.toarray(), b.matrix.toarray())
+
+
+def test_upsert_igual_a_matriz_completa():
+    antes = _triplas(0, 1500)
+    # Notas novas: pares já existentes (a nota nova prevalece), usuários e itens novos
+    novas = {par: 5.0 for par in list(antes)[:40]}
+    novas.update({(500, 3): 2.0, (7, 900): 4.0, (501, 901): 1.0})
+    depois = {**antes, **novas}
+
+    usuarios, itens = (np.array(coluna, dtype=np.int64) for coluna in zip(*novas))
+    _iguais(upsert_ratings(_matriz(antes), usuarios, itens, np.array(list(novas.values()))), _matriz(depois))
+
+
+@pytest.mark.parametrize("qtd_itens", [1, 4, 30])  # 30 de 80 itens passa de KNN_ITEM_DELTA_MAX_FRACAO: fit
+def test_item_knn_update_igual_ao_fit(qtd_itens):
+    antes = _triplas(1, 1500)
+    rng = np.random.default_rng(qtd_itens)
+    itens = rng.choice(80, qtd_itens, replace=False) + 1
+    novas = {(int(u), int(i)): float(nota) for u, i, nota in
+             zip(rng.integers(1, 130, 3 * qtd_itens), np.repeat(itens, 3), rng.uniform(1, 5, 3 * qtd_itens))}
+    matriz = _matriz({**antes, **novas})
+
+    for top_m in (5, 50):
+        atualizado = ItemKNNRecommender(top_m).fit(_matriz(antes)).update(matriz, np.unique(itens))
+        completo = ItemKNNRecommender(top_m).fit(matriz)
+        np.testing.assert_allclose(atualizado.similarity.toarray(), completo.similarity.toarray(), atol=1e-6)
+        usuarios = [int(u) for u in matriz.user_ids]
+        assert atualizado.recommend_items_batch(usuarios) == completo.recommend_items_batch(usuarios)
+
+
+def _insere_notas(session, dominio: str):
+    """
+    Notas novas a partir da data mais recente (inclusive edições de notas existentes, com data nova).
+    """
+    tabela, item_col, _ = DOMINIOS[dominio]
+    n_itens = 12 if dominio == "restaurantes" else 80
+    data = DATA_INICIAL + datetime.timedelta(days=400)
+    existente = session.exec(select(tabela).where(tabela.id_usuario == 3)).first()
+    existente.nota = 6 - existente.nota
+    existente.data_avaliacao = data
+    session.add(existente)
+    ja_avaliados = {(a.id_usuario, getattr(a, item_col)) for a in session.exec(select(tabela)).all()}
+    rnd = np.random.default_rng(4)
+    # Usuário sem avaliações (Cold Start) e alguns já conhecidos
+    for id_usuario in (10, 3, 11, 25):
+        for item in rnd.choice(n_itens, 2, replace=False) + 1:
+            if (id_usuario, int(item)) not in ja_avaliados:
+                session.add(tabela(id_usuario=id_usuario, nota=int(rnd.integers(1, 6)), comentario="c",
+                                   data_avaliacao=data, **{item_col: int(item)}))
+    session.commit()
+
+
+@pytest.mark.parametrize("dominio", ["restaurantes", "refeicoes"])
+def test_delta_do_registro_igual_ao_treino_completo(session, dominio):
+    modelo = model_registry._treina(session, dominio, model_registry.versao_atual(session, dominio))
+    _insere_notas(session, dominio)
+
+    delta = model_registry._aplica_delta(session, dominio, modelo)
+    assert delta is not None
+    completo = model_registry._treina(session, dominio, model_registry.versao_atual(session, dominio))
+
+    assert delta.versao == completo.versao
+    assert delta.criado_em == modelo.criado_em
+    _iguais(delta.recommender.matrix, completo.recommender.matrix)
+
+    vizinhos_delta, vizinhos_completo = delta.recommender.neighbor_table, completo.recommender.neighbor_table
+    assert np.array_equal(vizinhos_delta.user_ids, vizinhos_completo.user_ids)
+    np.testing.assert_allclose(vizinhos_delta.similarities, vizinhos_completo.similarities, atol=1e-6)
+    # Vizinhos só podem diferir entre similaridades empatadas
+    diferentes = vizinhos_delta.neighbors != vizinhos_completo.neighbors
+    assert np.all(np.isclose(vizinhos_delta.similarities[diferentes], vizinhos_completo.similarities[diferentes]))
+
+    np.testing.assert_allclose(delta.item_recommender.similarity.toarray(),
+                               completo.item_recommender.similarity.toarray(), atol=1e-6)
+
+    # Fatoração: usuários alterados (inclusive o novo) re-resolvidos com os itens do modelo anterior
+    assert delta.fatoracao.item_factors is modelo.fatoracao.item_factors
+    assert delta.fatoracao.has_user(10) and not modelo.fatoracao.has_user(10)
+
+
+def test_delta_recusado_quando_nota_antiga_muda(session):
+    dominio = "restaurantes"
+    modelo = model_registry._treina(session, dominio, model_registry.versao_atual(session, dominio))
+    # Edição que mantém a data antiga: o delta não a enxerga e a conferência pelos checksums recusa
+    antiga = session.exec(select(UsuarioAvalia).order_by(UsuarioAvalia.data_avaliacao)).first()
+    antiga.nota = 6 - antiga.nota if antiga.nota != 3 else 4
+    session.add(antiga)
+    session.commit()
+    assert model_registry._aplica_delta(session, dominio, modelo) is None
+
+
+def _confere_indice(session, atualizado):
+    completo = build_indice(session)
+    assert atualizado is not None
+    assert atualizado.versao == completo.versao
+    assert np.array_equal(atualizado.ids_refeicao, completo.ids_refeicao)
+    for id_usuario in range(1, 62):
+        assert atualizado.candidatos(id_usuario) == completo.candidatos(id_usuario)
+        assert np.array_equal(atualizado.mascara_proibidas(id_usuario), completo.mascara_proibidas(id_usuario))
+
+
+def test_indice_com_refeicoes_novas_igual_ao_build(session):
+    atual = build_indice(session)
+    for id_refeicao, disponivel in ((81, True), (82, False), (90, True)):
+        session.add(Refeicao(id_refeicao=id_refeicao, descricao="d", disponivel=disponivel, nome="n",
+                             preco=Decimal("10.00"), id_restaurante=1))
+    session.commit()
+    for id_refeicao, id_ingrediente in ((81, 1), (81, 2), (82, 3), (90, 4)):
+        session.add(RefeicaoIngrediente(id_ingrediente=id_ingrediente, id_refeicao=id_refeicao))
+    session.commit()
+    _confere_indice(session, atualiza_indice(session, atual))
+
+
+def test_indice_com_disponibilidade_e_restricoes_alteradas_igual_ao_build(session):
+    atual = build_indice(session)
+    refeicao = session.get(Refeicao, 5)
+    refeicao.disponivel = not refeicao.disponivel
+    session.add(refeicao)
+    for r in session.exec(select(UsuarioRestricao).where(UsuarioRestricao.id_usuario <= 5)).all():
+        session.delete(r)
+    existentes = {(r.id_usuario, r.id_restricao) for r in session.exec(select(UsuarioRestricao)).all()}
+    for par in ((6, 1), (7, 2), (8, 3)):
+        if par not in existentes:
+            session.add(UsuarioRestricao(id_usuario=par[0], id_restricao=par[1]))
+    session.add(Refeicao(id_refeicao=81, descricao="d", disponivel=True, nome="n", preco=Decimal("1.00"), id_restaurante=2))
+    session.commit()
+    _confere_indice(session, atualiza_indice(session, atual))
+
+
+def test_indice_recusa_delta_de_ingrediente_restricao(session):
+    atual = build_indice(session)
+    existentes = {(r.id_ingrediente, r.id_restricao) for r in session.exec(select(IngredienteRestricao)).all()}
+    par = next((i, r) for i in range(1, 31) for r in range(1, 6) if (i, r) not in existentes)
+    session.add(IngredienteRestricao(id_ingrediente=par[0], id_restricao=par[1]))
+    session.commit()
+    assert atualiza_indice(session, atual) is None
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+import services.ml.matrix_factorization as matrix_factorization
+from services.ml.matrix_factorization import MatrixFactorizationRecommender, _als_step
+
+FATORES = 4
+REG = 0.1
+
+
+def _avaliacoes(seed: int = 5, n: int = 900, n_usuarios: int = 80, n_itens: int = 40):
+    rng = np.random.default_rng(seed)
+    triplas = {(int(u), int(i)): float(nota) for u, i, nota in
+               zip(rng.integers(1, n_usuarios + 1, n), rng.integers(1, n_itens + 1, n), rng.integers(1, 6, n))}
+    usuarios, itens = (np.array(coluna, dtype=np.int64) for coluna in zip(*triplas))
+    return usuarios, itens, np.array(list(triplas.values()))
+
+
+@pytest.fixture
+def modelo():
+    usuarios, itens, notas = _avaliacoes()
+    return MatrixFactorizationRecommender(FATORES, 5, REG).fit(usuarios, itens, notas), (usuarios, itens, notas)
+
+
+def _minimos_quadrados(modelo: MatrixFactorizationRecommender, itens: np.ndarray, notas: np.ndarray) -> np.ndarray:
+    """
+    [p_u, b_u] de um usuário por mínimos quadrados regularizados com os itens fixos ([q_i, 1], c_i):
+        (Q^T Q + reg * max(n, 1) I) x = Q^T (nota - média - c)
+    """
+    f = FATORES
+    cols = np.searchsorted(modelo.item_ids, itens)
+    emb = modelo.item_factors.astype(np.float64)
+    q = emb[cols, :f + 1]
+    alvo = notas - modelo.global_mean - emb[cols, f + 1]
+    a = q.T @ q + REG * max(len(notas), 1) * np.eye(f + 1)
+    return np.linalg.solve(a, q.T @ alvo)
+
+
+def test_fold_in_igual_aos_minimos_quadrados_por_usuario(modelo):
+    modelo, (usuarios, itens, notas) = modelo
+    rng = np.random.default_rng(1)
+    # Notas novas (e alteradas) de alguns usuários, um deles novo
+    novos = [(3, 7, 5.0), (3, 11, 1.0), (15, 2, 4.0), (200, 5, 3.0), (200, 9, 5.0)]
+    for u, i, nota in novos:
+        existente = (usuarios == u) & (itens == i)
+        if existente.any():
+            notas[existente] = nota
+        else:
+            usuarios, itens, notas = np.append(usuarios, u), np.append(itens, i), np.append(notas, nota)
+    atualizados = np.array([3, 15, 200, int(rng.choice(modelo.user_ids))])
+
+    novo = modelo.fold_in(usuarios, itens, notas, atualizados)
+
+    for u in atualizados:
+        minhas = usuarios == u
+        esperado = _minimos_quadrados(modelo, itens[minhas], notas[minhas])
+        fatores = novo.user_factors[novo._user_pos[int(u)]]
+        np.testing.assert_allclose(fatores[:FATORES + 1], esperado, rtol=1e-4, atol=1e-5)
+        assert fatores[FATORES + 1] == 1.0
+        # Itens já avaliados = as notas atuais do usuário
+        pos = novo._user_pos[int(u)]
+        avaliados = novo.item_ids[novo._rated.indices[novo._rated.indptr[pos]:novo._rated.indptr[pos + 1]]]
+        assert sorted(avaliados.tolist()) == sorted(itens[minhas].tolist())
+
+
+def test_fold_in_mantem_os_demais_usuarios_e_os_itens(modelo):
+    modelo, (usuarios, itens, notas) = modelo
+    atualizados = np.array([3, 15])
+    antes = modelo.user_factors.copy()
+    novo = modelo.fold_in(usuarios, itens, notas, atualizados)
+
+    assert np.array_equal(novo.user_ids, modelo.user_ids)
+    assert novo.item_factors is modelo.item_factors
+    assert novo.global_mean == modelo.global_mean
+    outros = ~np.isin(modelo.user_ids, atualizados)
+    assert np.array_equal(novo.user_factors[outros], modelo.user_factors[outros])
+    assert (novo._rated[np.flatnonzero(outros)] != modelo._rated[np.flatnonzero(outros)]).nnz == 0
+    # O modelo original (ainda servindo requisições) não é alterado
+    assert np.array_equal(modelo.user_factors, antes)
+    for u in modelo.user_ids[outros][:10]:
+        candidatos = modelo.item_ids
+        assert novo.recommend_items(int(u), candidatos) == modelo.recommend_items(int(u), candidatos)
+
+
+def test_fold_in_usuario_novo(modelo):
+    modelo, (usuarios, itens, notas) = modelo
+    assert not modelo.has_user(500)
+    # Um item que o modelo não conhece é ignorado até o próximo treino completo
+    usuarios, itens, notas = np.append(usuarios, [500, 500]), np.append(itens, [4, 9999]), np.append(notas, [5.0, 2.0])
+    novo = modelo.fold_in(usuarios, itens, notas, np.array([500]))
+
+    assert novo.has_user(500) and not modelo.has_user(500)
+    assert len(novo.user_ids) == len(modelo.user_ids) + 1
+    esperado = _minimos_quadrados(modelo, np.array([4]), np.array([5.0]))
+    np.testing.assert_allclose(novo.user_factors[novo._user_pos[500], :FATORES + 1], esperado, rtol=1e-4, atol=1e-5)
+    assert 4 not in novo.recommend_items(500, modelo.item_ids, min_score=0.0)
+
+    # Usuário novo sem notas em itens conhecidos: só a média global e o viés dos itens
+    sem_notas = modelo.fold_in(np.array([600]), np.array([9999]), np.array([3.0]), np.array([600]))
+    fatores = sem_notas.user_factors[sem_notas._user_pos[600]]
+    assert np.all(fatores[:FATORES + 1] == 0) and fatores[FATORES + 1] == 1.0
+
+
+def test_als_step_em_blocos_igual_ao_bloco_unico(monkeypatch):
+    rng = np.random.default_rng(2)
+    pesos = sp.random(30, 25, density=0.3, random_state=3, format="csr")
+    pesos.data = rng.uniform(0.2, 1.0, pesos.nnz)
+    alvos = rng.normal(size=pesos.nnz)
+    fixos = rng.normal(size=(25, 4))
+
+    inteiro = _als_step(pesos.indptr, pesos.indices, alvos, pesos.data, fixos, REG)
+    # Blocos de 2 linhas / 2 colunas (d x d = 16 por linha)
+    monkeypatch.setattr(matrix_factorization, "MAX_BLOCK_ELEMENTS", 32)
+    em_blocos = _als_step(pesos.indptr, pesos.indices, alvos, pesos.data, fixos, REG)
+    np.testing.assert_allclose(em_blocos, inteiro, rtol=1e-10, atol=1e-12)
+
+    # Contra as equações normais de cada linha
+    for row in range(30):
+        cols = pesos.indices[pesos.indptr[row]:pesos.indptr[row + 1]]
+        w = pesos.data[pesos.indptr[row]:pesos.indptr[row + 1]]
+        t = alvos[pesos.indptr[row]:pesos.indptr[row + 1]]
+        a = (fixos[cols].T * w) @ fixos[cols] + REG * max(w.sum(), 1.0) * np.eye(4)
+        np.testing.assert_allclose(inteiro[row], np.linalg.solve(a, fixos[cols].T @ (w * t)), rtol=1e-8, atol=1e-10)
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from services.ml.pre_pocessing.processor import build_sparse_matrix, create_user_restaurant_matrix
+from services.ml.recomendador_item_knn import ItemKNNRecommender
+
+
+def _avaliacoes(seed: int = 3, n: int = 1200, inteiras: bool = True):
+    """
+    (usuario, item, nota) sem pares repetidos. Notas contínuas evitam empates de similaridade
+    no corte do top-M (onde a escolha entre itens empatados é arbitrária).
+    """
+    rng = np.random.default_rng(seed)
+    notas = rng.integers(1, 6, n).astype(float) if inteiras else rng.uniform(1, 5, n)
+    triplas = {(int(u), int(i)): float(nota) for u, i, nota in
+               zip(rng.integers(1, 100, n), rng.integers(1, 60, n), notas)}
+    return [(u, i, nota) for (u, i), nota in triplas.items()]
+
+
+def _matriz(avaliacoes):
+    usuarios, itens, notas = (np.array(coluna) for coluna in zip(*avaliacoes))
+    return build_sparse_matrix(usuarios, itens, notas)
+
+
+def _similaridade_densa(notas: np.ndarray, top_m: int) -> np.ndarray:
+    """
+    Cosseno item x item denso, sem o próprio item, mantendo por linha só os top_m maiores positivos.
+    """
+    normas = np.linalg.norm(notas, axis=0)
+    normalizadas = notas / np.where(normas > 0, normas, 1.0)
+    sims = normalizadas.T @ normalizadas
+    np.fill_diagonal(sims, -np.inf)
+    densa = np.zeros_like(sims)
+    for j in range(sims.shape[0]):
+        top = np.argsort(-sims[j], kind="stable")[:top_m]
+        top = top[sims[j, top] > 0]
+        densa[j, top] = sims[j, top]
+    return densa
+
+
+def _previsoes(notas: np.ndarray, similaridade: np.ndarray, u: int) -> dict[int, float]:
+    """
+    previsto(u, j) = sum_i S[j, i] r(u, i) / sum_i S[j, i] (i avaliados por u), só para j não avaliados.
+    """
+    avaliados = notas[u] != 0
+    pesos = similaridade[:, avaliados].sum(axis=1)
+    somas = similaridade[:, avaliados] @ notas[u, avaliados]
+    return {j: somas[j] / pesos[j] for j in range(notas.shape[1]) if pesos[j] > 0 and not avaliados[j]}
+
+
+def _confere(recommender: ItemKNNRecommender, notas: np.ndarray, similaridade: np.ndarray, min_score: float):
+    usuarios = [int(u) for u in recommender.user_ids]
+    lote = recommender.recommend_items_batch(usuarios, min_score=min_score)
+    for u, usuario in enumerate(usuarios):
+        previsto = {int(recommender.item_ids[j]): p for j, p in _previsoes(notas, similaridade, u).items()}
+        # Itens na fronteira de min_score podem cair para qualquer lado pelo arredondamento em float32
+        assert set(lote[usuario]) >= {item for item, p in previsto.items() if p >= min_score + 1e-5}
+        assert set(lote[usuario]) <= {item for item, p in previsto.items() if p >= min_score - 1e-5}
+        ordenados = [previsto[item] for item in lote[usuario]]
+        assert all(a >= b - 1e-5 for a, b in zip(ordenados, ordenados[1:]))
+
+
+@pytest.mark.parametrize("min_score", [0.0, 3.0])
+def test_item_knn_sem_corte_igual_a_referencia_densa(min_score):
+    # top_m >= número de itens: S é o cosseno completo (positivo), sem depender de desempates
+    matriz = _matriz(_avaliacoes())
+    recommender = ItemKNNRecommender(top_m=1000).fit(matriz)
+    notas = matriz.matrix.toarray()
+    similaridade = _similaridade_densa(notas, 1000)
+
+    np.testing.assert_allclose(recommender.similarity.toarray(), similaridade, atol=1e-6)
+    _confere(recommender, notas, similaridade, min_score)
+
+
+@pytest.mark.parametrize("top_m", [1, 5, 20])
+def test_item_knn_top_m_igual_a_referencia_densa(top_m):
+    matriz = _matriz(_avaliacoes(inteiras=False))
+    recommender = ItemKNNRecommender(top_m=top_m).fit(matriz)
+    notas = matriz.matrix.toarray()
+    similaridade = _similaridade_densa(notas, top_m)
+
+    assert (np.diff(recommender.similarity.indptr) <= top_m).all()
+    np.testing.assert_allclose(recommender.similarity.toarray(), similaridade, atol=1e-6)
+    _confere(recommender, notas, similaridade, 3.0)
+
+
+def test_item_knn_do_dataframe_igual_ao_da_matriz_esparsa():
+    avaliacoes = _avaliacoes()
+    matriz = _matriz(avaliacoes)
+    densa = create_user_restaurant_matrix([
+        {"id_usuario": u, "id_restaurante": i, "nota": nota} for u, i, nota in avaliacoes
+    ])
+    do_dataframe = ItemKNNRecommender(top_m=10).fit(densa)
+    da_esparsa = ItemKNNRecommender(top_m=10).fit(matriz)
+
+    assert (do_dataframe.similarity != da_esparsa.similarity).nnz == 0
+    usuarios = [int(u) for u in matriz.user_ids]
+    assert do_dataframe.recommend_items_batch(usuarios) == da_esparsa.recommend_items_batch(usuarios)
+
+
+def test_item_knn_cold_start():
+    recommender = ItemKNNRecommender(top_m=10).fit(_matriz(_avaliacoes()))
+    assert not recommender.has_user(10_000)
+    assert recommender.recommend_items(10_000) == []
+    assert recommender.recommend_items_batch([10_000]) == {}
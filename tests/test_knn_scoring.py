@@ -0,0 +1,99 @@
+from collections import defaultdict
+import numpy as np
+import pytest
+from sqlmodel import select
+from models.db_models import UsuarioAvalia, RefeicaoAvalia
+from services.ml.pre_pocessing.processor import build_sparse_matrix
+from services.ml.recomendador_knn import KNNRecommender
+from services.ml.knn_service import get_restaurant_recommendations, get_meal_recommendations
+from services.indice_restricoes import indice_restricoes
+from services.ml.model_registry import model_registry
+
+
+def _medias_dos_vizinhos(avaliacoes, vizinhos: dict[int, float], weighted: bool) -> dict[int, float]:
+    """
+    Laço por usuário do knn_service original: média (ou média ponderada pela similaridade)
+    das notas que os vizinhos deram a cada item.
+    """
+    somas, pesos = defaultdict(float), defaultdict(float)
+    for usuario, item, nota in avaliacoes:
+        if usuario in vizinhos:
+            peso = vizinhos[usuario] if weighted else 1.0
+            somas[item] += peso * nota
+            pesos[item] += peso
+    return {item: somas[item] / pesos[item] for item in somas if pesos[item] > 0}
+
+
+def _referencia(recommender: KNNRecommender, avaliacoes, usuario: int, min_score: float, weighted: bool):
+    linhas, sims = recommender.get_neighbor_rows(usuario)
+    vizinhos = {int(recommender.user_ids[linha]): float(sim) for linha, sim in zip(linhas, sims)}
+    medias = _medias_dos_vizinhos(avaliacoes, vizinhos, weighted)
+    avaliados = {item for u, item, _ in avaliacoes if u == usuario}
+    return {item: media for item, media in medias.items() if media >= min_score and item not in avaliados}
+
+
+@pytest.fixture
+def dados():
+    rng = np.random.default_rng(7)
+    triplas = {(int(u), int(i)): int(n) for u, i, n in
+               zip(rng.integers(1, 120, 1500), rng.integers(1, 70, 1500), rng.integers(1, 6, 1500))}
+    avaliacoes = [(u, i, n) for (u, i), n in triplas.items()]
+    usuarios, itens, notas = (np.array(coluna) for coluna in zip(*avaliacoes))
+    recommender = KNNRecommender(k_neighbors=10, index_backend="blocked")
+    recommender.fit(build_sparse_matrix(usuarios, itens, notas))
+    return recommender, avaliacoes
+
+
+@pytest.mark.parametrize("min_score", [0.0, 3.0, 4.5])
+def test_scoring_vetorizado_igual_ao_laco_por_usuario(dados, min_score):
+    recommender, avaliacoes = dados
+    usuarios = [int(u) for u in recommender.user_ids]
+    lote = recommender.recommend_items_batch(usuarios, min_score=min_score)
+    for usuario in usuarios:
+        esperado = _referencia(recommender, avaliacoes, usuario, min_score, weighted=False)
+        # Média decrescente, empate pelo menor id do item
+        assert lote[usuario] == sorted(esperado, key=lambda item: (-esperado[item], item))
+        assert recommender.recommend_items(usuario, min_score=min_score) == lote[usuario]
+
+
+def test_scoring_ponderado_igual_ao_laco_por_usuario(dados):
+    recommender, avaliacoes = dados
+    usuarios = [int(u) for u in recommender.user_ids]
+    lote = recommender.recommend_items_batch(usuarios, min_score=3.0, weighted=True)
+    for usuario in usuarios:
+        esperado = _referencia(recommender, avaliacoes, usuario, 3.0, weighted=True)
+        assert set(lote[usuario]) == set(esperado)
+        medias = [esperado[item] for item in lote[usuario]]
+        assert all(a >= b - 1e-9 for a, b in zip(medias, medias[1:]))
+
+
+def test_lote_ignora_cold_start_e_repetidos(dados):
+    recommender, _ = dados
+    usuario = int(recommender.user_ids[0])
+    lote = recommender.recommend_items_batch([usuario, 10_000, usuario])
+
+    assert list(lote) == [usuario]
+
+
+@pytest.mark.parametrize("servico, tabela, item_col", [
+    (get_restaurant_recommendations, UsuarioAvalia, "id_restaurante"),
+    (get_meal_recommendations, RefeicaoAvalia, "id_refeicao"),
+])
+def test_servico_igual_ao_laco_sobre_o_banco(session, servico, tabela, item_col):
+    """
+    Serviço completo (modelo do registro + scoring vetorizado + filtro de restrições) contra o
+    laço original sobre as linhas do banco, com os mesmos vizinhos.
+    """
+    avaliacoes = [(a.id_usuario, getattr(a, item_col), a.nota) for a in session.exec(select(tabela)).all()]
+    dominio = "restaurantes" if tabela is UsuarioAvalia else "refeicoes"
+    for usuario in range(1, 61):
+        resultado = servico(session, usuario)
+        recommender = model_registry.get(dominio).recommender
+        if not recommender.has_user(usuario):
+            assert "message" in resultado
+            continue
+        esperado = _referencia(recommender, avaliacoes, usuario, 3.0, weighted=False)
+        ranking = sorted(esperado, key=lambda item: (-esperado[item], item))
+        if dominio == "refeicoes":
+            ranking = indice_restricoes.get(session).remove_proibidas(usuario, ranking)
+        assert resultado == ranking
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from services.ml.neighbor_index import LSHIndex, BlockedCosineIndex, measure_recall, recall_at_k, make_index
+
+
+def _agrupados(n_usuarios=2000, n_itens=500, n_grupos=40, tam_gosto=16, itens_por_usuario=15, seed=0) -> sp.csr_matrix:
+    """
+    Avaliações agrupadas: cada usuário avalia sobretudo itens do "gosto" do seu grupo,
+    como na base real (vizinhos próximos existem e são poucos em relação ao total).
+    """
+    rng = np.random.default_rng(seed)
+    gostos = [rng.choice(n_itens, tam_gosto, replace=False) for _ in range(n_grupos)]
+    linhas, colunas, notas = [], [], []
+    for u in range(n_usuarios):
+        gosto = gostos[u % n_grupos]
+        itens = np.unique(np.concatenate([
+            rng.choice(gosto, itens_por_usuario - 3, replace=False),
+            rng.choice(n_itens, 3, replace=False)
+        ]))
+        linhas += [u] * len(itens)
+        colunas += itens.tolist()
+        notas += rng.integers(1, 6, size=len(itens)).tolist()
+    return sp.csr_matrix((np.array(notas, dtype=np.float64), (linhas, colunas)), shape=(n_usuarios, n_itens))
+
+
+def test_recall_at_k():
+    exato = np.array([[1, 2, 3, 4], [5, 6, -1, -1], [-1, -1, -1, -1]])
+    assert recall_at_k(exato, exato) == 1.0
+    aproximado = np.array([[1, 2, 9, 8], [6, 7, -1, -1], [1, 2, 3, 4]])
+    # (2/4 + 1/2) / 2: a linha sem vizinhos exatos não conta
+    assert recall_at_k(aproximado, exato) == pytest.approx(0.5)
+    assert recall_at_k(np.empty((0, 3)), np.empty((0, 3))) == 1.0
+
+
+def test_lsh_recall_acima_do_limite():
+    # Configuração padrão (KNN_LSH_*): recall@10 de ao menos 0.9 contra a busca exata
+    features = _agrupados()
+    assert measure_recall(LSHIndex().fit(features), features, k=10, sample_size=300) >= 0.9
+
+
+def test_lsh_multiprobe_aumenta_o_recall():
+    features = _agrupados()
+    com = measure_recall(LSHIndex(multiprobe=True).fit(features), features, k=10, sample_size=300)
+    sem = measure_recall(LSHIndex(multiprobe=False).fit(features), features, k=10, sample_size=300)
+    assert com > sem
+
+
+def test_lsh_candidatos_sao_uma_fracao_dos_usuarios():
+    features = _agrupados()
+    indice = LSHIndex().fit(features)
+    media = np.mean([len(indice.candidates(row)) for row in range(0, features.shape[0], 50)])
+    assert media < 0.5 * features.shape[0]
+
+
+def test_lsh_similaridades_sao_o_cosseno_exato():
+    """
+    Os vizinhos devolvidos vêm re-ranqueados pelo cosseno exato: similaridades em ordem
+    decrescente e iguais às da busca exata para os mesmos pares.
+    """
+    features = _agrupados(n_usuarios=500)
+    rows = np.arange(0, 500, 7)
+    vizinhos, sims = LSHIndex().fit(features).query(rows, 10)
+    normalizados = features.multiply(1 / np.sqrt(features.multiply(features).sum(axis=1))).tocsr()
+    for i, row in enumerate(rows):
+        validos = vizinhos[i] >= 0
+        esperado = (normalizados[vizinhos[i][validos]] @ normalizados[row].T).toarray().ravel()
+        np.testing.assert_allclose(sims[i][validos], esperado, rtol=1e-5, atol=1e-6)
+        assert np.all(np.diff(sims[i][validos]) <= 1e-7)
+        assert row not in vizinhos[i]
+
+
+def test_lsh_com_poucos_usuarios_completa_com_busca_exata():
+    features = _agrupados(n_usuarios=30, n_grupos=3)
+    rows = np.arange(30)
+    exato, _ = BlockedCosineIndex(dtype=np.float64).fit(features).query(rows, 29)
+    aproximado, _ = LSHIndex(n_tables=1, n_bits=20).fit(features).query(rows, 29)
+    assert recall_at_k(aproximado, exato) == 1.0
+
+
+def test_make_index():
+    assert isinstance(make_index("LSH"), LSHIndex)
+    with pytest.raises(ValueError):
+        make_index("faiss")
+    with pytest.raises(ValueError):
+        LSHIndex(n_bits=63)
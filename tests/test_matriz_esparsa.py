@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from sqlmodel import select
+from models.db_models import UsuarioAvalia, RefeicaoAvalia
+from services.ml.pre_pocessing.processor import (
+    build_sparse_matrix, load_columns, create_user_restaurant_matrix, create_user_meal_matrix, RATING_DTYPES
+)
+
+
+@pytest.mark.parametrize("tabela, item_col, pivot", [
+    (UsuarioAvalia, "id_restaurante", create_user_restaurant_matrix),
+    (RefeicaoAvalia, "id_refeicao", create_user_meal_matrix),
+])
+def test_matriz_esparsa_igual_ao_pivot(session, tabela, item_col, pivot):
+    """
+    A CSR montada das colunas lidas do banco é a mesma matriz do pivot_table (ids, ordem e notas).
+    """
+    usuarios, itens, notas = load_columns(
+        session, select(tabela.id_usuario, getattr(tabela, item_col), tabela.nota), RATING_DTYPES
+    )
+    esparsa = build_sparse_matrix(usuarios, itens, notas)
+    avaliacoes = session.exec(select(tabela)).all()
+    densa = pivot([{"id_usuario": a.id_usuario, item_col: getattr(a, item_col), "nota": a.nota} for a in avaliacoes])
+
+    assert np.array_equal(esparsa.user_ids, densa.index.to_numpy())
+    assert np.array_equal(esparsa.item_ids, densa.columns.to_numpy())
+    assert np.array_equal(esparsa.matrix.toarray(), densa.to_numpy())
+
+
+def test_pares_duplicados_viram_a_media_como_no_pivot():
+    rng = np.random.default_rng(0)
+    usuarios = rng.integers(1, 30, 500)
+    itens = rng.integers(1, 40, 500)
+    notas = rng.integers(1, 6, 500)
+    esparsa = build_sparse_matrix(usuarios, itens, notas)
+    densa = create_user_restaurant_matrix([
+        {"id_usuario": int(u), "id_restaurante": int(i), "nota": int(n)} for u, i, n in zip(usuarios, itens, notas)
+    ])
+
+    assert np.array_equal(esparsa.user_ids, densa.index.to_numpy())
+    assert np.array_equal(esparsa.item_ids, densa.columns.to_numpy())
+    assert np.allclose(esparsa.matrix.toarray(), densa.to_numpy())
+
+
+def test_load_columns_cresce_alem_do_size_hint(session):
+    """
+    Com size_hint menor que a tabela e blocos pequenos, os arrays crescem e nenhuma linha se perde.
+    """
+    stmt = select(UsuarioAvalia.id_usuario, UsuarioAvalia.id_restaurante, UsuarioAvalia.nota)
+    usuarios, itens, notas = load_columns(session, stmt, RATING_DTYPES, size_hint=3, chunk_size=7)
+    linhas = session.exec(stmt).all()
+
+    assert sorted(zip(usuarios.tolist(), itens.tolist(), notas.tolist())) == sorted(map(tuple, linhas))
+    assert notas.dtype == np.int8
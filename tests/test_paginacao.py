@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from services.paginacao import top_indices, primeiros_por_grupo
+from services.recomendador import rankeia_por_score_com_total, rankeia_restaurante_composto_com_total
+from services.recomendador_sql import rankeia_por_score_sql_com_total, rankeia_restaurante_composto_sql_com_total
+
+PAGINAS = [(None, 0), (5, 0), (5, 3), (1, 0), (0, 0), (10, 95), (10, 100), (10, 250), (None, 40)]
+USUARIOS = [1, 2, 7, 10, 33]  # o 10 não tem avaliações
+
+
+@pytest.mark.parametrize("limit,offset", PAGINAS)
+def test_top_indices_igual_ao_argsort_estavel(limit, offset):
+    rng = np.random.default_rng(0)
+    # Scores inteiros para forçar empates: desempate pela posição, como no argsort estável
+    for scores in (rng.integers(0, 5, size=100).astype(float), rng.random(100), np.zeros(100)):
+        ordem = np.argsort(-scores, kind="stable")
+        fim = None if limit is None else offset + limit
+        assert top_indices(scores, limit, offset).tolist() == ordem[offset:fim].tolist()
+
+
+def test_top_indices_vetor_vazio():
+    assert top_indices(np.array([]), 5, 0).tolist() == []
+
+
+def test_primeiros_por_grupo():
+    grupos = np.array([3, 1, 3, 3, 2, 1, 3, 2])
+    for n in (0, 1, 2, 3, 10):
+        vistos = {}
+        esperado = []
+        for g in grupos.tolist():
+            vistos[g] = vistos.get(g, 0) + 1
+            esperado.append(vistos[g] <= n)
+        assert primeiros_por_grupo(grupos, n).tolist() == esperado
+    assert primeiros_por_grupo(grupos, None).all()
+
+
+@pytest.mark.parametrize("rankeia", [rankeia_por_score_com_total, rankeia_por_score_sql_com_total])
+def test_paginas_do_score_sao_fatias_do_ranking(session, rankeia):
+    for id_usuario in USUARIOS:
+        completo, total = rankeia(session, id_usuario)
+        assert total == len(completo)
+        for limit, offset in PAGINAS:
+            pagina, total_pagina = rankeia(session, id_usuario, limit=limit, offset=offset)
+            fim = None if limit is None else offset + limit
+            assert total_pagina == total
+            assert pagina == completo[offset:fim]
+
+
+@pytest.mark.parametrize("rankeia", [rankeia_restaurante_composto_com_total, rankeia_restaurante_composto_sql_com_total])
+def test_paginas_do_composto_sao_fatias_do_ranking(session, rankeia):
+    for id_usuario in USUARIOS:
+        completo, total = rankeia(session, id_usuario)
+        assert total == len(completo)
+        for limit, offset in [(3, 0), (3, 2), (5, 10), (5, 12), (None, 4)]:
+            pagina, total_pagina = rankeia(session, id_usuario, limit=limit, offset=offset)
+            fim = None if limit is None else offset + limit
+            assert total_pagina == total
+            assert pagina == completo[offset:fim]
+
+
+def test_score_memoria_igual_ao_sql(session):
+    for id_usuario in USUARIOS:
+        memoria, total_memoria = rankeia_por_score_com_total(session, id_usuario, limit=10, offset=5)
+        sql, total_sql = rankeia_por_score_sql_com_total(session, id_usuario, limit=10, offset=5)
+        assert total_memoria == total_sql
+        assert [r["id_refeicao"] for r in memoria] == [r["id_refeicao"] for r in sql]
+        assert [r["score"] for r in memoria] == pytest.approx([r["score"] for r in sql])
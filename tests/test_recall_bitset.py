@@ -0,0 +1,57 @@
+from sqlmodel import Session, select, col
+from models.db_models import UsuarioRestricao, IngredienteRestricao, RefeicaoIngrediente, Refeicao
+from services.recomendador import recall_por_restricao, recall_por_restricao_lote
+from services.recomendador_sql import recall_por_restricao_sql
+from services.indice_restricoes import indice_restricoes
+
+USUARIOS = range(1, 62)  # inclui um id sem cadastro
+
+
+def _recall_consultas(session: Session, id_usuario: int) -> list[int]:
+    """
+    Recall original: restrições do usuário -> ingredientes proibidos -> refeições proibidas
+    -> refeições disponíveis fora dessa lista, uma consulta por passo.
+    """
+    ids_restricoes = session.exec(
+        select(UsuarioRestricao.id_restricao).where(UsuarioRestricao.id_usuario == id_usuario)
+    ).all()
+    proibidas = []
+    if ids_restricoes:
+        ingredientes = session.exec(
+            select(IngredienteRestricao.id_ingrediente).where(col(IngredienteRestricao.id_restricao).in_(ids_restricoes))
+        ).all()
+        if ingredientes:
+            proibidas = session.exec(
+                select(RefeicaoIngrediente.id_refeicao).where(col(RefeicaoIngrediente.id_ingrediente).in_(ingredientes))
+            ).unique().all()
+    stmt = select(Refeicao.id_refeicao).where(Refeicao.disponivel == True)
+    if proibidas:
+        stmt = stmt.where(col(Refeicao.id_refeicao).not_in(proibidas))
+    return sorted(session.exec(stmt).all())
+
+
+def test_recall_bitset_igual_as_consultas_e_ao_modo_sql(session):
+    for id_usuario in USUARIOS:
+        esperado = _recall_consultas(session, id_usuario)
+        assert recall_por_restricao(session, id_usuario) == esperado
+        assert recall_por_restricao_sql(session, id_usuario) == esperado
+
+
+def test_recall_em_lote_igual_ao_individual(session):
+    lote = recall_por_restricao_lote(session, list(USUARIOS))
+    assert lote == {id_usuario: recall_por_restricao(session, id_usuario) for id_usuario in USUARIOS}
+
+
+def test_remove_proibidas_mantem_a_ordem(session):
+    """
+    Sobre uma lista fora de ordem, remove_proibidas mantém a ordem e, entre as disponíveis,
+    deixa exatamente as do recall.
+    """
+    indice = indice_restricoes.get(session)
+    disponiveis = set(session.exec(select(Refeicao.id_refeicao).where(Refeicao.disponivel == True)).all())
+    todas = list(range(80, 0, -1))
+    for id_usuario in USUARIOS:
+        seguras = set(_recall_consultas(session, id_usuario))
+        resultado = indice.remove_proibidas(id_usuario, todas)
+        assert resultado == [m for m in todas if m in set(resultado)]
+        assert [m for m in resultado if m in disponiveis] == [m for m in todas if m in seguras]
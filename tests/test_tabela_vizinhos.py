@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+from services.ml.neighbor_table import compute_neighbor_table, NeighborTable
+from services.ml.neighbor_index import BlockedCosineIndex, BruteForceIndex
+from services.ml.pre_pocessing.processor import build_sparse_matrix
+from services.ml.recomendador_knn import KNNRecommender
+
+K = 8
+
+
+def _notas_aleatorias(seed: int, n_usuarios: int = 150, n_itens: int = 60) -> sp.csr_matrix:
+    # Notas contínuas: sem empates de similaridade, a ordem dos vizinhos é única
+    matriz = sp.random(n_usuarios, n_itens, density=0.15, random_state=seed, format="csr")
+    matriz.data = 1 + 4 * matriz.data
+    return matriz
+
+
+def _sklearn_brute(features, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Referência: NearestNeighbors(cosine, brute) com k+1 vizinhos, descartando o próprio usuário.
+    """
+    distancias, indices = NearestNeighbors(metric="cosine", algorithm="brute").fit(features).kneighbors(
+        features, n_neighbors=k + 1
+    )
+    vizinhos = np.array([linha[linha != u][:k] for u, linha in enumerate(indices)])
+    sims = np.array([1 - d[i != u][:k] for u, (i, d) in enumerate(zip(indices, distancias))])
+    return vizinhos, sims
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_tabela_de_vizinhos_igual_ao_sklearn(seed, dtype):
+    features = _notas_aleatorias(seed)
+    vizinhos, sims = _sklearn_brute(features, K)
+    # Blocos pequenos para exercitar a multiplicação em várias partes
+    tabela = compute_neighbor_table(features, np.arange(features.shape[0]), K, max_block_elements=1000, dtype=dtype)
+
+    assert np.array_equal(tabela.neighbors, vizinhos)
+    assert np.allclose(tabela.similarities, sims, atol=1e-5)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_backends_exatos_iguais_ao_sklearn(seed):
+    features = _notas_aleatorias(seed)
+    vizinhos, sims = _sklearn_brute(features, K)
+    linhas = np.arange(features.shape[0])
+    for indice in (BlockedCosineIndex(max_block_elements=500), BruteForceIndex()):
+        obtidos, obtidas = indice.fit(features).query(linhas, K)
+        assert np.array_equal(obtidos, vizinhos)
+        assert np.allclose(obtidas, sims, atol=1e-5)
+
+
+def test_menos_usuarios_que_k_completa_com_menos_um():
+    features = _notas_aleatorias(0, n_usuarios=4)
+    tabela = compute_neighbor_table(features, np.arange(4), K)
+
+    assert (tabela.neighbors[:, :3] >= 0).all()
+    assert (tabela.neighbors[:, 3:] == -1).all()
+    assert (tabela.similarities[:, 3:] == 0).all()
+
+
+def test_recomendador_com_tabela_igual_a_consulta_direta():
+    """
+    get_neighbor_rows pela tabela pré-calculada devolve o mesmo que a consulta ao índice.
+    """
+    rng = np.random.default_rng(3)
+    matriz = build_sparse_matrix(rng.integers(1, 80, 600), rng.integers(1, 50, 600), rng.integers(1, 6, 600))
+    sem_tabela = KNNRecommender(k_neighbors=K, index_backend="blocked")
+    sem_tabela.fit(matriz)
+    com_tabela = KNNRecommender(k_neighbors=K, index_backend="blocked")
+    com_tabela.fit(matriz)
+    com_tabela.precompute_neighbors()
+
+    for usuario in matriz.user_ids:
+        linhas, sims = com_tabela.get_neighbor_rows(int(usuario))
+        esperadas, esperados = sem_tabela.get_neighbor_rows(int(usuario))
+        assert np.array_equal(linhas, esperadas)
+        assert np.allclose(sims, esperados)
+
+
+def test_remap_leva_linhas_e_vizinhos_para_as_novas_posicoes():
+    tabela = NeighborTable(np.array([10, 20, 30]), np.array([[1, 2], [0, -1], [0, 1]], dtype=np.int32),
+                           np.array([[0.9, 0.5], [0.9, 0], [0.5, 0.4]], dtype=np.float32))
+    nova = tabela.remap(np.array([5, 10, 20, 25, 30]))
+
+    assert nova.neighbors.tolist() == [[-1, -1], [2, 4], [1, -1], [-1, -1], [1, 2]]
+    assert np.allclose(nova.similarities[[1, 2, 4]], tabela.similarities)